@@ -0,0 +1,61 @@
+'''
+取引所の呼び出しを、1つずつ順に待つ場合（同期の API と同じ）と AsyncAPI で同時に実行する場合で比較する
+リクエストごとに latency 秒かかる LatencyExchange を使い、水平線ごとの指値の発注・ticker と板の取得・注文状態の確認にかかる時間を計測する
+
+usage: python benchmark/async_api.py [horizons]
+'''
+import sys
+import time
+import asyncio
+
+from trade_tools.async_api import AsyncAPI, LatencyExchange
+from trade.main import order_limits_by_horizon_async
+
+
+async def sequential(api, pair, n):
+    # 同期の API と同じく1つずつ待つ
+    ticker = await api.fetch_ticker(pair)
+    await api.fetch_order_book_arrays(pair, limit=1000)
+    orders = []
+    for i in range(n):
+        orders.append(await api.create_order(pair, 'limit', 'buy', 1, ticker['close'] - 10 - i))
+    for order in orders:
+        await api.fetch_order(order['id'], pair)
+
+
+async def concurrent(api, pair, n):
+    ticker, _ = await api.fetch_ticker_and_order_book(pair, limit=1000)
+    orders = await api.create_orders(pair, [('limit', 'buy', 1, ticker['close'] - 10 - i) for i in range(n)])
+    await api.fetch_orders([order['id'] for order in orders], pair)
+
+
+async def measure(fn, n, latency):
+    api = AsyncAPI('bitmex', exchange=LatencyExchange(latency))
+    t = time.perf_counter()
+    await fn(api, 'BTC/USD', n)
+    elapsed = time.perf_counter() - t
+    await api.close()
+    return elapsed, api.exchange.requests
+
+
+async def main(sizes, latency):
+    print('{:>9} {:>16} {:>16} {:>9}'.format('horizons', 'sequential [s]', 'concurrent [s]', 'requests'))
+    for n in sizes:
+        sequential_time, requests = await measure(sequential, n, latency)
+        concurrent_time, _ = await measure(concurrent, n, latency)
+        print('{:>9} {:>16.3f} {:>16.3f} {:>9}'.format(n, sequential_time, concurrent_time, requests))
+
+    # 水平線の指値（板の厚いところ）をまとめて発注する
+    api = AsyncAPI('bitmex', exchange=LatencyExchange(latency))
+    t = time.perf_counter()
+    horizon_and_order = await order_limits_by_horizon_async([3990.0, 3995.0, 4005.0, 4010.0], api, 'BTC/USD',
+                                                            threshold=1000)
+    print('order_limits_by_horizon_async: {} orders in {:.3f} s'.format(len(horizon_and_order),
+                                                                      time.perf_counter() - t))
+    await api.close()
+
+
+if __name__=='__main__':
+    sizes = [int(n) for n in sys.argv[1:]] if len(sys.argv) > 1 else [1, 5, 20]
+    latency = 0.05
+    asyncio.run(main(sizes, latency))
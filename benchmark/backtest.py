@@ -0,0 +1,82 @@
+'''
+イナゴ・水平線の戦略のバックテストを、1秒ごとに進める従来の方法とイベント駆動 (EventQueue) で比較する
+合成した ticker・1分足・板・イナゴのデータで、指定した時間分のバックテストにかかる時間を計測する
+
+usage: python benchmark/backtest.py [hours]
+'''
+import sys
+import time
+import logging
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+from trade_tools.rm import ResourceManager
+from trade_tools.tm import TimeManager
+from trade_tools.my_api import APISim
+from trade_tools.backtest import EventQueue
+from trade.main import run, run_event_backtest
+
+
+def generate_dataset(seconds, start, seed=0):
+    rand = np.random.RandomState(seed)
+    timestamp = (start + np.arange(seconds, dtype=np.int64)) * 1000
+    # 0.5 刻みの価格。ときどき大きく動く
+    price = 4000 + 0.5 * np.cumsum(rand.choice([-2, -1, 0, 0, 0, 1, 2], seconds))
+    ticker = pd.DataFrame({'timestamp': timestamp, 'bid': price - 0.5, 'bid_volume': 1.0, 'ask': price,
+                           'ask_volume': 1.0, 'open': price, 'high': price, 'low': price, 'close': price,
+                           'volume': 1.0})
+
+    # 1分足（timestamp は足の始まり）
+    bucket = np.arange(seconds) // 60
+    df = pd.DataFrame({'bucket': bucket, 'price': price})
+    grouped = df.groupby('bucket')['price']
+    ohlcv_1m = pd.DataFrame({'timestamp': timestamp[::60], 'open': grouped.first().values,
+                             'high': grouped.max().values, 'low': grouped.min().values,
+                             'close': grouped.last().values, 'volume': 1.0})
+
+    bid_columns = {'timestamp': timestamp}
+    ask_columns = {'timestamp': timestamp}
+    for i in range(25):
+        col_idx = '{0:02d}'.format(i)
+        bid_columns['price' + col_idx] = price - 0.5 - 0.5 * i
+        bid_columns['amount' + col_idx] = rand.randint(100, 5000, seconds).astype(np.float64)
+        ask_columns['price' + col_idx] = price + 0.5 * i
+        ask_columns['amount' + col_idx] = rand.randint(100, 5000, seconds).astype(np.float64)
+    bids = pd.DataFrame(bid_columns)
+    asks = pd.DataFrame(ask_columns)
+
+    # イナゴは平均10分に1回
+    n_inago = seconds // 600
+    inago_timestamp = np.sort(rand.choice(timestamp[3600:], n_inago, replace=False))
+    inago = pd.DataFrame({'timestamp': inago_timestamp, 'taker_side': rand.choice(['buy', 'sell'], n_inago)})
+    return ticker, {'1m': ohlcv_1m}, bids, asks, inago
+
+
+def backtest(dataset, start, until, event_driven):
+    ticker, ohlcv_list, bids, asks, inago = dataset
+    tm = TimeManager(float(start))
+    rm = ResourceManager(ticker, ohlcv_list, bids, asks, inago, tm)
+    api = APISim('bitmex', rm)
+    t = time.perf_counter()
+    if event_driven:
+        profits = run_event_backtest(api, 'BTC/USD', '1m', tm, EventQueue(rm), until=until)
+    else:
+        profits = run(api, 'BTC/USD', '1m', tm, True, until=until)
+    return time.perf_counter() - t, profits, api.counter
+
+
+if __name__=='__main__':
+    hours = float(sys.argv[1]) if len(sys.argv) > 1 else 6
+    # ログの出力時間は計測に含めない
+    logging.getLogger('crypto').setLevel(logging.WARNING)
+    data_start = int(datetime(2019, 3, 25).timestamp())
+    seconds = int(hours * 3600) + 2 * 3600
+    dataset = generate_dataset(seconds, data_start)
+    start = data_start + 3600
+    until = start + int(hours * 3600)
+
+    print('{:>14} {:>10} {:>10} {:>8}'.format('mode', 'time [s]', 'profit', 'orders'))
+    for name, event_driven in [('polling', False), ('event-driven', True)]:
+        elapsed, profits, orders = backtest(dataset, start, until, event_driven)
+        print('{:>14} {:>10.2f} {:>10.2f} {:>8}'.format(name, elapsed, profits, orders))
@@ -0,0 +1,64 @@
+'''
+inago の書き込みを、従来の1行ずつ INSERT + commit と BatchWriter（キュー + executemany）で比較する
+commit ごとに fsync の時間 (commit_time 秒) がかかる接続を模したクラスで、n 行を書き込む時間と
+リクエスト側で待つ時間（1行あたり）を計測する
+
+usage: python benchmark/batch_writer.py [rows]
+'''
+import sys
+import time
+
+from common.batch_writer import BatchWriter
+
+
+class SlowConnection:
+    # commit に commit_time 秒かかる MySQL の接続の代わり
+    def __init__(self, commit_time=0.002):
+        self.commit_time = commit_time
+        self.rows = 0
+
+    def cursor(self):
+        return self
+
+    def execute(self, query, row):
+        self.rows += 1
+
+    def executemany(self, query, rows):
+        self.rows += len(rows)
+
+    def commit(self):
+        time.sleep(self.commit_time)
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+if __name__=='__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    row = ['BitMEX_XBTUSD', 'buy', 100.0, 4000.0, 'XBTUSD', 0, 0, '2019-03-25 00:00:00', '2019-03-25 00:00:00', 0]
+
+    conn = SlowConnection()
+    t = time.perf_counter()
+    for _ in range(n):
+        cur = conn.cursor()
+        cur.execute('INSERT', row)
+        conn.commit()
+    legacy_time = time.perf_counter() - t
+
+    conn = SlowConnection()
+    writer = BatchWriter(lambda: conn, 'INSERT')
+    t = time.perf_counter()
+    for _ in range(n):
+        writer.put(row)
+    put_time = time.perf_counter() - t
+    writer.close()
+    batch_time = time.perf_counter() - t
+    assert conn.rows == n
+    metrics = writer.metrics()
+
+    print('{:>8} {:>10} {:>16} {:>8}'.format('', 'total [s]', 'request [us/row]', 'commits'))
+    print('{:>8} {:>10.3f} {:>16.1f} {:>8}'.format('legacy', legacy_time, legacy_time / n * 1e6, n))
+    print('{:>8} {:>10.3f} {:>16.1f} {:>8}'.format('batch', batch_time, put_time / n * 1e6, metrics['commits']))
@@ -0,0 +1,69 @@
+'''
+バックテスト用のデータの読み込み時間を、CSV + ResourceManager と ResourceManager.from_bundle で比較する
+合成した1日分のデータを一時ディレクトリに CSV で保存し、collect/pack_dataset.py と同じ手順でまとめる
+両方の ResourceManager で同じバックテストを実行し、結果が一致することも確認する
+
+usage: python benchmark/dataset.py [hours]
+'''
+import os
+import sys
+import time
+import logging
+import tempfile
+import numpy as np
+from datetime import datetime
+
+from trade_tools.rm import ResourceManager
+from trade_tools.tm import TimeManager
+from trade_tools.my_api import APISim
+from trade_tools.backtest import EventQueue
+from trade.main import load_dataset, run_event_backtest
+from collect.pack_dataset import pack_dataset
+from benchmark.backtest import generate_dataset
+
+
+def backtest(rm, tm, until):
+    api = APISim('bitmex', rm)
+    return run_event_backtest(api, 'BTC/USD', '1m', tm, EventQueue(rm), until=until), len(api.orders)
+
+
+if __name__=='__main__':
+    hours = float(sys.argv[1]) if len(sys.argv) > 1 else 24
+    logging.getLogger('crypto').setLevel(logging.WARNING)
+    data_start = int(datetime(2019, 3, 25).timestamp())
+    ticker, ohlcv_list, bids, asks, inago = generate_dataset(int(hours * 3600), data_start)
+
+    with tempfile.TemporaryDirectory() as dirpath:
+        ticker.to_csv(os.path.join(dirpath, 'ticker.csv'), index=False)
+        ohlcv_list['1m'].to_csv(os.path.join(dirpath, 'ohlcv_1m.csv'), index=False)
+        bids.to_csv(os.path.join(dirpath, 'bids.csv'), index=False)
+        asks.to_csv(os.path.join(dirpath, 'asks.csv'), index=False)
+        inago.to_csv(os.path.join(dirpath, 'inago.csv'), index=False)
+        path = os.path.join(dirpath, 'dataset.bin')
+        pack_dataset(dirpath, path)
+
+        start = data_start + 3600
+        t = time.perf_counter()
+        csv_tm = TimeManager(float(start))
+        csv_rm = ResourceManager(*load_dataset(dirpath), csv_tm)
+        csv_time = time.perf_counter() - t
+
+        t = time.perf_counter()
+        bundle_tm = TimeManager(float(start))
+        bundle_rm = ResourceManager.from_bundle(path, bundle_tm)
+        bundle_time = time.perf_counter() - t
+
+        # 同じ時刻のデータが一致すること
+        for now in start + np.random.RandomState(0).randint(0, int(hours * 3600) - 3600, 200):
+            csv_tm.now = bundle_tm.now = float(now)
+            assert csv_rm.fetch_ticker() == bundle_rm.fetch_ticker()
+            assert csv_rm.fetch_ohlcv('1m', (now - 3600) * 1000) == bundle_rm.fetch_ohlcv('1m', (now - 3600) * 1000)
+            for x, y in zip(csv_rm.fetch_order_book_arrays(), bundle_rm.fetch_order_book_arrays()):
+                np.testing.assert_array_equal(x, y)
+        csv_tm.now = bundle_tm.now = float(start)
+        until = data_start + int(hours * 3600) - 600
+        assert backtest(csv_rm, csv_tm, until) == backtest(bundle_rm, bundle_tm, until)
+
+        print('rows: {}, bundle size: {:.1f} MB'.format(len(ticker), os.path.getsize(path) / 1e6))
+        print('csv:    {:.3f} sec'.format(csv_time))
+        print('bundle: {:.3f} sec ({:.0f}x)'.format(bundle_time, csv_time / bundle_time))
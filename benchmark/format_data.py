@@ -0,0 +1,76 @@
+'''
+1日分の約定履歴から ticker と OHLCV（1s, 1m, 5m, 1h）を作成する時間を、従来の実装と比較する
+
+usage: python benchmark/format_data.py [trades_per_day]
+'''
+import sys
+import time
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+from collect.format_data import generate_ticker_and_ohlcvs
+
+
+def legacy_generate_ticker(executions):
+    executions.index = pd.to_datetime(executions.timestamp.apply(lambda x: datetime.fromtimestamp(x / 1000)))
+    executions = executions.resample('S').last()
+    bids = executions.loc[executions.side == 'Sell'].resample('S').ffill()
+    bids = bids.drop(['timestamp', 'side'], axis=1)
+    asks = executions.loc[executions.side == 'Buy'].resample('S').ffill()
+    asks = asks.drop(['timestamp', 'side'], axis=1)
+    bids_asks = pd.merge(bids, asks, how='inner', left_index=True, right_index=True)
+    bids_asks.columns = ['bid', 'bid_volume', 'ask', 'ask_volume']
+    ohlcv = bids.price.resample('S').ohlc()
+    ohlcv['volume'] = bids.amount.resample('S').sum()
+    ohlcv['timestamp'] = pd.Series(ohlcv.index).apply(lambda x: datetime.timestamp(x) * 1000).values
+    ticker = pd.merge(bids_asks, ohlcv, how='inner', left_index=True, right_index=True)
+    ticker['timestamp'] = pd.Series(ticker.index).apply(lambda x: datetime.timestamp(x) * 1000).values
+    return ticker.loc[:, ['timestamp', 'bid', 'bid_volume', 'ask', 'ask_volume', 'open', 'high', 'low', 'close', 'volume']]
+
+
+def legacy_generate_ohlcv(executions, candle_type):
+    executions.index = pd.to_datetime(executions.timestamp.apply(lambda x: datetime.fromtimestamp(x / 1000)))
+    executions = executions.resample('S').last()
+    bids = executions.loc[executions.side == 'Sell'].resample('S').ffill()
+    freq = {'1s': 'S', '1m': 'T', '5m': '5T', '1h': 'H'}[candle_type]
+    ohlcv = bids.price.resample(freq).ohlc()
+    ohlcv['volume'] = bids.amount.resample(freq).sum()
+    ohlcv['timestamp'] = pd.Series(ohlcv.index).apply(lambda x: datetime.timestamp(x) * 1000).values
+    return ohlcv
+
+
+def generate_executions(n, seed=0):
+    rand = np.random.RandomState(seed)
+    start = int(datetime(2019, 4, 6).timestamp() * 1000)
+    timestamp = np.sort(start + rand.randint(0, 86400 * 1000, n)).astype(np.int64)
+    price = 5000 + 0.5 * np.cumsum(rand.choice([-1, 0, 1], n))
+    return pd.DataFrame({
+        'timestamp': timestamp,
+        'side': rand.choice(['Buy', 'Sell'], n),
+        'price': price,
+        'amount': rand.randint(1, 10000, n),
+    }, columns=['timestamp', 'side', 'price', 'amount'])
+
+
+if __name__=='__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    candle_types = ['1s', '1m', '5m', '1h']
+    executions = generate_executions(n)
+
+    t = time.perf_counter()
+    legacy_ticker = legacy_generate_ticker(executions.copy())
+    legacy_ohlcvs = {candle_type: legacy_generate_ohlcv(executions.copy(), candle_type) for candle_type in candle_types}
+    legacy_time = time.perf_counter() - t
+
+    t = time.perf_counter()
+    ticker, ohlcvs = generate_ticker_and_ohlcvs(executions.copy(), candle_types)
+    new_time = time.perf_counter() - t
+
+    pd.testing.assert_frame_equal(legacy_ticker, ticker, check_freq=False)
+    for candle_type in candle_types:
+        pd.testing.assert_frame_equal(legacy_ohlcvs[candle_type], ohlcvs[candle_type], check_freq=False)
+
+    print('trades: {}'.format(n))
+    print('legacy: {:.3f} sec'.format(legacy_time))
+    print('new:    {:.3f} sec ({:.1f}x)'.format(new_time, legacy_time / new_time))
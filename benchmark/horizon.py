@@ -0,0 +1,108 @@
+'''
+calc_horizon を 60, 1440, 10080 本の1分足で計測し、従来の二重ループの実装と結果が一致することを確認する
+従来の実装は O(n^2) のため、legacy_max 本を超える場合は計測しない
+
+usage: python benchmark/horizon.py [legacy_max]
+'''
+import sys
+import copy
+import time
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+from trade_tools.trade_utils import calc_horizon
+
+
+def legacy_calc_horizon(df, min_whisker_len, threshold_whisker_diff):
+    whisker_len = np.where(df['open'] >= df['close'], df['high'] - df['open'], df['high'] - df['close'])
+    df_long_whisker = df.loc[(whisker_len >= min_whisker_len)]
+
+    horizons = {}
+    for dt1, ohlcv1 in df_long_whisker.iterrows():
+        for dt2, ohlcv2 in df_long_whisker.iterrows():
+            if dt1 == dt2:
+                continue
+            for v1, v2 in [(ohlcv1['high'], ohlcv2['high']), (ohlcv1['high'], ohlcv2['low']),
+                           (ohlcv1['low'], ohlcv2['low']), (ohlcv1['low'], ohlcv2['high'])]:
+                if (float(np.abs(v1 - v2)) <= threshold_whisker_diff):
+                    horizon = np.mean([v1, v2])
+                    if horizon in horizons.keys():
+                        horizons[horizon].append(dt1)
+                        horizons[horizon].append(dt2)
+                    else:
+                        horizons[horizon] = [dt1, dt2]
+
+    horizons_c = copy.copy(horizons)
+    for h, dts in horizons_c.items():
+        horizons[h] = list(set(dts))
+    unuses = []
+    curr_price = df['close'].iloc[-1]
+    for horizon, dts in horizons.items():
+        target = df[df.index > min(dts)]
+        crossed_ohlcv = target.loc[(target['high'] > horizon) & (target['low'] < horizon)]
+        if len(crossed_ohlcv) > 0:
+            unuses.append(horizon)
+        elif np.abs(horizon - curr_price) <= 1:
+            unuses.append(horizon)
+
+    for unuse in unuses:
+        horizons.pop(unuse)
+    return horizons
+
+
+def generate_ohlcv(n, seed=0, flat_rate=0.5, nan_rate=0.03):
+    '''
+    水平線が多く残る1分足を作る（seed が偶数なら上昇、奇数なら下落）
+    足の値幅より大きく動くので過去の高値・安値が抜けずに残り、値動きのない足 (flat_rate) が同じ価格の水平線を重複させる
+    nan_rate の割合の足はデータの欠けとして OHLC を NaN にする
+    '''
+    rand = np.random.RandomState(seed)
+    start = datetime(2019, 3, 25).timestamp()
+    sign = 1 if seed % 2 == 0 else -1
+    close = 4000 + sign * 0.5 * np.cumsum(rand.choice([-2, 0, 0, 2, 3, 4], n))
+    open = np.r_[close[0], close[:-1]]
+    high = np.maximum(open, close) + 0.5 * rand.randint(0, 5, n)
+    low = np.minimum(open, close) - 0.5 * rand.randint(0, 3, n)
+    flat = rand.rand(n) < flat_rate
+    open[flat] = close[flat]
+    high[flat] = close[flat]
+    low[flat] = close[flat]
+    missing = rand.rand(n) < nan_rate
+    # 現在価格（最後の足の終値）は欠けさせない
+    missing[-1] = False
+    open[missing] = np.nan
+    high[missing] = np.nan
+    low[missing] = np.nan
+    close[missing] = np.nan
+    df = pd.DataFrame({'unixtime': start + 60 * np.arange(n), 'open': open, 'high': high, 'low': low,
+                       'close': close, 'volume': 1.0})
+    df.index = df.unixtime.map(lambda x: datetime.fromtimestamp(x))
+    return df
+
+
+def assert_same(expected, actual):
+    assert list(expected.keys()) == list(actual.keys())
+    for horizon, dts in expected.items():
+        assert set(dts) == set(actual[horizon])
+
+
+if __name__=='__main__':
+    legacy_max = int(sys.argv[1]) if len(sys.argv) > 1 else 1440
+    params = [(0, 0), (0, 1), (1, 0.5)]
+    print('{:>7} {:>20} {:>12} {:>12} {:>10}'.format('candles', '(whisker, diff)', 'legacy [s]', 'new [s]', 'horizons'))
+    for n in [60, 1440, 10080]:
+        df = generate_ohlcv(n)
+        for min_whisker_len, threshold_whisker_diff in params:
+            t = time.perf_counter()
+            horizons = calc_horizon(df, min_whisker_len, threshold_whisker_diff)
+            new_time = time.perf_counter() - t
+
+            legacy_time = float('nan')
+            if n <= legacy_max:
+                t = time.perf_counter()
+                expected = legacy_calc_horizon(df, min_whisker_len, threshold_whisker_diff)
+                legacy_time = time.perf_counter() - t
+                assert_same(expected, horizons)
+            print('{:>7} {:>20} {:>12.3f} {:>12.3f} {:>10}'.format(
+                n, str((min_whisker_len, threshold_whisker_diff)), legacy_time, new_time, len(horizons)))
@@ -0,0 +1,51 @@
+'''
+現在価格に最も近い水平線の検索を、従来の線形探索 (get_horizon_closest_to_price) と HorizonIndex で比較する
+水平線の数を変えて1回あたりの検索時間と、差分更新 (sync) の時間を計測する
+
+usage: python benchmark/horizon_index.py [n_horizons ...]
+'''
+import sys
+import time
+import numpy as np
+
+from trade_tools.trade_utils import get_horizon_closest_to_price
+from trade_tools.horizon import HorizonIndex
+
+
+def generate_horizons(n, seed=0):
+    rand = np.random.RandomState(seed)
+    return {horizon: [] for horizon in 4000 + 0.5 * rand.choice(np.arange(20 * n), n, replace=False)}
+
+
+if __name__=='__main__':
+    sizes = [int(n) for n in sys.argv[1:]] if len(sys.argv) > 1 else [100, 1000, 10000]
+    queries = 2000
+    print('{:>8} {:>14} {:>14} {:>14}'.format('horizons', 'legacy [us]', 'index [us]', 'sync [us]'))
+    for n in sizes:
+        horizons = generate_horizons(n)
+        index = HorizonIndex(horizons)
+        rand = np.random.RandomState(1)
+        prices = (4000 + 0.5 * rand.randint(0, 20 * n, queries)).tolist()
+        directions = rand.choice(['both', 'upper', 'lower'], queries).tolist()
+
+        t = time.perf_counter()
+        expected = [get_horizon_closest_to_price(horizons, p, 1000, d) for p, d in zip(prices, directions)]
+        legacy = (time.perf_counter() - t) / queries
+
+        t = time.perf_counter()
+        actual = [index.closest(p, 1000, d) for p, d in zip(prices, directions)]
+        indexed = (time.perf_counter() - t) / queries
+
+        # 上下の距離が等しい場合だけは返す水平線が異なりうるので距離で比較する
+        for p, e, a in zip(prices, expected, actual):
+            assert (e == a) or (abs(e - p) == abs(a - p))
+
+        # 1割の水平線が入れ替わった場合の差分更新
+        values = list(horizons)
+        updated = set(values[n // 10:]) | set(generate_horizons(n // 10, seed=2))
+        t = time.perf_counter()
+        index.sync(updated)
+        sync = time.perf_counter() - t
+        assert index.values == sorted(updated)
+
+        print('{:>8} {:>14.1f} {:>14.1f} {:>14.1f}'.format(n, legacy * 1e6, indexed * 1e6, sync * 1e6))
@@ -0,0 +1,50 @@
+'''
+イナゴのシグナルが届くまでの時間を、MySQL を1秒ごとに読む従来の方法（3秒遅れの範囲を読む）と
+Unix ドメインソケットの配信 (InagoPublisher / InagoSubscriber) で比較する
+従来の方法は、シグナルの発生時刻が一様に分布するとして 3秒 + ポーリング間隔の待ち時間を計算で求める
+
+usage: python benchmark/inago_channel.py [signals]
+'''
+import os
+import sys
+import time
+import random
+import tempfile
+import threading
+import numpy as np
+
+from common.inago_channel import InagoPublisher, InagoSubscriber
+
+
+if __name__=='__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    path = os.path.join(tempfile.mkdtemp(), 'inago.sock')
+    publisher = InagoPublisher(path)
+    subscriber = InagoSubscriber(path)
+    assert subscriber.connect()
+    # 購読者が登録されるまで待つ
+    while len(publisher.subscribers) == 0:
+        time.sleep(0.01)
+
+    def publish():
+        for i in range(n):
+            publisher.publish({'taker_side': 'buy' if i % 2 == 0 else 'sell', 'timestamp': i})
+            time.sleep(random.uniform(0, 0.002))
+
+    thread = threading.Thread(target=publish)
+    thread.start()
+    received = []
+    while len(received) < n:
+        received += subscriber.poll(timeout=1)
+    thread.join()
+    publisher.close()
+    subscriber.close()
+    assert [signal['timestamp'] for signal in received] == list(range(n))
+
+    # 従来の方法: 3秒遅れ + 次のポーリングまでの待ち時間（0 ~ 1秒）
+    rand = np.random.RandomState(0)
+    legacy = 3 + rand.uniform(0, 1, n)
+    summary = subscriber.latency.summary()
+    print('{:>8} {:>12} {:>12}'.format('', 'p50 [ms]', 'p99 [ms]'))
+    print('{:>8} {:>12.1f} {:>12.1f}'.format('polling', np.percentile(legacy, 50) * 1e3, np.percentile(legacy, 99) * 1e3))
+    print('{:>8} {:>12.3f} {:>12.3f}'.format('push', summary['p50_us'] / 1e3, summary['p99_us'] / 1e3))
@@ -0,0 +1,102 @@
+'''
+イナゴの読み込みクエリの時間を、インデックスなしの to_datetime の範囲検索（従来）と
+sql/inago_index.sql のインデックスを使った to_unix_time の範囲検索 (InagoReader) で比較する
+config.ini の MySQL に inago と同じ列の作業用のテーブルを2つ作り、合成した行を増やしながら直近 3 秒の読み込みを計測する
+（作業用のテーブルは最後に削除する）
+
+usage: python benchmark/inago_index.py [rows ...]
+'''
+import sys
+import time
+import configparser
+import numpy as np
+import mysql.connector
+from datetime import datetime
+from urllib.parse import urlparse
+
+from common.utils import dt2str
+from trade_tools.inago_reader import QUERY
+
+CREATE_QUERY = '''CREATE TABLE {} (
+id INT NOT NULL AUTO_INCREMENT,
+board_name VARCHAR(255) NOT NULL,
+taker_side VARCHAR(5) NOT NULL,
+volume FLOAT NOT NULL,
+last_price FLOAT NOT NULL,
+pair_currency VARCHAR(255) NOT NULL,
+from_unix_time BIGINT NOT NULL,
+to_unix_time BIGINT NOT NULL,
+from_datetime DATETIME NOT NULL,
+to_datetime DATETIME NOT NULL,
+timestamp BIGINT,
+PRIMARY KEY (id)
+)'''
+INSERT_QUERY = 'INSERT INTO {} (board_name, taker_side, volume, last_price, pair_currency, from_unix_time, ' \
+               'to_unix_time, from_datetime, to_datetime, timestamp) values (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)'
+LEGACY_QUERY = 'SELECT * FROM {} WHERE %s <= to_datetime AND to_datetime <= %s'
+
+
+def insert_rows(conn, tables, start, n, batch=10000):
+    # 1秒に1行、過去から順に
+    rand = np.random.RandomState(start)
+    cur = conn.cursor()
+    for i in range(0, n, batch):
+        rows = []
+        for to_unix_time in range((start + i) * 1000, (start + min(i + batch, n)) * 1000, 1000):
+            to_datetime = dt2str(datetime.fromtimestamp(to_unix_time / 1000))
+            rows.append(('BitMEX_XBTUSD', 'buy' if rand.rand() < 0.5 else 'sell', 100.0, 4000.0, 'XBTUSD',
+                         to_unix_time - 10000, to_unix_time, to_datetime, to_datetime, to_unix_time))
+        for table in tables:
+            cur.executemany(INSERT_QUERY.format(table), rows)
+        conn.commit()
+    cur.close()
+
+
+def measure(conn, query, params, repeat=20):
+    cur = conn.cursor(prepared=True)
+    t = time.perf_counter()
+    for _ in range(repeat):
+        cur.execute(query, params)
+        cur.fetchall()
+    cur.close()
+    return (time.perf_counter() - t) / repeat
+
+
+if __name__=='__main__':
+    sizes = [int(n) for n in sys.argv[1:]] if len(sys.argv) > 1 else [10000, 100000, 1000000, 3000000]
+    inifile = configparser.ConfigParser()
+    inifile.read('config.ini', 'UTF-8')
+    url = urlparse('mysql://' + inifile.get('mysql', 'user') + ':' + inifile.get('mysql', 'password') +
+                   '@localhost:3306/crypto')
+    conn = mysql.connector.connect(host=url.hostname, port=url.port, user=url.username, password=url.password,
+                                   database=url.path[1:])
+    legacy_table = 'inago_bench_legacy'
+    index_table = 'inago_bench_index'
+    cur = conn.cursor()
+    for table in [legacy_table, index_table]:
+        cur.execute('DROP TABLE IF EXISTS {}'.format(table))
+        cur.execute(CREATE_QUERY.format(table))
+    cur.execute('ALTER TABLE {} ADD INDEX idx_board_name_to_unix_time (board_name, to_unix_time), '
+                'ADD INDEX idx_to_unix_time (to_unix_time)'.format(index_table))
+    cur.close()
+
+    start = int(datetime(2019, 1, 1).timestamp())
+    rows = 0
+    print('{:>9} {:>14} {:>14}'.format('rows', 'legacy [ms]', 'index [ms]'))
+    try:
+        for n in sizes:
+            insert_rows(conn, [legacy_table, index_table], start + rows, n - rows)
+            rows = n
+            # 直近 3 秒
+            end = start + rows - 1
+            legacy = measure(conn, LEGACY_QUERY.format(legacy_table),
+                             (dt2str(datetime.fromtimestamp(end - 3)), dt2str(datetime.fromtimestamp(end))))
+            index = measure(conn, QUERY.replace('crypto.inago', index_table),
+                            ('BitMEX_XBTUSD', (end - 3) * 1000, (end + 1) * 1000))
+            print('{:>9} {:>14.3f} {:>14.3f}'.format(rows, legacy * 1e3, index * 1e3))
+    finally:
+        cur = conn.cursor()
+        for table in [legacy_table, index_table]:
+            cur.execute('DROP TABLE IF EXISTS {}'.format(table))
+        cur.close()
+        conn.close()
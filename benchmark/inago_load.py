@@ -0,0 +1,135 @@
+'''
+inago_server に合成した InagoFlyer の POST を並行して送り、スループットとレイテンシを計測する
+host:port を指定しない場合は、従来のシングルスレッドの HTTPServer と PooledHTTPServer をこのプロセスで起動して比較する
+（MySQL の代わりに commit に時間がかかる接続を使う）
+stall=True の場合は、何も送らずに接続したままのクライアントを1つ混ぜる
+
+usage: python benchmark/inago_load.py [host:port]
+'''
+import sys
+import json
+import time
+import socket
+import threading
+import http.client
+import numpy as np
+from http.server import HTTPServer
+
+import trade.inago_server as inago_server
+from common.batch_writer import BatchWriter
+from benchmark.batch_writer import SlowConnection
+
+
+def fake_payload(i):
+    now = int(round(time.time() * 1000))
+    return json.dumps({
+        'boardName': 'BitMEX_XBTUSD',
+        'takerSide': 'buy' if i % 2 == 0 else 'sell',
+        'volume': 100.0 + i,
+        'lastPrice': 4000.0,
+        'pairCurrency': 'XBTUSD',
+        'fromUnixTime': now - 10000,
+        'toUnixTime': now,
+    })
+
+
+def connect(host, port):
+    conn = http.client.HTTPConnection(host, port, timeout=30)
+    conn.connect()
+    # ヘッダと本文を分けて送るので Nagle を無効にする
+    conn.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return conn
+
+
+def client(host, port, n, latencies, statuses):
+    # keep-alive で同じ接続を使い続ける（サーバが切断したら接続し直す）
+    conn = None
+    for i in range(n):
+        t = time.perf_counter()
+        try:
+            if conn is None:
+                conn = connect(host, port)
+            conn.request('POST', '/', fake_payload(i), {'Content-Type': 'application/json'})
+            res = conn.getresponse()
+            res.read()
+            status = res.status
+            if res.will_close:
+                conn.close()
+                conn = None
+        except OSError:
+            # 接続を拒否・リセットされた
+            status = None
+            if conn is not None:
+                conn.close()
+            conn = None
+        latencies.append(time.perf_counter() - t)
+        statuses.append(status)
+    if conn is not None:
+        conn.close()
+
+
+def load(host, port, clients, requests, stall=False):
+    staller = None
+    if stall:
+        staller = socket.create_connection((host, port))
+    latencies = []
+    statuses = []
+    threads = [threading.Thread(target=client, args=(host, port, requests, latencies, statuses))
+               for _ in range(clients)]
+    t = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - t
+    if staller is not None:
+        staller.close()
+    latencies = np.asarray(latencies)
+    return {
+        'throughput': len(latencies) / elapsed,
+        'p50_ms': np.percentile(latencies, 50) * 1e3,
+        'p99_ms': np.percentile(latencies, 99) * 1e3,
+        'max_ms': latencies.max() * 1e3,
+        'errors': sum(1 for status in statuses if status != 200),
+    }
+
+
+def serve(httpd):
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    return httpd.server_address
+
+
+if __name__=='__main__':
+    clients = 16
+    requests = 200
+    inago_server.logger.setLevel('WARNING')
+    print('{:>18} {:>12} {:>9} {:>9} {:>9} {:>7}'.format('server', 'req/s', 'p50 [ms]', 'p99 [ms]', 'max [ms]',
+                                                          'errors'))
+    if len(sys.argv) > 1:
+        host, port = sys.argv[1].split(':')
+        result = load(host, int(port), clients, requests)
+        print('{:>18} {throughput:>12.0f} {p50_ms:>9.2f} {p99_ms:>9.2f} {max_ms:>9.2f} {errors:>7}'.format(
+            sys.argv[1], **result))
+        sys.exit()
+
+    inago_server.writer = BatchWriter(lambda: SlowConnection(), inago_server.INSERT_QUERY)
+
+    class LegacyHandler(inago_server.InagoHandler):
+        # 従来の HTTPServer と同じく1リクエストごとに切断する
+        protocol_version = 'HTTP/1.0'
+
+    for stall in [False, True]:
+        for name, make_server in [('single', lambda: HTTPServer(('localhost', 0), LegacyHandler)),
+                                  ('pooled', lambda: inago_server.PooledHTTPServer(('localhost', 0),
+                                                                                   inago_server.InagoHandler,
+                                                                                   clients + 2))]:
+            httpd = make_server()
+            host, port = serve(httpd)
+            result = load(host, port, clients, requests, stall)
+            httpd.shutdown()
+            httpd.server_close()
+            label = name + (' (stalled)' if stall else '')
+            print('{:>18} {throughput:>12.0f} {p50_ms:>9.2f} {p99_ms:>9.2f} {max_ms:>9.2f} {errors:>7}'.format(
+                label, **result))
+    inago_server.writer.close()
@@ -0,0 +1,53 @@
+'''
+inago テーブルの読み込みを、従来の API.fetch_inago（毎回接続して DataFrame を作る）と InagoReader で比較する
+config.ini の MySQL に接続し、直近 3 秒のイナゴを n 回読み込んだときの1回あたりの時間を計測する
+
+usage: python benchmark/inago_reader.py [n]
+'''
+import sys
+import time
+import configparser
+import pandas as pd
+import mysql.connector
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+
+from common.utils import dt2str
+from trade_tools.inago_reader import InagoReader
+
+
+def legacy_fetch_inago(account, start_time, end_time):
+    conn = mysql.connector.connect(**account)
+    cur = conn.cursor(dictionary=True)
+    cur.execute('SELECT * FROM crypto.inago WHERE %s <= to_datetime AND to_datetime <= %s', [start_time, end_time])
+    df_inago = pd.DataFrame(cur.fetchall())
+    cur.close()
+    conn.close()
+    return df_inago
+
+
+if __name__=='__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    inifile = configparser.ConfigParser()
+    inifile.read('config.ini', 'UTF-8')
+    url = urlparse('mysql://' + inifile.get('mysql', 'user') + ':' + inifile.get('mysql', 'password') +
+                   '@localhost:3306/crypto')
+    account = {'host': url.hostname, 'port': url.port, 'user': url.username, 'password': url.password,
+               'database': url.path[1:]}
+    end_time = dt2str(datetime.now())
+    start_time = dt2str(datetime.now() - timedelta(seconds=3))
+
+    t = time.perf_counter()
+    for _ in range(n):
+        legacy_fetch_inago(account, start_time, end_time)
+    legacy_time = (time.perf_counter() - t) / n
+
+    reader = InagoReader(account)
+    t = time.perf_counter()
+    for _ in range(n):
+        reader.fetch(start_time, end_time)
+    reader_time = (time.perf_counter() - t) / n
+
+    print('legacy: {:.1f} us/query'.format(legacy_time * 1e6))
+    print('reader: {:.1f} us/query'.format(reader_time * 1e6))
+    print('reader metrics: {}'.format(reader.metrics()))
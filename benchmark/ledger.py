@@ -0,0 +1,69 @@
+'''
+約定ごとの損益計算を、従来の APISim.fetch_order（約定のたびに全注文の DataFrame を作り直して集計）と Ledger で比較する
+約定数を変えて、約定1回あたりの時間を計測する
+従来の実装は O(約定数^2) のため、legacy_max 回を超える場合は計測しない
+
+usage: python benchmark/ledger.py [fills ...]
+'''
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+from trade_tools.ledger import Ledger
+
+
+def legacy_profit(orders, profit):
+    df_orders = pd.DataFrame(list(orders.values())).sort_values('id')
+    df_orders = df_orders[df_orders['status'] == 'closed']
+
+    if len(df_orders) % 2 == 1:
+        df_orders = df_orders[:-1]
+
+    prev_price = -1
+    for i, row in df_orders.iterrows():
+        if i % 2 == 1:
+            if row['side'] == 'buy':
+                profit += prev_price - row['price']
+            else:
+                profit += row['price'] - prev_price
+        else:
+            prev_price = row['price']
+    return profit
+
+
+def generate_fills(n, seed=0):
+    rand = np.random.RandomState(seed)
+    prices = 4000 + 0.5 * np.cumsum(rand.choice([-4, -2, 0, 2, 4], n))
+    # 買いと売りを交互に（往復）
+    sides = ['sell' if i % 2 == 0 else 'buy' for i in range(n)]
+    return prices.tolist(), sides
+
+
+if __name__=='__main__':
+    sizes = [int(n) for n in sys.argv[1:]] if len(sys.argv) > 1 else [100, 1000, 10000, 100000]
+    legacy_max = 1000
+    print('{:>7} {:>16} {:>16}'.format('fills', 'legacy [us/fill]', 'ledger [us/fill]'))
+    for n in sizes:
+        prices, sides = generate_fills(n)
+
+        legacy_time = float('nan')
+        if n <= legacy_max:
+            t = time.perf_counter()
+            orders = {}
+            profit = 0
+            for i, (price, side) in enumerate(zip(prices, sides)):
+                orders[i] = {'id': i, 'side': side, 'price': price, 'amount': 1, 'status': 'closed'}
+                profit = legacy_profit(orders, profit)
+            legacy_time = (time.perf_counter() - t) / n
+
+        t = time.perf_counter()
+        ledger = Ledger()
+        for i, (price, side) in enumerate(zip(prices, sides)):
+            ledger.fill(i, side, price, 1, 'maker')
+        ledger_time = (time.perf_counter() - t) / n
+
+        # 往復ごとの損益の合計は一致する（従来の実装は過去の往復を毎回足し直すので一致しない）
+        expected = sum(prices[i] - prices[i + 1] for i in range(0, n - 1, 2))
+        assert abs(ledger.realized_pnl - expected) < 1e-6
+        print('{:>7} {:>16.1f} {:>16.1f}'.format(n, legacy_time * 1e6, ledger_time * 1e6))
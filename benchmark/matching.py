@@ -0,0 +1,117 @@
+'''
+指値の約定判定を、従来の APISim.fetch_order（確認のたびに板を DataFrame にして最良気配と比較）と MatchingEngine で比較する
+合成した板に指値を並べ、1秒ごとに全注文を確認した場合の時間を計測する
+並んでいる数量を考慮する場合 (queue_position=True) と約定履歴で約定させる場合 (use_executions=True) も計測する
+MatchingEngine は確認の間隔（1秒・5秒・60秒）を変えても約定時刻が変わらないことを確認する
+従来の実装は遅いため、legacy_max 秒を超える場合は計測しない
+
+usage: python benchmark/matching.py [orders]
+'''
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+from common.snapshot_store import EXECUTION_DTYPE, SIDE_BUY, SIDE_SELL
+from trade_tools.matching import MatchingEngine
+
+
+class Book:
+    # MatchingEngine が参照する ResourceManager の板・約定履歴の属性だけを持つ
+    def __init__(self, seconds, start, trades_per_second=5, seed=0):
+        rand = np.random.RandomState(seed)
+        self.bid_timestamps = (start + np.arange(seconds, dtype=np.int64)) * 1000
+        self.ask_timestamps = self.bid_timestamps
+        price = 4000 + 0.5 * np.cumsum(rand.choice([-2, -1, 0, 0, 0, 1, 2], seconds))
+        levels = 0.5 * np.arange(25)
+        self.bid_book = np.stack([price[:, None] - 0.5 - levels, rand.randint(100, 5000, (seconds, 25))], axis=2)
+        self.ask_book = np.stack([price[:, None] + levels, rand.randint(100, 5000, (seconds, 25))], axis=2)
+        self.price = price
+
+        # 約定は最良気配で、ときどき2段先まで
+        n = seconds * trades_per_second
+        second = np.sort(rand.randint(0, seconds, n))
+        executions = np.zeros(n, dtype=EXECUTION_DTYPE)
+        executions['timestamp'] = self.bid_timestamps[second] + rand.randint(0, 1000, n)
+        executions['side'] = rand.choice([SIDE_BUY, SIDE_SELL], n)
+        depth = 0.5 * rand.choice([0, 0, 0, 0, 1, 2], n)
+        executions['price'] = np.where(executions['side'] == SIDE_BUY, price[second] + depth,
+                                       price[second] - 0.5 - depth)
+        executions['amount'] = rand.randint(1, 2000, n)
+        executions.sort(order='timestamp', kind='mergesort')
+        self.execution_timestamps = executions['timestamp']
+        self.execution_sides = executions['side']
+        self.execution_prices = executions['price']
+        self.execution_amounts = executions['amount']
+
+
+def generate_orders(n, price, seed=0):
+    rand = np.random.RandomState(seed)
+    orders = []
+    for i in range(n):
+        side = 'buy' if i % 2 == 0 else 'sell'
+        offset = 0.5 * rand.randint(1, 100)
+        orders.append({'id': i, 'side': side, 'price': price - offset if side == 'buy' else price + offset,
+                       'amount': 1000})
+    return orders
+
+
+def legacy_is_filled(order, bids, asks):
+    orderbook = pd.concat([pd.DataFrame(bids, columns=['price', 'order_num']),
+                           pd.DataFrame(asks, columns=['price', 'order_num'])]).reset_index(drop=True)
+    orderbook['side'] = ['bids'] * len(bids) + ['asks'] * len(asks)
+    if order['side'] == 'buy':
+        return orderbook[orderbook['side'] == 'asks']['price'].iloc[0] <= order['price']
+    return orderbook[orderbook['side'] == 'bids']['price'].iloc[0] >= order['price']
+
+
+def run_engine(book, orders, interval, queue_position=False, use_executions=False):
+    engine = MatchingEngine(book, queue_position, use_executions)
+    start = book.bid_timestamps[0]
+    for order in orders:
+        engine.add(dict(order), start)
+    fills = []
+    for now in range(start + interval * 1000, book.bid_timestamps[-1] + interval * 1000, interval * 1000):
+        for order, price, amount, liquidity, timestamp in engine.advance(now):
+            fills.append((order['id'], amount, timestamp))
+    return sorted(fills)
+
+
+if __name__=='__main__':
+    sizes = [int(n) for n in sys.argv[1:]] if len(sys.argv) > 1 else [10, 100, 1000]
+    seconds = 3600
+    legacy_max = 300
+    book = Book(seconds, 1553472000)
+    print('{:>7} {:>18} {:>18} {:>18} {:>18} {:>8} {:>8}'.format('orders', 'legacy [us/check]', 'engine [us/check]',
+                                                                  'queue [us/check]', 'tape [us/check]', 'fills', 'tape'))
+    for n in sizes:
+        orders = generate_orders(n, book.price[0])
+
+        legacy_time = float('nan')
+        if seconds * n <= legacy_max * 1000:
+            t = time.perf_counter()
+            open_orders = list(orders)
+            for i in range(seconds):
+                open_orders = [order for order in open_orders
+                               if not legacy_is_filled(order, book.bid_book[i], book.ask_book[i])]
+            legacy_time = (time.perf_counter() - t) / (seconds * n)
+
+        t = time.perf_counter()
+        fills = run_engine(book, orders, 1)
+        engine_time = (time.perf_counter() - t) / (seconds * n)
+
+        t = time.perf_counter()
+        queue_fills = run_engine(book, orders, 1, True)
+        queue_time = (time.perf_counter() - t) / (seconds * n)
+
+        t = time.perf_counter()
+        tape_fills = run_engine(book, orders, 1, True, True)
+        tape_time = (time.perf_counter() - t) / (seconds * n)
+
+        # 確認の間隔によらず約定時刻は同じ
+        for interval in [5, 60]:
+            assert run_engine(book, orders, interval) == fills
+            assert run_engine(book, orders, interval, True) == queue_fills
+            assert run_engine(book, orders, interval, True, True) == tape_fills
+        print('{:>7} {:>18.2f} {:>18.2f} {:>18.2f} {:>18.2f} {:>8} {:>8}'.format(
+            n, legacy_time * 1e6, engine_time * 1e6, queue_time * 1e6, tape_time * 1e6, len(fills), len(tape_fills)))
@@ -0,0 +1,75 @@
+'''
+水平線ごとの指値の価格計算を、従来の DataFrame の実装と ArrayOrderBook で比較する
+板の段数と水平線の数を変えて計測し、結果が一致することを確認する
+
+usage: python benchmark/order_price.py [levels]
+'''
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+from trade_tools.orderbook import ArrayOrderBook
+
+
+def legacy_format_orderbook(orderbook):
+    bids = pd.DataFrame(orderbook['bids'], columns=['price', 'order_num'])
+    asks = pd.DataFrame(orderbook['asks'], columns=['price', 'order_num'])
+    orderbook = pd.concat([bids, asks]).reset_index(drop=True)
+    orderbook['side'] = ['bids'] * len(bids) + ['asks'] * len(asks)
+    return orderbook
+
+
+def legacy_get_orderbook_around_horizon(orderbook, horizon, scope):
+    idx_orderbook = (orderbook['price'] - horizon).abs().idxmin()
+    idx_start = idx_orderbook - scope if idx_orderbook - scope >= 0 else 0
+    idx_end = idx_orderbook + scope if idx_orderbook + scope <= len(orderbook) else len(orderbook) - 1
+    return orderbook.iloc[idx_start:idx_end + 1]
+
+
+def legacy_calc_order_price(horizon, orderbook, scope=3, threshold=10000, shift=0.5):
+    near_orderbook = legacy_get_orderbook_around_horizon(orderbook, horizon, scope)
+    total_order_num = near_orderbook.sum()['order_num']
+    order_price = -1
+    if total_order_num > threshold:
+        orderbook_max = orderbook[orderbook.index == near_orderbook['order_num'].idxmax()]
+        if orderbook_max['side'].values == 'bids':
+            order_price = (orderbook_max['price'] + shift).iloc[0]
+        else:
+            order_price = (orderbook_max['price'] - shift).iloc[0]
+    return order_price
+
+
+def generate_orderbook(levels, seed=0):
+    rand = np.random.RandomState(seed)
+    mid = 5000.0
+    # 板の値段は 0.5 刻み。ところどころ段を抜いて間を空ける
+    bid_prices = mid - 0.5 * np.cumsum(rand.choice([1, 1, 1, 2, 3], levels))
+    ask_prices = mid - 0.5 + 0.5 * np.cumsum(rand.choice([1, 1, 1, 2, 3], levels))
+    amounts = rand.randint(1, 8000, 2 * levels).astype(np.float64)
+    # 同じ注文数の段も混ぜる
+    amounts[rand.randint(0, 2 * levels, levels // 4)] = 5000.0
+    return {'bids': np.column_stack([bid_prices, amounts[:levels]]).tolist(),
+            'asks': np.column_stack([ask_prices, amounts[levels:]]).tolist()}
+
+
+if __name__=='__main__':
+    levels = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    orderbook = generate_orderbook(levels)
+    print('{:>9} {:>12} {:>12}'.format('horizons', 'legacy [s]', 'array [s]'))
+    for n in [10, 100, 1000]:
+        rand = np.random.RandomState(n)
+        # 板の外側や段の中間（距離が等しい場合）も含める
+        horizons = 5000 + 0.25 * rand.randint(-4 * levels - 40, 4 * levels + 40, n)
+
+        t = time.perf_counter()
+        df_orderbook = legacy_format_orderbook(orderbook)
+        expected = [legacy_calc_order_price(horizon, df_orderbook) for horizon in horizons]
+        legacy_time = time.perf_counter() - t
+
+        t = time.perf_counter()
+        actual = ArrayOrderBook.from_orderbook(orderbook).order_prices(horizons)
+        array_time = time.perf_counter() - t
+
+        np.testing.assert_array_equal(np.array(expected, dtype=np.float64), actual)
+        print('{:>9} {:>12.4f} {:>12.4f}'.format(n, legacy_time, array_time))
@@ -0,0 +1,154 @@
+'''
+orderBookL2_25 のメッセージをリプレイして板更新の速度を計測する
+
+usage: python benchmark/orderbook_replay.py [messages.jsonl]
+messages.jsonl: websocket で受信した生メッセージを1行に1つ保存したファイル
+（指定しない場合は合成したメッセージを使う）
+'''
+import sys
+import json
+import time
+import random
+from collections import OrderedDict
+
+from common.orderbook import OrderBookL2
+
+
+class LegacyOrderBook:
+    '''
+    OrderedDict を毎回ソートし直す従来の update_orderbook（そのまま移植）
+    '''
+    def __init__(self):
+        self.id_and_price = {}
+        self.bids = OrderedDict()
+        self.asks = OrderedDict()
+
+    def apply(self, message):
+        if message['action'] == 'partial':
+            for d in message['data']:
+                self.id_and_price[d['id']] = d['price']
+                if d['side'] == 'Buy':
+                    self.bids[d['id']] = [d['price'], d['size']]
+                else:
+                    self.asks[d['id']] = [d['price'], d['size']]
+        elif message['action'] == 'update':
+            for d in message['data']:
+                if d['side'] == 'Buy':
+                    self.bids[d['id']] = [self.id_and_price[d['id']], d['size']]
+                else:
+                    self.asks[d['id']] = [self.id_and_price[d['id']], d['size']]
+        elif message['action'] == 'insert':
+            for d in message['data']:
+                self.id_and_price[d['id']] = d['price']
+                if d['side'] == 'Buy':
+                    self.bids[d['id']] = [d['price'], d['size']]
+                else:
+                    self.asks[d['id']] = [d['price'], d['size']]
+        else:
+            for d in message['data']:
+                if d['side'] == 'Buy':
+                    self.bids.pop(d['id'])
+                else:
+                    self.asks.pop(d['id'])
+            self.bids = OrderedDict(sorted(self.bids.items(), key=lambda x: x[0]))
+        self.asks = OrderedDict(sorted(self.asks.items(), key=lambda x: x[0], reverse=True))
+        return self
+
+
+def price2id(price):
+    # XBTUSD (tick size 0.5) の id 採番規則
+    return int(8800000000 - price * 100)
+
+
+def generate_messages(n, depth=25, seed=0):
+    '''
+    orderBookL2_25 を模したメッセージを合成する
+    '''
+    rand = random.Random(seed)
+    mid = 4000.0
+    bids = {mid - 0.5 * (i + 1): rand.randint(1, 100000) for i in range(depth)}
+    asks = {mid + 0.5 * i: rand.randint(1, 100000) for i in range(depth)}
+
+    def level(side, price, size=None):
+        d = {'symbol': 'XBTUSD', 'id': price2id(price), 'side': side}
+        if size is not None:
+            d['size'] = size
+        return d
+
+    data = [dict(level('Sell', p, s), price=p) for p, s in asks.items()] + \
+           [dict(level('Buy', p, s), price=p) for p, s in bids.items()]
+    messages = [{'table': 'orderBookL2_25', 'action': 'partial', 'data': data}]
+    while len(messages) < n:
+        r = rand.random()
+        if r < 0.8:
+            # サイズ更新
+            side = rand.choice(['Buy', 'Sell'])
+            levels = bids if side == 'Buy' else asks
+            price = rand.choice(list(levels))
+            levels[price] = rand.randint(1, 100000)
+            messages.append({'table': 'orderBookL2_25', 'action': 'update',
+                             'data': [level(side, price, levels[price])]})
+        else:
+            # 最良気配が動く（片側の先頭を消して、もう片側の先頭に追加）
+            # 25段を保つため、追加した側の最深部を消して反対側の最深部に追加する
+            if rand.random() < 0.5:
+                taken, side, added, added_side, price = bids, 'Buy', asks, 'Sell', max(bids)
+                deep_price, deep_new = max(asks), min(bids) - 0.5
+            else:
+                taken, side, added, added_side, price = asks, 'Sell', bids, 'Buy', min(asks)
+                deep_price, deep_new = min(bids), max(asks) + 0.5
+            taken.pop(price)
+            added.pop(deep_price)
+            messages.append({'table': 'orderBookL2_25', 'action': 'delete',
+                             'data': [level(side, price), level(added_side, deep_price)]})
+            added[price] = rand.randint(1, 100000)
+            taken[deep_new] = rand.randint(1, 100000)
+            messages.append({'table': 'orderBookL2_25', 'action': 'insert',
+                             'data': [dict(level(added_side, price, added[price]), price=price),
+                                      dict(level(side, deep_new, taken[deep_new]), price=deep_new)]})
+    return messages
+
+
+def replay(book, messages):
+    latencies = []
+    start = time.perf_counter()
+    for message in messages:
+        t = time.perf_counter()
+        book.apply(message)
+        latencies.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    return len(messages) / elapsed, p99
+
+
+def load_messages(path):
+    messages = []
+    with open(path) as f:
+        for line in f:
+            message = json.loads(line)
+            if message.get('table') == 'orderBookL2_25' and 'data' in message:
+                messages.append(message)
+    return messages
+
+
+if __name__=='__main__':
+    if len(sys.argv) > 1:
+        messages = load_messages(sys.argv[1])
+    else:
+        messages = generate_messages(100000)
+
+    # 両者の板が一致することを確認
+    # （従来実装は delete 以外で bids を並び替えないため価格順に揃えて比較する）
+    legacy = LegacyOrderBook()
+    book = OrderBookL2()
+    for message in messages:
+        legacy.apply(message)
+        book.apply(message)
+    assert sorted(legacy.bids.values(), key=lambda x: -x[0]) == book.bids
+    assert list(legacy.asks.values()) == book.asks
+
+    print('messages: {}'.format(len(messages)))
+    for name, impl in [('legacy', LegacyOrderBook), ('OrderBookL2', OrderBookL2)]:
+        throughput, p99 = replay(impl(), messages)
+        print('{:>12}: {:>10.0f} msg/sec, p99 {:.2f} us'.format(name, throughput, p99 * 1e6))
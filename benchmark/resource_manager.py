@@ -0,0 +1,93 @@
+'''
+ResourceManager の1ティックあたりの取得コストを、データ量（1時間〜1か月）を変えて計測する
+従来の実装（真偽値マスクで全行を走査）と比較する
+
+usage: python benchmark/resource_manager.py [hours ...]
+'''
+import sys
+import time
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+from trade_tools.rm import ResourceManager
+from trade_tools.tm import TimeManager
+
+
+class LegacyResourceManager:
+    def __init__(self, ticker, ohlcv_list, bids, asks, inago, tm):
+        self.ticker = ticker
+        self.ohlcv_list = ohlcv_list
+        self.bids = bids
+        self.asks = asks
+        self.inago = inago
+        self.tm = tm
+
+    def fetch_ticker(self):
+        now = self.tm.now * 1000
+        target = self.ticker[self.ticker.timestamp == now]
+        return dict(target.iloc[0])
+
+    def fetch_ohlcv(self, candle_type, since, limit=None):
+        # 現在時刻より後の足を返さないように比較条件だけ合わせている
+        ohlcv = self.ohlcv_list[candle_type]
+        now = self.tm.now * 1000
+        target = ohlcv[(ohlcv.timestamp > since) & (ohlcv.timestamp <= now)].loc[:, ['timestamp', 'open', 'high', 'low', 'close', 'volume']]
+        if limit is not None:
+            if len(target) > limit:
+                target = target.iloc[:limit]
+        return target.values.tolist()
+
+    def fetch_order_book(self):
+        now = self.tm.now * 1000
+        bids = self.bids[self.bids.timestamp == now]
+        asks = self.asks[self.asks.timestamp == now]
+        return bids.iloc[0], asks.iloc[0]
+
+
+def generate_dataset(seconds, start, seed=0):
+    rand = np.random.RandomState(seed)
+    timestamp = (start + np.arange(seconds, dtype=np.int64)) * 1000
+    price = 5000 + 0.5 * np.cumsum(rand.choice([-1, 0, 1], seconds))
+    ticker = pd.DataFrame({'timestamp': timestamp.astype(np.float64), 'bid': price - 0.5, 'bid_volume': 1.0,
+                           'ask': price, 'ask_volume': 1.0, 'open': price, 'high': price, 'low': price,
+                           'close': price, 'volume': 1.0})
+    ohlcv_1m = pd.DataFrame({'timestamp': timestamp[::60].astype(np.float64), 'open': price[::60],
+                             'high': price[::60], 'low': price[::60], 'close': price[::60], 'volume': 1.0})
+    columns = {'timestamp': timestamp}
+    for i in range(25):
+        col_idx = '{0:02d}'.format(i)
+        columns['price' + col_idx] = price + 0.5 * i
+        columns['amount' + col_idx] = 100.0
+    book = pd.DataFrame(columns)
+    inago = pd.DataFrame({'timestamp': timestamp[::600], 'taker_side': 'buy'})
+    return ticker, {'1m': ohlcv_1m}, book, book, inago
+
+
+def per_tick(rm, tm, start, seconds, ticks, seed=1):
+    rand = np.random.RandomState(seed)
+    times = start + 3600 + rand.randint(0, seconds - 3600, ticks)
+    t = time.perf_counter()
+    for now in times:
+        tm.now = float(now)
+        rm.fetch_ticker()
+        rm.fetch_order_book()
+        rm.fetch_ohlcv('1m', (now - 3600) * 1000)
+    return (time.perf_counter() - t) / ticks
+
+
+if __name__=='__main__':
+    hours = [int(h) for h in sys.argv[1:]] if len(sys.argv) > 1 else [1, 24, 24 * 7, 24 * 30]
+    start = int(datetime(2019, 3, 1).timestamp())
+    print('{:>8} {:>14} {:>14}'.format('hours', 'legacy [us]', 'indexed [us]'))
+    for h in hours:
+        seconds = h * 3600 + 3600
+        ticker, ohlcv_list, bids, asks, inago = generate_dataset(seconds, start)
+        tm = TimeManager(start)
+        rm = ResourceManager(ticker, ohlcv_list, bids, asks, inago, tm)
+        indexed = per_tick(rm, tm, start, seconds, 2000)
+        # 従来の実装は大きいデータだと時間がかかるのでティック数を減らす
+        legacy_tm = TimeManager(start)
+        legacy_rm = LegacyResourceManager(ticker, ohlcv_list, bids, asks, inago, legacy_tm)
+        legacy = per_tick(legacy_rm, legacy_tm, start, seconds, 2000 if h <= 24 else 50)
+        print('{:>8} {:>14.1f} {:>14.1f}'.format(h, legacy * 1e6, indexed * 1e6))
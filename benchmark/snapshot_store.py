@@ -0,0 +1,80 @@
+'''
+1日分の板（25段）を CSV とバイナリ形式（common/snapshot_store.py）で保存し、読み込み時間を比較する
+
+usage: python benchmark/snapshot_store.py [snapshots_per_second]
+'''
+import os
+import sys
+import time
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+from common.snapshot_store import BookWriter, read_book, read_book_frame, segment_start, DEPTH
+
+
+def generate_book(n, start, interval_ms, seed=0):
+    rand = np.random.RandomState(seed)
+    timestamp = start + np.arange(n, dtype=np.int64) * interval_ms
+    mid = 4000 + np.cumsum(rand.choice([-0.5, 0, 0.5], n))
+    price = mid[:, None] - 0.5 * np.arange(DEPTH)[None, :]
+    size = rand.randint(1, 100000, (n, DEPTH)).astype(np.float64)
+    return timestamp, price, size
+
+
+def write_csvs(dirpath, timestamp, price, size):
+    # collect/save_orderbook.py が以前書いていた形式（timestamp, price00, amount00, ...）
+    values = np.empty((len(timestamp), DEPTH * 2))
+    values[:, 0::2] = price
+    values[:, 1::2] = size
+    starts = np.unique([segment_start(t) for t in timestamp[::1000]])
+    for start in starts:
+        begin = start.timestamp() * 1000
+        mask = (begin <= timestamp) & (timestamp < begin + 3600 * 1000)
+        df = pd.DataFrame(values[mask])
+        df.insert(0, 'timestamp', timestamp[mask])
+        df.to_csv(os.path.join(dirpath, 'bid.' + start.strftime('%Y%m%d%H%M%S')), header=False, index=False)
+
+
+def read_csvs(dirpath):
+    dfs = [pd.read_csv(os.path.join(dirpath, file), header=None) for file in sorted(os.listdir(dirpath))]
+    return pd.concat(dfs)
+
+
+if __name__=='__main__':
+    per_second = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    n = 86400 * per_second
+    start = int(datetime(2019, 4, 6).timestamp() * 1000)
+    timestamp, price, size = generate_book(n, start, 1000 // per_second)
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        csv_dir = os.path.join(tmpdir, 'csv')
+        store_dir = os.path.join(tmpdir, 'store')
+        os.makedirs(csv_dir)
+        write_csvs(csv_dir, timestamp, price, size)
+
+        t = time.perf_counter()
+        writer = BookWriter(store_dir, 'bid')
+        for i in range(n):
+            writer.append(int(timestamp[i]), np.stack([price[i], size[i]], axis=1))
+        writer.close()
+        print('write store: {:.2f} sec ({} snapshots)'.format(time.perf_counter() - t, n))
+
+        t = time.perf_counter()
+        df_csv = read_csvs(csv_dir)
+        print('read csv: {:.3f} sec'.format(time.perf_counter() - t))
+
+        t = time.perf_counter()
+        ts, p, s = read_book(store_dir, 'bid')
+        print('read store (arrays): {:.3f} sec'.format(time.perf_counter() - t))
+
+        t = time.perf_counter()
+        df_store = read_book_frame(store_dir, 'bid')
+        print('read store (DataFrame): {:.3f} sec'.format(time.perf_counter() - t))
+
+        assert np.array_equal(df_csv.values, df_store.values)
+    finally:
+        shutil.rmtree(tmpdir)
@@ -8,66 +8,93 @@ from datetime import datetime, timedelta
 #%matplotlib inline
 import matplotlib.pyplot as plt
 from IPython.display import Image, display_png
-import os
 import fnmatch
-from common.utils import str2dt, format_dt
+import hashlib
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+from common.utils import str2dt, format_dt, timestamp2dtindex, dtindex2timestamp
+from common.snapshot_store import read_book_frame, read_executions_frame
+from common.ohlcv import generate_active_ohlcvs
 
 
-def generate_ticker(executions):
+CANDLE_FREQS = {'1s': 'S', '1m': 'T', '5m': '5T', '1h': 'H'}
+
+
+def resample_executions(executions):
     '''
-    約定履歴から1秒ごとのtickerを作成
-    約定履歴: timestamp, side, price, amount
-    ticker: timestamp, bid, bid_volume, ask, ask_volume, open, high, low, close, volume
+    約定履歴を1秒ごとにまとめ、bid（最後の約定が売りの秒）と ask（最後の約定が買いの秒）を作る
+    約定履歴のグルーピングはここで1回だけ行い、ticker と各時間足の OHLCV で使い回す
+    bids, asks: index: datetimeindex, column: price, amount
     '''
-    executions.index = pd.to_datetime(executions.timestamp.apply(lambda x: datetime.fromtimestamp(x / 1000)))
+    executions.index = timestamp2dtindex(executions.timestamp)
 
     executions = executions.resample('S').last()
 
-    # bid, askを算出
     bids = executions.loc[executions.side == 'Sell'].resample('S').ffill()
     bids = bids.drop(['timestamp', 'side'], axis=1)
     asks = executions.loc[executions.side == 'Buy'].resample('S').ffill()
     asks = asks.drop(['timestamp', 'side'], axis=1)
+    return bids, asks
+
+
+def _ohlcv_from_bids(bids, candle_type):
+    freq = CANDLE_FREQS[candle_type]
+    if freq == 'S':
+        # bids は1秒ごとに1行なので OHLC はすべて同じ値になる
+        ohlcv = pd.DataFrame({'open': bids.price, 'high': bids.price, 'low': bids.price, 'close': bids.price},
+                             columns=['open', 'high', 'low', 'close'])
+        ohlcv['volume'] = bids.amount
+    else:
+        ohlcv = bids.price.resample(freq).ohlc()
+        ohlcv['volume'] = bids.amount.resample(freq).sum()
+    ohlcv['timestamp'] = dtindex2timestamp(ohlcv.index)
+    return ohlcv
+
+
+def _ticker_from_bids_asks(bids, asks):
     bids_asks = pd.merge(bids, asks, how='inner', left_index=True, right_index=True)
     bids_asks.columns = ['bid', 'bid_volume', 'ask', 'ask_volume']
-    # OHLCVを算出
-    ohlcv = bids.price.resample('S').ohlc()
-    ohlcv['volume'] = bids.amount.resample('S').sum()
-    ohlcv['timestamp'] = pd.Series(ohlcv.index).apply(lambda x: datetime.timestamp(x) * 1000).values
-    # ticker作成
+    ohlcv = _ohlcv_from_bids(bids, '1s')
     ticker = pd.merge(bids_asks, ohlcv, how='inner', left_index=True, right_index=True)
-    ticker['timestamp'] = pd.Series(ticker.index).apply(lambda x: datetime.timestamp(x) * 1000).values
-    return ticker.ix[:,['timestamp', 'bid', 'bid_volume', 'ask', 'ask_volume', 'open', 'high', 'low', 'close', 'volume']]
+    return ticker[['timestamp', 'bid', 'bid_volume', 'ask', 'ask_volume', 'open', 'high', 'low', 'close', 'volume']]
+
+
+def generate_ticker(executions):
+    '''
+    約定履歴から1秒ごとのtickerを作成
+    約定履歴: timestamp, side, price, amount
+    ticker: timestamp, bid, bid_volume, ask, ask_volume, open, high, low, close, volume
+    '''
+    bids, asks = resample_executions(executions)
+    return _ticker_from_bids_asks(bids, asks)
 
 
 def generate_ohlcv(executions, candle_type):
     '''
-    約定履歴から１分、５分、１時間のOHLCVを作成
+    約定履歴から１秒、１分、５分、１時間のOHLCVを作成
     約定履歴: timestamp, side, price, amount
-    OHLCV: timestamp, bid, bid_volume, ask, ask_volume, open, high, low, close, volume
+    OHLCV: open, high, low, close, volume, timestamp
     '''
-    executions.index = pd.to_datetime(executions.timestamp.apply(lambda x: datetime.fromtimestamp(x / 1000)))
+    return generate_ohlcvs(executions, [candle_type])[candle_type]
 
-    # 1秒ごとにグルーピング
-    executions = executions.resample('S').last()
 
-    # bid, askを算出
-    bids = executions.loc[executions.side == 'Sell'].resample('S').ffill()
+def generate_ohlcvs(executions, candle_types):
+    '''
+    約定履歴を1回だけグルーピングして、複数の時間足のOHLCVを作成
+    candle_types: ['1s', '1m', '5m', '1h'] の部分集合
+    戻り値: candle_type -> OHLCV
+    '''
+    bids, _ = resample_executions(executions)
+    return {candle_type: _ohlcv_from_bids(bids, candle_type) for candle_type in candle_types}
 
-    # OHLCVを作成
-    if candle_type == '1s':
-        freq = 'S'
-    if candle_type == '1m':
-        freq = 'T'
-    elif candle_type == '5m':
-        freq = '5T'
-    elif candle_type == '1h':
-        freq = 'H'
-
-    ohlcv = bids.price.resample(freq).ohlc()
-    ohlcv['volume'] = bids.amount.resample(freq).sum()
-    ohlcv['timestamp'] = pd.Series(ohlcv.index).apply(lambda x: datetime.timestamp(x) * 1000).values
-    return ohlcv
+
+def generate_ticker_and_ohlcvs(executions, candle_types):
+    '''
+    generate_ticker と generate_ohlcvs を約定履歴の1回のグルーピングで作成
+    '''
+    bids, asks = resample_executions(executions)
+    ticker = _ticker_from_bids_asks(bids, asks)
+    return ticker, {candle_type: _ohlcv_from_bids(bids, candle_type) for candle_type in candle_types}
 
 def generate_active_ohlcv(df, candle_type):
     '''
@@ -75,98 +102,124 @@ def generate_active_ohlcv(df, candle_type):
     df: DataFrame (index: datetimeindex, column: open, high, low, close, volume timestamp)
     candle_type: '1m' or '5m' or '1h'
     '''
+    return generate_active_ohlcvs(df, [candle_type])[candle_type]
 
-    ohlcv = df.values
-    open = ohlcv[0, 0]
-    high = -1
-    low = 999999
-    close = ohlcv[0, 3]
-    volume = ohlcv[0, 4]
-
-    if candle_type == '1m':
-        div = 60 * 1000
-    elif candle_type == '5m':
-        div = 60 * 5 * 1000
-    elif candle_type == '1h':
-        div = 60 * 60 * 1000
-
-    active_ohlcv = []
-    for i in range(ohlcv.shape[0]):
-        row = ohlcv[i]
-
-        # １分ごとにリセット
-        timestamp = row[5]
-        if timestamp % div == 0:
-            open = row[0]
-            high = -1
-            low = 999999
-            volume = 0
-
-        close = row[3]
-        volume += row[4]
-        if row[1] > high:
-            high = row[1]
-        if row[2] < low:
-            low = row[2]
-        active_ohlcv.append([open, high, low, close, volume, timestamp])
-
-    active_ohlcv = pd.DataFrame(active_ohlcv)
-    active_ohlcv.columns = ['open', 'high', 'low', 'close', 'volume', 'timestamp']
-    active_ohlcv.index = pd.to_datetime(active_ohlcv.timestamp.apply(lambda x: datetime.fromtimestamp(x / 1000)))
-    return active_ohlcv
-
-def read_csvs(dirpath, start_dt, end_dt, pattern=None, prefix=None):
+def list_csvs(dirpath, start_dt, end_dt, pattern=None, prefix=None):
+    '''
+    ファイル名の時刻 (%Y%m%d%H%M%S) が start_dt ~ end_dt のファイルを返す
+    ファイル名は時刻順に並ぶので、strptime せずに文字列の比較で絞り込む
+    '''
     files = sorted(os.listdir(dirpath))
 
     if pattern is not None:
         files = [file for file in files if fnmatch.fnmatch(file, pattern)]
 
-    ret = None
+    start = start_dt.strftime('%Y%m%d%H%M%S')
+    end = end_dt.strftime('%Y%m%d%H%M%S')
+    targets = []
     for file in files:
-        if prefix is None:
-            dt = datetime.strptime(file, '%Y%m%d%H%M%S')
-        else:
-            dt = datetime.strptime(file.replace(prefix, ''), '%Y%m%d%H%M%S')
+        name = file if prefix is None else file.replace(prefix, '')
+        if (len(name) == 14) and name.isdigit() and (start <= name) and (name <= end):
+            targets.append(os.path.join(dirpath, file))
+    return targets
+
+def _cache_path(path, cache_dir):
+    stat = os.stat(path)
+    key = '{}:{}:{}'.format(os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    return os.path.join(cache_dir, hashlib.md5(key.encode('utf-8')).hexdigest() + '.pkl')
+
+def _read_csv(path, dtype=None, cache_dir=None):
+    '''
+    CSV を1つ読み込む
+    cache_dir を指定した場合はパースした結果をファイルパスと更新時刻をキーにキャッシュする
+    '''
+    if cache_dir is not None:
+        cache_path = _cache_path(path, cache_dir)
+        if os.path.exists(cache_path):
+            with open(cache_path, 'rb') as f:
+                return pickle.load(f)
+
+    print('read file: {}'.format(os.path.basename(path)))
+    df = pd.read_csv(path, header=None, dtype=dtype)
+
+    if cache_dir is not None:
+        tmp_path = '{}.{}'.format(cache_path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(df, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    return df
+
+def read_csvs(dirpath, start_dt, end_dt, pattern=None, prefix=None, dtype=None, processes=None, cache_dir=None):
+    '''
+    ファイル名の時刻が start_dt ~ end_dt の CSV をプロセスプールで並列に読み込み、1回で結合する
+    dtype: pd.read_csv に渡す列ごとの型（列番号 -> 型）
+    processes: プロセス数（None の場合は CPU 数、1 の場合は直列に読み込む）
+    cache_dir: パース結果のキャッシュを置くディレクトリ（None の場合はキャッシュしない）
+    '''
+    paths = list_csvs(dirpath, start_dt, end_dt, pattern, prefix)
+    if len(paths) == 0:
+        return None
 
-        if (start_dt <= dt) and (dt <= end_dt):
-            print('read file: {}'.format(file))
-            df = pd.read_csv(os.path.join(dirpath, file), header=None)
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
 
-            if ret is None:
-                ret = df
-            else:
-                ret = pd.concat([ret, df])
-    return ret
+    read = partial(_read_csv, dtype=dtype, cache_dir=cache_dir)
+    if (processes == 1) or (len(paths) == 1):
+        dfs = [read(path) for path in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            dfs = list(executor.map(read, paths))
+    return pd.concat(dfs)
 
 if __name__=='__main__':
     start_dt = str2dt('2019-04-06 19:00:00')
     end_dt = str2dt('2019-04-06 21:00:00')
 
+    # collect/store のバイナリ形式を読む（False の場合は従来の CSV を読む）
+    use_store = True
+    cache_dir = 'collect/cache'
+    execution_dtype = {0: np.int64, 1: str, 2: str, 3: np.float64, 4: np.int64, 5: str, 6: str}
+    orderbook_dtype = {i: np.float64 for i in range(1, 51)}
+    orderbook_dtype[0] = np.int64
+
     # ticker, ohlcv
-    executions = read_csvs('collect/executions', start_dt, end_dt, pattern='execution.*', prefix='execution.')
-    executions.columns = ['timestamp', 'datetime_utc_bitmex', 'side', 'price', 'amount', 'datetime',
-                          'datetime_jst_bitmex']
-    executions = executions.drop(['datetime', 'datetime_utc_bitmex', 'datetime_jst_bitmex'], axis=1)
-    executions['side'] = executions['side'].str.replace(' ', '') # 後で消す
-    ticker = generate_ticker(executions)
-    ohlcv = generate_ohlcv(executions, candle_type='1s')
-    active_ohlcv_1m = generate_active_ohlcv(ohlcv, candle_type='1m')
-    active_ohlcv_5m = generate_active_ohlcv(ohlcv, candle_type='5m')
-    active_ohlcv_1h = generate_active_ohlcv(ohlcv, candle_type='1h')
-
-    # orderbook
+    if use_store:
+        executions = read_executions_frame('collect/store/executions', 'execution', start_dt, end_dt)
+    else:
+        executions = read_csvs('collect/executions', start_dt, end_dt, pattern='execution.*', prefix='execution.',
+                               dtype=execution_dtype, cache_dir=cache_dir)
+        executions.columns = ['timestamp', 'datetime_utc_bitmex', 'side', 'price', 'amount', 'datetime',
+                              'datetime_jst_bitmex']
+        executions = executions.drop(['datetime', 'datetime_utc_bitmex', 'datetime_jst_bitmex'], axis=1)
+        executions['side'] = executions['side'].str.replace(' ', '') # 後で消す
+    ticker, ohlcvs = generate_ticker_and_ohlcvs(executions, candle_types=['1s'])
+    ohlcv = ohlcvs['1s']
+    active_ohlcvs = generate_active_ohlcvs(ohlcv, candle_types=['1m', '5m', '1h'])
+    active_ohlcv_1m = active_ohlcvs['1m']
+    active_ohlcv_5m = active_ohlcvs['5m']
+    active_ohlcv_1h = active_ohlcvs['1h']
+
+    # orderbook（各段は price, amount の順に記録されている）
     header = ['timestamp']
     for i in range(25):
-        for col in ['amount', 'price']:
+        for col in ['price', 'amount']:
             header.append(col + '{0:02d}'.format(i))
-    bids = read_csvs('collect/orderbook/bids', start_dt, end_dt, pattern='bid.*', prefix='bid.')
-    bids.columns = header
-    bids.index = pd.to_datetime(bids.timestamp.apply(lambda x: datetime.fromtimestamp(x / 1000)))
+    if use_store:
+        bids = read_book_frame('collect/store/bids', 'bid', start_dt, end_dt)
+    else:
+        bids = read_csvs('collect/orderbook/bids', start_dt, end_dt, pattern='bid.*', prefix='bid.',
+                         dtype=orderbook_dtype, cache_dir=cache_dir)
+        bids.columns = header
+    bids.index = timestamp2dtindex(bids.timestamp)
     bids = bids.resample('S').last()
     bids = bids.resample('S').ffill()
-    asks = read_csvs('collect/orderbook/asks', start_dt, end_dt, pattern='ask.*', prefix='ask.')
-    asks.columns = header
-    asks.index = pd.to_datetime(asks.timestamp.apply(lambda x: datetime.fromtimestamp(x / 1000)))
+    if use_store:
+        asks = read_book_frame('collect/store/asks', 'ask', start_dt, end_dt)
+    else:
+        asks = read_csvs('collect/orderbook/asks', start_dt, end_dt, pattern='ask.*', prefix='ask.',
+                         dtype=orderbook_dtype, cache_dir=cache_dir)
+        asks.columns = header
+    asks.index = timestamp2dtindex(asks.timestamp)
     asks = asks.resample('S').last()
     asks = asks.resample('S').ffill()
 
@@ -0,0 +1,85 @@
+'''
+collect/format_data の CSV（format_data.py の出力）をバックテスト用の1つのファイルにまとめる
+バックテストは ResourceManager.from_bundle でこのファイルを読み込む（CSV のパースが不要）
+executions_dirpath を指定すると save_exec.py の約定履歴も一緒にまとめる
+まとめた CSV のサイズと更新時刻をファイルに記録し、is_current で CSV が更新されていないかを確認できる
+'''
+import logging
+
+logger = logging.getLogger('crypto')
+
+import os
+import time
+import pandas as pd
+
+from common.snapshot_store import read_executions
+from trade_tools.rm import ResourceManager
+from trade_tools.dataset import read_bundle_meta
+
+
+def source_files(candle_types=('1m',)):
+    return ['ticker.csv'] + ['ohlcv_{}.csv'.format(candle_type) for candle_type in candle_types] + \
+           ['bids.csv', 'asks.csv', 'inago.csv']
+
+
+def source_stats(dirpath, files):
+    '''
+    戻り値: ファイル名 -> [サイズ, 更新時刻 (ns)]
+    '''
+    stats = {}
+    for file in files:
+        stat = os.stat(os.path.join(dirpath, file))
+        stats[file] = [stat.st_size, stat.st_mtime_ns]
+    return stats
+
+
+def pack_dataset(dirpath, path, candle_types=('1m',), executions_dirpath=None):
+    # 読み込む前に記録する（読み込み中に CSV が書き換えられた場合は次回まとめ直す）
+    sources = source_stats(dirpath, source_files(candle_types))
+    ticker = pd.read_csv(os.path.join(dirpath, 'ticker.csv'))
+    ohlcv_list = {candle_type: pd.read_csv(os.path.join(dirpath, 'ohlcv_{}.csv'.format(candle_type)))
+                  for candle_type in candle_types}
+    bids = pd.read_csv(os.path.join(dirpath, 'bids.csv'))
+    asks = pd.read_csv(os.path.join(dirpath, 'asks.csv'))
+    inago = pd.read_csv(os.path.join(dirpath, 'inago.csv'))
+    executions = None if executions_dirpath is None else read_executions(executions_dirpath, 'execution')
+    rm = ResourceManager(ticker, ohlcv_list, bids, asks, inago, None, executions)
+    rm.to_bundle(path, {'sources': sources, 'executions_dirpath': executions_dirpath})
+
+
+def is_current(path, dirpath):
+    '''
+    path のファイルが dirpath の今の CSV からまとめたものか（サイズ・更新時刻が記録と同じか）
+    '''
+    sources = read_bundle_meta(path).get('sources')
+    if sources is None:
+        return False
+    try:
+        return source_stats(dirpath, list(sources)) == sources
+    except FileNotFoundError:
+        return False
+
+
+def load_bundle(path, dirpath, tm):
+    '''
+    まとめたファイルから ResourceManager を作る。CSV が更新されていた場合はまとめ直してから読み込む
+    （CSV がない場合はまとめたファイルをそのまま使う）
+    '''
+    if not is_current(path, dirpath):
+        meta = read_bundle_meta(path)
+        candle_types = meta.get('candle_types', ['1m'])
+        if all(os.path.exists(os.path.join(dirpath, file)) for file in source_files(candle_types)):
+            logger.warning('{} does not match the CSVs in {}, repacking'.format(path, dirpath))
+            pack_dataset(dirpath, path, candle_types, meta.get('executions_dirpath'))
+        else:
+            logger.warning('CSVs in {} are missing, using {} as is'.format(dirpath, path))
+    return ResourceManager.from_bundle(path, tm)
+
+
+if __name__=='__main__':
+    dirpath = 'collect/format_data'
+    path = 'collect/format_data/dataset.bin'
+    executions_dirpath = None
+    t = time.perf_counter()
+    pack_dataset(dirpath, path, executions_dirpath=executions_dirpath)
+    print('wrote {} ({:.1f} MB) in {:.1f} sec'.format(path, os.path.getsize(path) / 1e6, time.perf_counter() - t))
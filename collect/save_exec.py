@@ -1,5 +1,4 @@
 import logging
-import logging.handlers
 
 # logger
 logger = logging.getLogger('crypto')
@@ -9,15 +8,7 @@ stream_handler = logging.StreamHandler()
 stream_handler.setLevel(logging.DEBUG)
 stream_handler.setFormatter(logging.Formatter('[%(levelname)s] %(asctime)s, %(message)s'))
 logger.addHandler(stream_handler)
-# ファイル出力(debug)
-file_handler = logging.handlers.TimedRotatingFileHandler('collect/executions/execution', when='h', interval=1)
-file_handler.suffix = "%Y%m%d%H%M%S"
-file_handler.setLevel(logging.INFO)
-file_handler.setFormatter(logging.Formatter('%(message)s'))
-logger.addHandler(file_handler)
-
-import os
-import csv
+
 import json
 import configparser
 import websocket
@@ -26,6 +17,7 @@ from pytz import timezone
 from dateutil import parser
 
 from common.utils import dt2str
+from common.snapshot_store import ExecutionWriter
 
 
 inifile = configparser.ConfigParser()
@@ -33,6 +25,8 @@ inifile.read('config.ini', 'UTF-8')
 api_key = inifile.get('config', 'api_key')
 api_secret = inifile.get('config', 'api_secret')
 
+writer = ExecutionWriter('collect/store/executions', 'execution')
+
 def on_open(ws):
     # 1分足のデータを要求するために送信するデータ
     channels = {
@@ -43,6 +37,13 @@ def on_open(ws):
     }
     ws.send(json.dumps(channels))
 
+def format_execution(now, d):
+    '''
+    従来のログファイルと同じ now, timestamp, side, price, size, 受信日時, 約定日時(JST) の形式の1行にする（標準出力の確認用）
+    '''
+    timestamp_jst = dt2str(parser.parse(d['timestamp']).astimezone(timezone('Asia/Tokyo')))
+    return '{},{},{},{},{},{},{}'.format(now, d['timestamp'], d['side'], d['price'], d['size'], dt2str(datetime.now()), timestamp_jst)
+
 def on_message(ws, message):
     message = json.loads(message)
 
@@ -51,19 +52,19 @@ def on_message(ws, message):
 
     for d in message['data']:
         now = int(round(datetime.now().timestamp() * 1000))
-        exec_data = [now, d['timestamp'], d['side'], d['price'], d['size']]
-        timestamp_jst = dt2str(parser.parse(d['timestamp']).astimezone(timezone('Asia/Tokyo')))
-        exec_data.append(dt2str(datetime.now()))
-        exec_data.append(timestamp_jst)
-        logger.info('{},{},{},{},{},{},{}'.format(exec_data[0], exec_data[1], exec_data[2], exec_data[3], exec_data[4], exec_data[5], exec_data[6]))
+        exchange_timestamp = int(round(parser.parse(d['timestamp']).timestamp() * 1000))
+        writer.append(now, exchange_timestamp, d['side'], d['price'], d['size'])
+        logger.info(format_execution(now, d))
 
 def on_close(ws):
     print('close')
     # サーバとの切断時に実行する処理
+    writer.close()
 
 def on_error(ws, error):
     print('error')
     # エラー発生時に実行する処理
+    writer.close()
 
 if __name__=='__main__':
     # サーバとのデータのやりとりを表示するため、Trueを指定する。（確認したくないのであればFalseで問題ないです）
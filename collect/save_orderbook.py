@@ -0,0 +1,82 @@
+import logging
+
+# logger
+logger = logging.getLogger('crypto-collect')
+logger.setLevel(logging.DEBUG)
+format = logging.Formatter('[%(levelname)s] %(asctime)s, %(message)s')
+# 標準出力
+stream_handler = logging.StreamHandler()
+stream_handler.setLevel(logging.DEBUG)
+stream_handler.setFormatter(format)
+logger.addHandler(stream_handler)
+
+import json
+import websocket
+from datetime import datetime
+
+from common.orderbook import OrderBookL2
+from common.snapshot_store import BookWriter
+
+book = OrderBookL2()
+bid_writer = BookWriter('collect/store/bids', 'bid')
+ask_writer = BookWriter('collect/store/asks', 'ask')
+
+def on_open(ws):
+    # 板のデータを要求するために送信するデータ
+    channels = {
+        'op': 'subscribe',
+        'args': [
+            'orderBookL2_25:XBTUSD'
+        ]
+    }
+    ws.send(json.dumps(channels))
+
+def format_levels(now, levels):
+    '''
+    timestamp, price00, amount00, price01, amount01, ... の形式の1行にする（標準出力の確認用）
+    '''
+    values = [str(now)]
+    for price, size in levels:
+        values.append(str(price))
+        values.append(str(size))
+    return ','.join(values)
+
+def on_message(ws, message):
+    message = json.loads(message)
+
+    if 'data' not in message:
+        return
+
+    if 'table' in message:
+        # bids, asks で同じタイムスタンプを使う
+        now = int(round(datetime.now().timestamp() * 1000))
+        book.apply(message)
+        bid_writer.append(now, book.bids)
+        ask_writer.append(now, book.asks)
+        logger.info('bids ' + format_levels(now, book.bids))
+        logger.info('asks ' + format_levels(now, book.asks))
+
+def on_close(ws):
+    print('close')
+    bid_writer.close()
+    ask_writer.close()
+
+def on_error(ws, error):
+    import sys
+    bid_writer.close()
+    ask_writer.close()
+    sys.exit()
+
+if __name__=='__main__':
+    # サーバとのデータのやりとりを表示するため、Trueを指定する。（確認したくないのであればFalseで問題ないです）
+    websocket.enableTrace(True)
+
+    # 接続先URLと各コールバック関数を引数に指定して、WebSocketAppのインスタンスを作成
+    ws = websocket.WebSocketApp(url='wss://www.bitmex.com/realtime',
+                                on_open=on_open,
+                                on_message=on_message,
+                                on_close=on_close,
+                                on_error=on_error)
+
+    # BitMEXのサーバへ接続する
+    ws.run_forever()
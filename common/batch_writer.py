@@ -0,0 +1,201 @@
+'''
+MySQL への INSERT をキューにためて、バックグラウンドのスレッドで executemany + commit でまとめて書き込む
+'''
+import logging
+
+logger = logging.getLogger('crypto')
+
+import time
+import queue
+import threading
+import collections
+import mysql.connector
+
+from common.metrics import LatencyStats
+
+_STOP = object()
+
+# 接続し直せば書き込めるエラー（それ以外は行の値や INSERT 文の問題）
+RETRY_ERRORS = (mysql.connector.errors.OperationalError, mysql.connector.errors.InterfaceError)
+
+
+class BatchWriter:
+    '''
+    connect: MySQL の接続を返す関数（書き込み用のスレッドだけが使う）
+    query: executemany する INSERT 文
+    max_queue: キューにためる最大の行数。いっぱいの場合 put は最大 put_timeout 秒待ち、空かなければ False を返す
+    batch_size: 1回の commit で書き込む最大の行数
+    接続のエラー (retry_errors) で書き込めない場合は接続し直して retry_interval 秒ごとにやり直す（その間もキューは max_queue 行まで受け付ける）
+    それ以外のエラーはまとめた行を半分ずつに分けて書き込み直し、書き込めない行だけをログに出して捨てる
+    '''
+    def __init__(self, connect, query, max_queue=10000, batch_size=500, put_timeout=0.5, retry_interval=1.0,
+                 retry_errors=RETRY_ERRORS):
+        self.connect = connect
+        self.query = query
+        self.batch_size = batch_size
+        self.put_timeout = put_timeout
+        self.retry_interval = retry_interval
+        self.retry_errors = retry_errors
+        self.queue = queue.Queue(maxsize=max_queue)
+        # close が呼ばれたら立てる（キューがいっぱいで _STOP を入れられなくても書き込み用のスレッドが終わる）
+        self.stopping = threading.Event()
+
+        self.rows = 0
+        self.commits = 0
+        self.rejected = 0
+        self.errors = 0
+        self.dropped = 0
+        self.commit_latency = LatencyStats()
+        # 直近 60 秒の commit の時刻
+        self.commit_times = collections.deque()
+        self.lock = threading.Lock()
+
+        self.conn = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def put(self, row):
+        '''
+        戻り値: キューに入れたか（False ならキューがいっぱい）
+        '''
+        try:
+            self.queue.put(row, timeout=self.put_timeout)
+            return True
+        except queue.Full:
+            # put はリクエストを処理する複数のスレッドから呼ばれる
+            with self.lock:
+                self.rejected += 1
+            return False
+
+    def _take_batch(self):
+        # 1行目は待ち、残りはキューにあるだけ取る
+        while True:
+            try:
+                rows = [self.queue.get(timeout=self.put_timeout)]
+                break
+            except queue.Empty:
+                if self.stopping.is_set():
+                    return [], True
+        while (len(rows) < self.batch_size) and (rows[-1] is not _STOP):
+            try:
+                rows.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        stop = rows[-1] is _STOP
+        if stop:
+            rows.pop()
+        return rows, stop
+
+    def _write(self, rows):
+        if self.conn is None:
+            self.conn = self.connect()
+        cur = self.conn.cursor()
+        try:
+            with self.commit_latency.timer():
+                cur.executemany(self.query, rows)
+                self.conn.commit()
+        except Exception:
+            try:
+                self.conn.rollback()
+            except Exception:
+                pass
+            raise
+        finally:
+            cur.close()
+        self.rows += len(rows)
+        self.commits += 1
+        now = time.time()
+        with self.lock:
+            self.commit_times.append(now)
+            while self.commit_times[0] < now - 60:
+                self.commit_times.popleft()
+
+    def _write_chunks(self, chunks):
+        '''
+        chunks: 書き込む行のリストの deque。書き込んだ（または捨てた）ものから取り除く
+        接続のエラーはそのまま送出する（書き込んでいない行は chunks に残る）
+        '''
+        while len(chunks) > 0:
+            rows = chunks[0]
+            if self.conn is None:
+                self.conn = self.connect()
+            try:
+                self._write(rows)
+            except self.retry_errors:
+                raise
+            except Exception:
+                self.errors += 1
+                chunks.popleft()
+                if len(rows) == 1:
+                    self.dropped += 1
+                    logger.exception('dropped row: {}'.format(rows[0]))
+                else:
+                    # どの行が悪いかわからないので半分ずつ書き込み直す
+                    half = len(rows) // 2
+                    chunks.appendleft(rows[half:])
+                    chunks.appendleft(rows[:half])
+                continue
+            chunks.popleft()
+
+    def _run(self):
+        stop = False
+        while not stop:
+            rows, stop = self._take_batch()
+            chunks = collections.deque([rows] if len(rows) > 0 else [])
+            while len(chunks) > 0:
+                try:
+                    self._write_chunks(chunks)
+                    break
+                except Exception:
+                    self.errors += 1
+                    logger.exception('failed to write {} rows'.format(sum(len(rows) for rows in chunks)))
+                    self._close_connection()
+                    if stop or self.stopping.is_set():
+                        # 終了時は1回だけやり直す
+                        try:
+                            self._write_chunks(chunks)
+                        except Exception:
+                            dropped = sum(len(rows) for rows in chunks)
+                            self.dropped += dropped
+                            logger.error('dropped {} rows'.format(dropped))
+                        break
+                    # close が呼ばれたら待たずにやり直す
+                    self.stopping.wait(self.retry_interval)
+        self._close_connection()
+
+    def _close_connection(self):
+        if self.conn is not None:
+            try:
+                self.conn.close()
+            except Exception:
+                pass
+            self.conn = None
+
+    def close(self, timeout=None):
+        '''
+        キューに残っている行を書き込んでから終了する
+        timeout: 書き込み用のスレッドの終了を待つ最大の秒数（None なら終わるまで待つ）
+        '''
+        self.stopping.set()
+        try:
+            self.queue.put(_STOP, timeout=self.put_timeout)
+        except queue.Full:
+            # キューが空になった時点で stopping を見て終了する
+            pass
+        self.thread.join(timeout)
+
+    def metrics(self):
+        now = time.time()
+        with self.lock:
+            commits_per_sec = sum(1 for t in self.commit_times if t >= now - 60) / 60
+            rejected = self.rejected
+        return {
+            'rows': self.rows,
+            'commits': self.commits,
+            'commits_per_sec': commits_per_sec,
+            'queued': self.queue.qsize(),
+            'rejected': rejected,
+            'errors': self.errors,
+            'dropped': self.dropped,
+            'commit_latency': self.commit_latency.summary(),
+        }
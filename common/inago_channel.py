@@ -0,0 +1,146 @@
+'''
+inago_server が受け付けたイナゴを Unix ドメインソケットでボットに配信する
+メッセージは1行1シグナルの JSON。MySQL への保存は記録用としてそのまま行い、ボットはこちらで即座に受け取る
+'''
+import logging
+
+logger = logging.getLogger('crypto')
+
+import os
+import json
+import time
+import select
+import socket
+import threading
+
+from common.metrics import LatencyStats
+
+SOCKET_PATH = '/tmp/crypto_inago.sock'
+
+
+class InagoPublisher:
+    '''
+    購読しているボットにシグナルを送る
+    送信できない（切断された、または send_timeout 秒以内に送れない）購読者は外す
+    '''
+    def __init__(self, path=SOCKET_PATH, send_timeout=0.1):
+        self.path = path
+        self.send_timeout = send_timeout
+        if os.path.exists(path):
+            os.unlink(path)
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(path)
+        self.server.listen(8)
+        self.subscribers = []
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self._accept, daemon=True)
+        self.thread.start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                # close した
+                break
+            conn.settimeout(self.send_timeout)
+            with self.lock:
+                self.subscribers.append(conn)
+            logger.debug('inago subscriber connected')
+
+    def publish(self, signal):
+        '''
+        signal: JSON にできる dict（送信時刻 published を追加する）
+        戻り値: 送信できた購読者の数
+        '''
+        data = (json.dumps(dict(signal, published=time.time())) + '\n').encode('utf-8')
+        with self.lock:
+            subscribers = []
+            for conn in self.subscribers:
+                try:
+                    conn.sendall(data)
+                    subscribers.append(conn)
+                except OSError:
+                    conn.close()
+                    logger.debug('inago subscriber disconnected')
+            self.subscribers = subscribers
+        return len(subscribers)
+
+    def close(self):
+        self.server.close()
+        with self.lock:
+            for conn in self.subscribers:
+                conn.close()
+            self.subscribers = []
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class InagoSubscriber:
+    '''
+    InagoPublisher からシグナルを受け取る
+    接続できない間は retry_interval 秒ごとに接続し直す
+    latency: 送信から受信までの時間
+    '''
+    def __init__(self, path=SOCKET_PATH, retry_interval=1.0):
+        self.path = path
+        self.retry_interval = retry_interval
+        self.sock = None
+        self.buffer = b''
+        self.next_retry = 0
+        self.latency = LatencyStats()
+
+    def connect(self):
+        '''
+        戻り値: 接続しているか
+        '''
+        if self.sock is not None:
+            return True
+        if time.time() < self.next_retry:
+            return False
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            self.next_retry = time.time() + self.retry_interval
+            return False
+        sock.setblocking(False)
+        self.sock = sock
+        self.buffer = b''
+        logger.debug('subscribed inago channel: {}'.format(self.path))
+        return True
+
+    def poll(self, timeout=0):
+        '''
+        最大 timeout 秒待って、受信したシグナルを返す（シグナルが届いた時点で返す）
+        戻り値: シグナル (dict) のリスト。接続していなければ待たずに空のリスト
+        '''
+        if not self.connect():
+            return []
+        readable, _, _ = select.select([self.sock], [], [], timeout)
+        if len(readable) == 0:
+            return []
+        try:
+            data = self.sock.recv(65536)
+        except OSError:
+            data = b''
+        if len(data) == 0:
+            logger.debug('inago channel is closed')
+            self.close()
+            return []
+
+        lines = (self.buffer + data).split(b'\n')
+        self.buffer = lines[-1]
+        now = time.time()
+        signals = []
+        for line in lines[:-1]:
+            signal = json.loads(line.decode('utf-8'))
+            self.latency.add(now - signal['published'])
+            signals.append(signal)
+        return signals
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
@@ -0,0 +1,62 @@
+'''
+処理時間などの計測値を集計する
+'''
+import time
+import threading
+import collections
+import numpy as np
+
+
+class LatencyStats:
+    '''
+    処理時間を記録し、件数・平均・パーセンタイルを返す
+    パーセンタイルは直近 window 件から計算する。複数のスレッドから記録できる
+    '''
+    def __init__(self, window=10000):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = collections.deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def add(self, elapsed):
+        '''
+        elapsed: 処理時間（秒）
+        '''
+        with self.lock:
+            self.count += 1
+            self.total += elapsed
+            self.max = max(self.max, elapsed)
+            self.recent.append(elapsed)
+
+    def timer(self):
+        return _Timer(self)
+
+    def summary(self):
+        '''
+        戻り値: 件数と、平均・p50・p99・最大の処理時間（マイクロ秒）
+        '''
+        with self.lock:
+            count, total, max_elapsed = self.count, self.total, self.max
+            recent = np.array(self.recent)
+        summary = {'count': count, 'mean_us': float('nan'), 'p50_us': float('nan'), 'p99_us': float('nan'),
+                   'max_us': max_elapsed * 1e6}
+        if count > 0:
+            summary['mean_us'] = total / count * 1e6
+            summary['p50_us'] = float(np.percentile(recent, 50)) * 1e6
+            summary['p99_us'] = float(np.percentile(recent, 99)) * 1e6
+        return summary
+
+
+class _Timer:
+    # with stats.timer(): ... で処理時間を記録する
+    def __init__(self, stats):
+        self.stats = stats
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.stats.add(time.perf_counter() - self.start)
+        return False
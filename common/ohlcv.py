@@ -0,0 +1,157 @@
+import numpy as np
+import pandas as pd
+
+from common.utils import timestamp2dtindex
+
+CANDLE_MILLISECONDS = {'1m': 60 * 1000, '5m': 60 * 5 * 1000, '1h': 60 * 60 * 1000}
+COLUMNS = ['open', 'high', 'low', 'close', 'volume', 'timestamp']
+
+
+def _active_arrays(values, div, state=None):
+    '''
+    1秒足の配列から未確定足を計算する
+    values: (n, 6) の配列 (open, high, low, close, volume, timestamp)
+    div: 足の長さ（ミリ秒）
+    state: 直前に計算した足の状態（bucket, open, high, low, close, volume）。続きから計算する場合に渡す
+    '''
+    open, high, low, close, volume, timestamp = [values[:, i] for i in range(6)]
+    n = len(timestamp)
+    bucket = (timestamp // div).astype(np.int64)
+
+    # 足ごとの累積 max / min / sum
+    active_high = pd.Series(high).groupby(bucket).cummax().values
+    active_low = pd.Series(low).groupby(bucket).cummin().values
+    active_volume = pd.Series(volume).groupby(bucket).cumsum().values
+    # 足の始値は各足の先頭行の open
+    is_first = np.ones(n, dtype=bool)
+    is_first[1:] = bucket[1:] != bucket[:-1]
+    active_open = open[np.maximum.accumulate(np.where(is_first, np.arange(n), 0))]
+
+    # 前回の続きの足は前回までの値とまとめる
+    if (state is not None) and (n > 0):
+        cont = bucket == state['bucket']
+        active_open = np.where(cont, state['open'], active_open)
+        active_high = np.where(cont, np.fmax(active_high, state['high']), active_high)
+        active_low = np.where(cont, np.fmin(active_low, state['low']), active_low)
+        active_volume = np.where(cont, active_volume + state['volume'], active_volume)
+
+    active = np.column_stack([active_open, active_high, active_low, close, active_volume, timestamp])
+    # 最後の行の高値・安値が NaN でも続きを正しく計算できるように、状態は NaN を除いて集計する
+    return active, _fold_state(values, div, state)
+
+
+def _fmax(a, b):
+    # np.fmax と同じく NaN でない方を返す（スカラー用）
+    return b if a != a else (a if (b != b) or (a >= b) else b)
+
+
+def _fmin(a, b):
+    return b if a != a else (a if (b != b) or (a <= b) else b)
+
+
+def _fold_state(values, div, state=None):
+    '''
+    _active_arrays と同じ計算で、1秒足を反映した最新の足の状態だけを返す（途中の時点の足は作らない）
+    最新の足に入る1秒足だけを見るので、計算量は新しい1秒足の数によらずその足の中の行数まで
+    values: 時刻順の (n, 6) の配列 (open, high, low, close, volume, timestamp)
+    '''
+    n = len(values)
+    if n == 0:
+        return state
+    bucket = int(values[n - 1, 5] // div)
+    if n == 1:
+        open, high, low, close, volume, _ = values[0].tolist()
+    else:
+        # 最新の足に入る1秒足
+        rows = values[int(values[:, 5].searchsorted(bucket * div, side='left')):]
+        open = float(rows[0, 0])
+        high = float(np.fmax.reduce(rows[:, 1]))
+        low = float(np.fmin.reduce(rows[:, 2]))
+        close = float(rows[-1, 3])
+        volume = rows[:, 4]
+        # NaN を除いた合計（np.nansum より速い）
+        volume = float(volume[volume == volume].sum())
+    if (state is not None) and (state['bucket'] == bucket):
+        open = state['open']
+        high = _fmax(high, state['high'])
+        low = _fmin(low, state['low'])
+        volume = volume + state['volume']
+    return {'bucket': bucket, 'open': open, 'high': high, 'low': low, 'close': close, 'volume': volume}
+
+
+def _to_frame(active):
+    active_ohlcv = pd.DataFrame(active, columns=COLUMNS)
+    active_ohlcv.index = timestamp2dtindex(active_ohlcv.timestamp)
+    return active_ohlcv
+
+
+def generate_active_ohlcvs(df, candle_types):
+    '''
+    1秒足から未確定足を含むOHLCVを複数の時間足についてまとめて作成
+    df: DataFrame (index: datetimeindex, column: open, high, low, close, volume, timestamp)
+    candle_types: ['1m', '5m', '1h'] の部分集合
+    戻り値: candle_type -> DataFrame (各行はその時点での未確定足)
+    '''
+    values = df[COLUMNS].values.astype(np.float64)
+    return {candle_type: _to_frame(_active_arrays(values, CANDLE_MILLISECONDS[candle_type])[0])
+            for candle_type in candle_types}
+
+
+class ActiveOHLCV:
+    '''
+    1秒足を受け取るたびに未確定足を更新する（generate_active_ohlcvs と同じ計算を続きから行う）
+    過去の1秒足は保持せず、各時間足の最新の足の状態だけを持つ
+    バックテスト (ResourceManager) では ticker の1秒足を、本番 (API) では1秒ごとの最終取引価格を渡す
+    '''
+    def __init__(self, candle_types):
+        self.candle_types = candle_types
+        self.states = {candle_type: None for candle_type in candle_types}
+
+    def update_arrays(self, values):
+        '''
+        values: 新しい1秒足の (n, 6) の配列 (open, high, low, close, volume, timestamp)
+        戻り値: candle_type -> 新しい1秒足の時点ごとの未確定足の配列
+        '''
+        values = np.asarray(values, dtype=np.float64).reshape(-1, 6)
+        active_arrays = {}
+        for candle_type in self.candle_types:
+            active_arrays[candle_type], self.states[candle_type] = _active_arrays(
+                values, CANDLE_MILLISECONDS[candle_type], self.states[candle_type])
+        return active_arrays
+
+    def fold_arrays(self, values):
+        '''
+        新しい1秒足を反映して最新の未確定足だけを更新する（update_arrays と違い途中の時点の足は作らない）
+        values: 新しい1秒足の (n, 6) の配列 (open, high, low, close, volume, timestamp)
+        '''
+        values = np.asarray(values, dtype=np.float64).reshape(-1, 6)
+        for candle_type in self.candle_types:
+            self.states[candle_type] = _fold_state(values, CANDLE_MILLISECONDS[candle_type], self.states[candle_type])
+
+    def update(self, df):
+        '''
+        df: 新しい1秒足 (column: open, high, low, close, volume, timestamp)
+        戻り値: candle_type -> DataFrame (新しい1秒足の時点ごとの未確定足)
+        '''
+        active_arrays = self.update_arrays(df[COLUMNS].values)
+        return {candle_type: _to_frame(active) for candle_type, active in active_arrays.items()}
+
+    def current(self, candle_type):
+        '''
+        最新の未確定足 (open, high, low, close, volume) を返す
+        '''
+        state = self.states[candle_type]
+        if state is None:
+            return None
+        return state['open'], state['high'], state['low'], state['close'], state['volume']
+
+    def candle(self, candle_type):
+        '''
+        最新の未確定足を取引所の fetch_ohlcv と同じ [unixtime(ms), open, high, low, close, volume] の形式で返す
+        unixtime は足の始まり
+        '''
+        state = self.states[candle_type]
+        if state is None:
+            return None
+        return [int(state['bucket']) * CANDLE_MILLISECONDS[candle_type], float(state['open']), float(state['high']),
+                float(state['low']), float(state['close']), float(state['volume'])]
@@ -0,0 +1,95 @@
+import bisect
+
+
+class OrderBookL2:
+    '''
+    BitMEX orderBookL2 の板を保持する
+    各レベルは id をキーに管理し、bids / asks は最良気配から順に並んだ状態を
+    partial / update / insert / delete のたびに逐次（二分探索で）更新する
+    bids: 価格の高い順、asks: 価格の低い順
+    '''
+    SIDES = ('Buy', 'Sell')
+
+    def __init__(self):
+        self.id_and_price = {}
+        # side -> 並び替え用キーのソート済みリスト（最良気配が先頭）
+        self._keys = {side: [] for side in self.SIDES}
+        # side -> [price, size] のリスト（_keys と同じ並び）
+        self._levels = {side: [] for side in self.SIDES}
+        # id -> [price, size]（_levels と同じオブジェクトを参照する）
+        self._by_id = {}
+
+    @staticmethod
+    def _sort_key(side, price):
+        return -price if side == 'Buy' else price
+
+    def _insert(self, d):
+        side = d['side']
+        level = [d['price'], d['size']]
+        key = self._sort_key(side, d['price'])
+        pos = bisect.bisect_left(self._keys[side], key)
+        self._keys[side].insert(pos, key)
+        self._levels[side].insert(pos, level)
+        self._by_id[d['id']] = level
+        self.id_and_price[d['id']] = d['price']
+
+    def _update(self, d):
+        # 価格は変わらないので並び替えは不要
+        self._by_id[d['id']][1] = d['size']
+
+    def _delete(self, d):
+        side = d['side']
+        price = self.id_and_price.pop(d['id'])
+        self._by_id.pop(d['id'])
+        pos = bisect.bisect_left(self._keys[side], self._sort_key(side, price))
+        del self._keys[side][pos]
+        del self._levels[side][pos]
+
+    def clear(self):
+        self.id_and_price.clear()
+        self._by_id.clear()
+        for side in self.SIDES:
+            self._keys[side] = []
+            self._levels[side] = []
+
+    def apply(self, message):
+        '''
+        orderBookL2 のメッセージを板に反映する
+        '''
+        action = message['action']
+        if action == 'partial':
+            self.clear()
+            for d in message['data']:
+                self._insert(d)
+        elif action == 'update':
+            for d in message['data']:
+                self._update(d)
+        elif action == 'insert':
+            for d in message['data']:
+                self._insert(d)
+        elif action == 'delete':
+            for d in message['data']:
+                self._delete(d)
+        return self
+
+    @property
+    def bids(self):
+        return self._levels['Buy']
+
+    @property
+    def asks(self):
+        return self._levels['Sell']
+
+    def best_bid(self):
+        return self._levels['Buy'][0] if self._levels['Buy'] else None
+
+    def best_ask(self):
+        return self._levels['Sell'][0] if self._levels['Sell'] else None
+
+    def top(self, side, n):
+        '''
+        最良気配から n 件の [price, size] を返す
+        side: 'bids' or 'asks'
+        '''
+        levels = self.bids if side == 'bids' else self.asks
+        return levels[:n]
@@ -0,0 +1,178 @@
+'''
+板・約定履歴を固定長のバイナリレコードとして1時間ごとのセグメントファイルに追記する
+セグメント: <dirpath>/<prefix>.%Y%m%d%H%M%S.bin（ファイル名は開始時刻）
+読み込みは np.memmap で行うため CSV のパースが不要
+'''
+import os
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+
+DEPTH = 25
+SEGMENT_SUFFIX = '.bin'
+SEGMENT_FORMAT = '%Y%m%d%H%M%S'
+
+SIDE_BUY = 1
+SIDE_SELL = -1
+
+
+def book_dtype(depth=DEPTH):
+    return np.dtype([('timestamp', '<i8'), ('price', '<f8', (depth,)), ('size', '<f8', (depth,))])
+
+
+EXECUTION_DTYPE = np.dtype([('timestamp', '<i8'), ('exchange_timestamp', '<i8'), ('side', 'i1'),
+                            ('price', '<f8'), ('amount', '<f8')])
+
+
+def segment_start(timestamp):
+    dt = datetime.fromtimestamp(timestamp / 1000)
+    return datetime(dt.year, dt.month, dt.day, dt.hour)
+
+
+class SegmentWriter:
+    '''
+    レコードを1時間ごとのセグメントファイルに追記する
+    '''
+    def __init__(self, dirpath, prefix, dtype):
+        self.dirpath = dirpath
+        self.prefix = prefix
+        self.dtype = dtype
+        self._record = np.zeros(1, dtype=dtype)
+        self._file = None
+        self._segment_end = None
+        os.makedirs(dirpath, exist_ok=True)
+
+    def _rotate(self, timestamp):
+        self.close()
+        start = segment_start(timestamp)
+        filename = '{}.{}{}'.format(self.prefix, start.strftime(SEGMENT_FORMAT), SEGMENT_SUFFIX)
+        self._file = open(os.path.join(self.dirpath, filename), 'ab')
+        self._segment_end = (start + timedelta(hours=1)).timestamp() * 1000
+
+    def write_record(self):
+        timestamp = int(self._record['timestamp'][0])
+        if (self._file is None) or (timestamp >= self._segment_end):
+            self._rotate(timestamp)
+        self._file.write(self._record.tobytes())
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class BookWriter(SegmentWriter):
+    '''
+    板の片側（最良気配から depth 段）を書き込む
+    depth に満たない段は NaN で埋める
+    '''
+    def __init__(self, dirpath, prefix, depth=DEPTH):
+        super(BookWriter, self).__init__(dirpath, prefix, book_dtype(depth))
+        self.depth = depth
+
+    def append(self, timestamp, levels):
+        record = self._record[0]
+        record['timestamp'] = timestamp
+        record['price'] = np.nan
+        record['size'] = np.nan
+        n = min(len(levels), self.depth)
+        if n > 0:
+            values = np.asarray(levels[:n], dtype=np.float64)
+            record['price'][:n] = values[:, 0]
+            record['size'][:n] = values[:, 1]
+        self.write_record()
+
+
+class ExecutionWriter(SegmentWriter):
+    '''
+    約定履歴を書き込む
+    side: 'Buy' or 'Sell'
+    '''
+    def __init__(self, dirpath, prefix):
+        super(ExecutionWriter, self).__init__(dirpath, prefix, EXECUTION_DTYPE)
+
+    def append(self, timestamp, exchange_timestamp, side, price, amount):
+        record = self._record[0]
+        record['timestamp'] = timestamp
+        record['exchange_timestamp'] = exchange_timestamp
+        record['side'] = SIDE_BUY if side == 'Buy' else SIDE_SELL
+        record['price'] = price
+        record['amount'] = amount
+        self.write_record()
+
+
+def list_segments(dirpath, prefix, start_dt=None, end_dt=None):
+    '''
+    start_dt ~ end_dt と重なるセグメントを返す（ファイル名の時刻だけで絞り込む）
+    '''
+    segments = []
+    head = prefix + '.'
+    for file in sorted(os.listdir(dirpath)):
+        if not (file.startswith(head) and file.endswith(SEGMENT_SUFFIX)):
+            continue
+        dt = datetime.strptime(file[len(head):-len(SEGMENT_SUFFIX)], SEGMENT_FORMAT)
+        if (start_dt is not None) and (dt + timedelta(hours=1) <= start_dt):
+            continue
+        if (end_dt is not None) and (end_dt < dt):
+            continue
+        segments.append(os.path.join(dirpath, file))
+    return segments
+
+
+def read_segments(dirpath, prefix, dtype, start_dt=None, end_dt=None):
+    '''
+    セグメントを memmap で読み込み、レコードの配列を返す
+    書き込み途中の末尾レコードは無視する
+    '''
+    records = []
+    for path in list_segments(dirpath, prefix, start_dt, end_dt):
+        n = os.path.getsize(path) // dtype.itemsize
+        if n > 0:
+            records.append(np.memmap(path, dtype=dtype, mode='r', shape=(n,)))
+    if len(records) == 0:
+        return np.zeros(0, dtype=dtype)
+    if len(records) == 1:
+        return records[0]
+    return np.concatenate(records)
+
+
+def read_book(dirpath, prefix, start_dt=None, end_dt=None, depth=DEPTH):
+    '''
+    timestamp: (n,), price: (n, depth), size: (n, depth) の配列を返す
+    '''
+    records = read_segments(dirpath, prefix, book_dtype(depth), start_dt, end_dt)
+    return records['timestamp'], records['price'], records['size']
+
+
+def read_book_frame(dirpath, prefix, start_dt=None, end_dt=None, depth=DEPTH):
+    '''
+    format_data.py の CSV と同じ列（timestamp, price00, amount00, ...）の DataFrame を返す
+    '''
+    timestamp, price, size = read_book(dirpath, prefix, start_dt, end_dt, depth)
+    columns = {'timestamp': timestamp}
+    for i in range(depth):
+        col_idx = '{0:02d}'.format(i)
+        columns['price' + col_idx] = price[:, i]
+        columns['amount' + col_idx] = size[:, i]
+    return pd.DataFrame(columns, columns=list(columns.keys()))
+
+
+def read_executions(dirpath, prefix, start_dt=None, end_dt=None):
+    return read_segments(dirpath, prefix, EXECUTION_DTYPE, start_dt, end_dt)
+
+
+def read_executions_frame(dirpath, prefix, start_dt=None, end_dt=None):
+    '''
+    timestamp, side ('Buy' or 'Sell'), price, amount の DataFrame を返す
+    '''
+    records = read_executions(dirpath, prefix, start_dt, end_dt)
+    return pd.DataFrame({
+        'timestamp': records['timestamp'],
+        'side': np.where(records['side'] == SIDE_BUY, 'Buy', 'Sell'),
+        'price': records['price'],
+        'amount': records['amount'],
+    }, columns=['timestamp', 'side', 'price', 'amount'])
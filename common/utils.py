@@ -164,6 +164,32 @@ def str2dt(dt):
 def dt2str(dt):
     return dt.strftime('%Y-%m-%d %H:%M:%S')
 
+def timestamp2dtindex(timestamps):
+    '''
+    ミリ秒の unixtime をローカル時刻の DatetimeIndex に変換する
+    datetime.fromtimestamp(x / 1000) を1行ずつ適用するのと同じ結果になる
+    （UTCオフセットは分単位でしか変わらないので、ユニークな分ごとに1回だけ求める）
+    '''
+    name = getattr(timestamps, 'name', None)
+    timestamps = np.asarray(timestamps).astype(np.int64)
+    minutes, inverse = np.unique(timestamps // 60000, return_inverse=True)
+    epoch = datetime(1970, 1, 1)
+    offsets = np.array([(datetime.fromtimestamp(m * 60) - (epoch + timedelta(minutes=int(m)))) // timedelta(milliseconds=1)
+                        for m in minutes], dtype=np.int64)
+    return pd.DatetimeIndex(pd.to_datetime(timestamps + offsets[inverse], unit='ms'), name=name)
+
+def dtindex2timestamp(index):
+    '''
+    ローカル時刻の DatetimeIndex をミリ秒の unixtime (float) に変換する
+    datetime.timestamp(x) * 1000 を1行ずつ適用するのと同じ結果になる
+    '''
+    local = pd.DatetimeIndex(index).asi8 // 10 ** 6
+    minutes, inverse = np.unique(local // 60000, return_inverse=True)
+    epoch = datetime(1970, 1, 1)
+    offsets = np.array([int(round((epoch + timedelta(minutes=int(m))).timestamp() * 1000)) - m * 60000
+                        for m in minutes], dtype=np.int64)
+    return (local + offsets[inverse]).astype(np.float64)
+
 def format_dt(dt, old_format, new_format):
     if type(dt) == datetime:
         dt = dt2str(dt)
@@ -12,4 +12,4 @@ to_datetime DATETIME NOT NULL,
 PRIMARY KEY (id)
 )
 
-ALTER TABLE inago ADD timestamp BIGINT;
\ No newline at end of file
+ALTER TABLE inago ADD timestamp BIGINT;
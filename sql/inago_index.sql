@@ -0,0 +1,5 @@
+-- inago を to_unix_time（ミリ秒の整数）で範囲検索するためのインデックス
+-- InagoReader は board_name と to_unix_time の範囲で読み込む。保存期間を過ぎた行の削除は to_unix_time で行う
+ALTER TABLE inago
+ADD INDEX idx_board_name_to_unix_time (board_name, to_unix_time),
+ADD INDEX idx_to_unix_time (to_unix_time);
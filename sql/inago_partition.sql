@@ -0,0 +1,7 @@
+-- （任意）inago を to_unix_time で月ごとにパーティション分割する（境界は日本時間の月初）
+-- 古い月は trade/inago_retention.py が DROP PARTITION で削除し、新しい月は pmax を分割して追加する
+-- パーティションの列はすべてのユニークキーに含める必要があるため、主キーを (id, to_unix_time) にする
+ALTER TABLE inago DROP PRIMARY KEY, ADD PRIMARY KEY (id, to_unix_time);
+
+-- パーティションはこの後 python trade/inago_retention.py partition で、最も古い行の月から数か月先まで作る
+-- （月を固定で書くと、その後の行がすべて pmax に入る）
@@ -0,0 +1,30 @@
+import numpy as np
+
+from common.ohlcv import ActiveOHLCV
+
+
+def random_bars(seed, n=5000):
+    rand = np.random.RandomState(seed)
+    timestamp = (1553472000 + np.cumsum(rand.randint(1, 4, n))) * 1000.0
+    close = 4000 + 0.5 * np.cumsum(rand.choice([-1, 0, 1], n))
+    high = close + 0.5 * rand.randint(0, 3, n)
+    low = close - 0.5 * rand.randint(0, 3, n)
+    # 約定がなかった1秒足
+    high[rand.rand(n) < 0.05] = np.nan
+    low[rand.rand(n) < 0.05] = np.nan
+    return np.column_stack([close, high, low, close, rand.rand(n), timestamp])
+
+
+def test_fold_matches_update():
+    for seed in range(5):
+        values = random_bars(seed)
+        rand = np.random.RandomState(seed)
+        updated = ActiveOHLCV(['1m', '5m', '1h'])
+        folded = ActiveOHLCV(['1m', '5m', '1h'])
+        # 1行ずつや数百行ずつなど、いろいろな区切りで渡す
+        cuts = np.sort(rand.choice(np.arange(1, len(values)), 300, replace=False))
+        for chunk in np.split(values, cuts):
+            updated.update_arrays(chunk)
+            folded.fold_arrays(chunk)
+            for candle_type in ['1m', '5m', '1h']:
+                np.testing.assert_allclose(folded.candle(candle_type), updated.candle(candle_type))
@@ -0,0 +1,73 @@
+import time
+import mysql.connector
+
+from common.batch_writer import BatchWriter
+
+
+class FakeConnection:
+    '''
+    BatchWriter の書き込みを確認するための MySQL の接続の代わり
+    bad: 書き込めない行（含むと DataError）
+    lost: 接続が切れる回数（OperationalError）
+    '''
+    def __init__(self, bad=(), lost=0):
+        self.bad = set(bad)
+        self.lost = lost
+        self.rows = []
+        self.pending = []
+
+    def cursor(self):
+        return self
+
+    def executemany(self, query, rows):
+        if self.lost > 0:
+            self.lost -= 1
+            raise mysql.connector.errors.OperationalError('lost connection')
+        if any(row[0] in self.bad for row in rows):
+            raise mysql.connector.errors.DataError('bad row')
+        self.pending = list(rows)
+
+    def commit(self):
+        self.rows += self.pending
+        self.pending = []
+
+    def rollback(self):
+        self.pending = []
+
+    def close(self):
+        pass
+
+
+def test_bad_rows_are_dropped():
+    conn = FakeConnection(bad=[3, 7])
+    writer = BatchWriter(lambda: conn, 'INSERT', retry_interval=0.01)
+    for i in range(10):
+        writer.put([i])
+    writer.close(timeout=5)
+    assert not writer.thread.is_alive()
+    assert sorted(row[0] for row in conn.rows) == [0, 1, 2, 4, 5, 6, 8, 9]
+    assert writer.metrics()['dropped'] == 2
+
+
+def test_connection_errors_are_retried():
+    conn = FakeConnection(lost=2)
+    writer = BatchWriter(lambda: conn, 'INSERT', retry_interval=0.01)
+    for i in range(10):
+        writer.put([i])
+    # close の後は1回しかやり直さないので、書き込まれるまで待つ
+    deadline = time.time() + 5
+    while (writer.rows < 10) and (time.time() < deadline):
+        time.sleep(0.01)
+    writer.close(timeout=5)
+    assert sorted(row[0] for row in conn.rows) == list(range(10))
+    assert writer.metrics()['dropped'] == 0
+
+
+def test_close_does_not_block_on_full_queue():
+    conn = FakeConnection(lost=10 ** 9)
+    writer = BatchWriter(lambda: conn, 'INSERT', max_queue=5, put_timeout=0.01, retry_interval=60)
+    for i in range(10):
+        writer.put([i])
+    writer.close(timeout=5)
+    assert not writer.thread.is_alive()
+    assert len(conn.rows) == 0
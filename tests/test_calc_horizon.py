@@ -0,0 +1,14 @@
+from trade_tools.trade_utils import calc_horizon
+from benchmark.horizon import legacy_calc_horizon, generate_ohlcv, assert_same
+
+
+def test_calc_horizon_matches_legacy():
+    total = 0
+    for seed in range(4):
+        df = generate_ohlcv(80, seed)
+        for min_whisker_len, threshold_whisker_diff in [(0, 0), (0, 1), (1, 0.5)]:
+            expected = legacy_calc_horizon(df, min_whisker_len, threshold_whisker_diff)
+            assert_same(expected, calc_horizon(df, min_whisker_len, threshold_whisker_diff))
+            total += len(expected)
+    # 水平線がほとんどないデータでは比較にならない
+    assert total >= 100
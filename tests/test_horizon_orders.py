@@ -0,0 +1,89 @@
+import numpy as np
+
+from trade.main import replace_orders_by_horizon, trade_inago
+from trade_tools.horizon import HorizonIndex
+
+
+class FakeAPI:
+    '''
+    水平線の指値の入れ直しを確認するための取引所の代わり（価格は price のまま動かない）
+    '''
+    def __init__(self, price=4000.0):
+        self.price = price
+        self.orders = {}
+        self.canceled = []
+        self.fetched = []
+
+    def fetch_ticker(self, pair):
+        return {'close': self.price}
+
+    def fetch_order_book_arrays(self, pair, limit=None):
+        bids = np.array([[self.price - 0.5 - 0.5 * i, 5000.0] for i in range(25)])
+        asks = np.array([[self.price + 0.5 * i, 5000.0] for i in range(25)])
+        return bids, asks, None
+
+    def create_order(self, pair, type, side, amount, price):
+        order = {'id': len(self.orders), 'side': side, 'price': price, 'amount': amount, 'status': 'open'}
+        self.orders[order['id']] = order
+        return dict(order)
+
+    def cancel_order(self, order_id):
+        self.orders[order_id]['status'] = 'canceled'
+        self.canceled.append(order_id)
+        return dict(self.orders[order_id])
+
+    def fetch_order(self, order_id, pair):
+        self.fetched.append(order_id)
+        return dict(self.orders[order_id])
+
+    def fetch_open_orders(self, pair):
+        return [dict(order) for order in self.orders.values() if order['status'] == 'open']
+
+    def fill(self, order_id):
+        self.orders[order_id]['status'] = 'closed'
+
+
+def test_filled_horizon_order_is_replaced():
+    api = FakeAPI()
+    horizons = {3995.0: [], 4005.0: []}
+    horizon_and_order = replace_orders_by_horizon({}, horizons, api, 'BTC/USD')
+    assert sorted(horizon_and_order) == [3995.0, 4005.0]
+    filled = horizon_and_order[3995.0]
+    resting = horizon_and_order[4005.0]
+
+    # 約定した水平線だけに新しい指値を入れ、約定していない指値はそのまま
+    api.fill(filled['id'])
+    horizon_and_order = replace_orders_by_horizon(horizon_and_order, horizons, api, 'BTC/USD')
+    assert horizon_and_order[3995.0]['id'] != filled['id']
+    assert api.orders[horizon_and_order[3995.0]['id']]['status'] == 'open'
+    assert horizon_and_order[4005.0]['id'] == resting['id']
+    assert api.canceled == []
+    # 個別に確認するのは未約定の一覧になかった指値だけ
+    assert api.fetched == [filled['id']]
+
+
+def test_used_horizon_order_is_not_reused():
+    api = FakeAPI()
+    horizons = {3995.0: []}
+    horizon_and_order = replace_orders_by_horizon({}, horizons, api, 'BTC/USD')
+    horder = horizon_and_order[3995.0]
+    api.fill(horder['id'])
+
+    waited = []
+    def wait_inago(order):
+        waited.append(order['id'])
+        return api.fetch_order(order['id'], 'BTC/USD')['status'] == 'closed'
+    wait_doten = lambda order, target_horizon: True
+    api.fetch_current_price = lambda pair, candle_type, since: (api.price, 'buy')
+    params = {'horizon_distance': 10, 'doten_offset': 2}
+
+    trade_inago('sell', api, 'BTC/USD', '1m', None, HorizonIndex(horizons), horizon_and_order, wait_inago, wait_doten,
+                False, params)
+    assert 3995.0 not in horizon_and_order
+    # 同じ指値で2回目の取引はしない
+    assert trade_inago('sell', api, 'BTC/USD', '1m', None, HorizonIndex(horizons), horizon_and_order, wait_inago,
+                       wait_doten, False, params) == 0
+    assert waited == [horder['id']]
+
+    horizon_and_order = replace_orders_by_horizon(horizon_and_order, horizons, api, 'BTC/USD')
+    assert horizon_and_order[3995.0]['id'] != horder['id']
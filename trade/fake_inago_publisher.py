@@ -0,0 +1,55 @@
+'''
+inago_server の代わりに、ランダムなイナゴのシグナルを配信する（inago_server・MySQL なしでボットの動作確認をする用）
+平均 interval 秒ごとに、買い・売りをランダムに選んで InagoPublisher で配信する
+
+usage: python trade/fake_inago_publisher.py
+'''
+import logging
+
+# logger
+logger = logging.getLogger('crypto')
+logger.setLevel(logging.DEBUG)
+format = logging.Formatter('[%(levelname)s] %(asctime)s, %(message)s')
+# 標準出力
+stream_handler = logging.StreamHandler()
+stream_handler.setLevel(logging.DEBUG)
+stream_handler.setFormatter(format)
+logger.addHandler(stream_handler)
+
+import time
+import random
+from datetime import datetime
+
+from common.inago_channel import InagoPublisher, SOCKET_PATH
+
+
+def fake_signal(taker_side, last_price):
+    now = int(round(datetime.now().timestamp() * 1000))
+    return {
+        'board_name': 'BitMEX_XBTUSD',
+        'taker_side': taker_side,
+        'volume': round(random.uniform(100, 1000), 1),
+        'last_price': last_price,
+        'pair_currency': 'XBTUSD',
+        'from_unix_time': now - 10000,
+        'to_unix_time': now,
+        'timestamp': now,
+    }
+
+
+if __name__=='__main__':
+    path = SOCKET_PATH
+    interval = 30
+    last_price = 4000.0
+
+    publisher = InagoPublisher(path)
+    logger.debug('publishing fake inago on {}'.format(path))
+    try:
+        while True:
+            time.sleep(random.expovariate(1 / interval))
+            last_price += random.choice([-0.5, 0, 0.5])
+            signal = fake_signal(random.choice(['buy', 'sell']), last_price)
+            n = publisher.publish(signal)
+            logger.debug('published {} to {} subscribers'.format(signal['taker_side'], n))
+    finally:
+        publisher.close()
@@ -0,0 +1,153 @@
+'''
+inago テーブルから保存期間 (retention_days) を過ぎた行を削除する（cron などで1日1回実行する）
+sql/inago_partition.sql でパーティション分割している場合は、古い月のパーティションを DROP し、
+months_ahead か月先までのパーティションを pmax から分割して追加する
+分割していない場合は to_unix_time のインデックスを使って chunk 行ずつ DELETE する
+partition を指定すると、sql/inago_partition.sql で主キーを変えたテーブルを月ごとのパーティションに分割する
+
+usage: python trade/inago_retention.py [partition]
+'''
+import logging
+
+# logger
+logger = logging.getLogger('crypto')
+logger.setLevel(logging.DEBUG)
+format = logging.Formatter('[%(levelname)s] %(asctime)s, %(message)s')
+# 標準出力
+stream_handler = logging.StreamHandler()
+stream_handler.setLevel(logging.DEBUG)
+stream_handler.setFormatter(format)
+logger.addHandler(stream_handler)
+
+import sys
+import configparser
+import mysql.connector
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+
+
+def month_start(dt, months=0):
+    month = dt.month - 1 + months
+    return datetime(dt.year + month // 12, month % 12 + 1, 1)
+
+
+def to_unix_time(dt):
+    return int(round(dt.timestamp() * 1000))
+
+
+def list_partitions(cur):
+    '''
+    戻り値: [(パーティション名, 上限の to_unix_time（pmax は None）), ...]（上限の順）
+    '''
+    cur.execute('SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS '
+                'WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL '
+                'ORDER BY PARTITION_ORDINAL_POSITION', ('crypto', 'inago'))
+    return [(name, None if description == 'MAXVALUE' else int(description)) for name, description in cur.fetchall()]
+
+
+def drop_old_partitions(cur, partitions, cutoff):
+    # 上限が cutoff 以下のパーティションは全ての行が保存期間を過ぎている
+    names = [name for name, upper in partitions if (upper is not None) and (upper <= cutoff)]
+    if len(names) > 0:
+        cur.execute('ALTER TABLE crypto.inago DROP PARTITION {}'.format(', '.join(names)))
+        logger.debug('dropped partitions: {}'.format(names))
+    return names
+
+
+def month_definitions(first, last, existing=()):
+    '''
+    first ~ last の月（月初の datetime）のうち、existing にない月のパーティションの定義
+    '''
+    definitions = []
+    start = first
+    while start <= last:
+        name = start.strftime('p%Y%m')
+        if name not in existing:
+            definitions.append('PARTITION {} VALUES LESS THAN ({})'.format(name, to_unix_time(month_start(start, 1))))
+        start = month_start(start, 1)
+    return definitions
+
+
+def add_partitions(cur, partitions, now, months_ahead):
+    existing = {name for name, _ in partitions}
+    definitions = month_definitions(month_start(now), month_start(now, months_ahead), existing)
+    if len(definitions) > 0:
+        cur.execute('ALTER TABLE crypto.inago REORGANIZE PARTITION pmax INTO ({}, PARTITION pmax VALUES LESS THAN MAXVALUE)'
+                    .format(', '.join(definitions)))
+        logger.debug('added partitions: {}'.format(definitions))
+    return definitions
+
+
+def partition_table(conn, months_ahead=2, now=None):
+    '''
+    分割していない inago を、最も古い行の月から months_ahead か月先までの月ごとのパーティションと pmax に分割する
+    すでに分割している場合は何もしない
+    '''
+    now = datetime.now() if now is None else now
+    cur = conn.cursor()
+    if len(list_partitions(cur)) > 0:
+        cur.close()
+        logger.debug('inago is already partitioned')
+        return []
+    cur.execute('SELECT MIN(to_unix_time) FROM crypto.inago')
+    oldest = cur.fetchone()[0]
+    first = month_start(now) if oldest is None else month_start(datetime.fromtimestamp(oldest / 1000))
+    definitions = month_definitions(first, month_start(now, months_ahead))
+    cur.execute('ALTER TABLE crypto.inago PARTITION BY RANGE (to_unix_time) ({}, PARTITION pmax VALUES LESS THAN MAXVALUE)'
+                .format(', '.join(definitions)))
+    cur.close()
+    logger.debug('partitioned inago: {}'.format(definitions))
+    return definitions
+
+
+def delete_old_rows(conn, cutoff, chunk=10000):
+    # ロックを長く持たないように少しずつ削除して commit する
+    cur = conn.cursor()
+    deleted = 0
+    while True:
+        cur.execute('DELETE FROM crypto.inago WHERE to_unix_time < %s LIMIT %s', (cutoff, chunk))
+        conn.commit()
+        deleted += cur.rowcount
+        if cur.rowcount < chunk:
+            break
+    cur.close()
+    logger.debug('deleted {} rows'.format(deleted))
+    return deleted
+
+
+def apply_retention(conn, retention_days=30, months_ahead=2, now=None):
+    now = datetime.now() if now is None else now
+    cutoff = to_unix_time(now - timedelta(days=retention_days))
+    cur = conn.cursor()
+    partitions = list_partitions(cur)
+    if len(partitions) > 0:
+        drop_old_partitions(cur, partitions, cutoff)
+        add_partitions(cur, partitions, now, months_ahead)
+        cur.close()
+    else:
+        cur.close()
+        delete_old_rows(conn, cutoff)
+
+
+if __name__=='__main__':
+    retention_days = 30
+    months_ahead = 2
+
+    inifile = configparser.ConfigParser()
+    inifile.read('config.ini', 'UTF-8')
+    user = inifile.get('mysql', 'user')
+    password = inifile.get('mysql', 'password')
+    url = urlparse('mysql://' + user + ':' + password + '@localhost:3306/crypto')
+    conn = mysql.connector.connect(
+        host=url.hostname or 'localhost',
+        port=url.port or 3306,
+        user=url.username or 'root',
+        password=url.password or '',
+        database=url.path[1:],
+    )
+    try:
+        if (len(sys.argv) > 1) and (sys.argv[1] == 'partition'):
+            partition_table(conn, months_ahead)
+        apply_retention(conn, retention_days, months_ahead)
+    finally:
+        conn.close()
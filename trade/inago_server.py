@@ -10,59 +10,195 @@ stream_handler.setLevel(logging.DEBUG)
 stream_handler.setFormatter(format)
 logger.addHandler(stream_handler)
 
-import traceback
+import sys
 import json
+import signal
+import mysql.connector
+import configparser
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from http.server import HTTPServer, BaseHTTPRequestHandler
 from urllib.parse import urlparse
 
 from common.utils import dt2str, dict2str
+from common.inago_channel import InagoPublisher
+from common.batch_writer import BatchWriter
+from common.metrics import LatencyStats
 
-import mysql.connector
-import configparser
 inifile = configparser.ConfigParser()
 inifile.read('config.ini', 'UTF-8')
 user = inifile.get('mysql', 'user')
 password = inifile.get('mysql', 'password')
 url = urlparse('mysql://' + user + ':' + password + '@localhost:3306/crypto')
-conn = mysql.connector.connect(
-    host=url.hostname or 'localhost',
-    port=url.port or 3306,
-    user=url.username or 'root',
-    password=url.password or '',
-    database=url.path[1:],
-)
+account = {
+    'host': url.hostname or 'localhost',
+    'port': url.port or 3306,
+    'user': url.username or 'root',
+    'password': url.password or '',
+    'database': url.path[1:],
+}
+
+INSERT_QUERY = 'INSERT INTO crypto.inago (' \
+               'board_name, taker_side, volume, last_price, pair_currency, from_unix_time, to_unix_time, from_datetime, to_datetime, timestamp)' \
+               'values (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)'
+# リクエストの JSON のキー（INSERT の列の順番）
+INAGO_KEYS = ['boardName', 'takerSide', 'volume', 'lastPrice', 'pairCurrency', 'fromUnixTime', 'toUnixTime']
+
+# ボットへの配信と MySQL への書き込み（__main__ で作成する）
+publisher = None
+writer = None
+request_latency = LatencyStats()
+
+def validate(res):
+    '''
+    リクエストの JSON に INAGO_KEYS のキーがあり、INSERT できる型か（ほかのキーは無視する）
+    戻り値: エラーの内容（問題なければ None）
+    '''
+    if not isinstance(res, dict):
+        return 'payload is not an object'
+    missing = [key for key in INAGO_KEYS if key not in res]
+    if len(missing) > 0:
+        return 'missing keys: {}'.format(missing)
+    for key in ['boardName', 'takerSide', 'pairCurrency']:
+        if not isinstance(res[key], str):
+            return 'invalid {}'.format(key)
+    for key in ['volume', 'lastPrice']:
+        if isinstance(res[key], bool) or not isinstance(res[key], (int, float)):
+            return 'invalid {}'.format(key)
+    try:
+        int(res['fromUnixTime'])
+        int(res['toUnixTime'])
+    except (TypeError, ValueError):
+        return 'invalid unix time'
+    extra = sorted(set(res) - set(INAGO_KEYS))
+    if len(extra) > 0:
+        # InagoFlyer が項目を増やしても受け付ける（to_row は INAGO_KEYS だけを使う）
+        logger.debug('ignored keys: {}'.format(extra))
+    return None
+
+def to_signal(res):
+    board_name, taker_side, volume, last_price, pair_currency, from_unix_time, to_unix_time = [res[key] for key in INAGO_KEYS]
+    return {
+        'board_name': board_name,
+        'taker_side': taker_side,
+        'volume': volume,
+        'last_price': last_price,
+        'pair_currency': pair_currency,
+        'from_unix_time': int(from_unix_time),
+        'to_unix_time': int(to_unix_time),
+        'timestamp': int(round(datetime.now().timestamp() * 1000)),
+    }
+
+def to_row(res):
+    from_datetime = dt2str(datetime.fromtimestamp(int(res['fromUnixTime']) / 1000))
+    to_datetime = dt2str(datetime.fromtimestamp(int(res['toUnixTime']) / 1000))
+    now = int(round(datetime.now().timestamp() * 1000))
+    # JSON のキーの順番によらず INSERT の列の順番にする
+    return [res[key] for key in INAGO_KEYS] + [from_datetime, to_datetime, now]
+
+def metrics():
+    return {'request_latency': request_latency.summary(), 'writer': writer.metrics() if writer is not None else None}
+
+class PooledHTTPServer(HTTPServer):
+    '''
+    接続ごとのリクエストを workers 個のスレッドで並行して処理する HTTPServer
+    遅いクライアントや書き込みがあっても他の接続のリクエストは待たされない
+    '''
+    # 同時に接続してきたクライアントを取りこぼさないように accept 待ちを増やす
+    request_queue_size = 128
+
+    def __init__(self, server_address, handler_class, workers=8):
+        super(PooledHTTPServer, self).__init__(server_address, handler_class)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self._process_request, request, client_address)
+
+    def _process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super(PooledHTTPServer, self).server_close()
+        self.executor.shutdown(wait=True)
 
 class InagoHandler(BaseHTTPRequestHandler):
+    # keep-alive で同じ接続のリクエストを続けて処理する（応答には必ず Content-Length を付ける）
+    protocol_version = 'HTTP/1.1'
+    # 何も送ってこない接続は timeout 秒で切断してスレッドを空ける
+    timeout = 10
+    # ヘッダと本文を分けて送るので Nagle を無効にする（keep-alive で遅延 ACK を待たない）
+    disable_nagle_algorithm = True
+
     def save_response(self, res):
-        # クエリを作成
-        query = 'INSERT INTO crypto.inago (' \
-                'board_name, taker_side, volume, last_price, pair_currency, from_unix_time, to_unix_time, from_datetime, to_datetime, timestamp)' \
-                'values (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s);'
-        from_datetime = dt2str(datetime.fromtimestamp(int(res['fromUnixTime']) / 1000))
-        to_datetime = dt2str(datetime.fromtimestamp(int(res['toUnixTime']) / 1000))
-        now = int(round(datetime.now().timestamp() * 1000))
-        insert_data = list(res.values()) + [from_datetime, to_datetime, now]
-        cur = conn.cursor()
-        try:
-            # クエリを実行
-            cur.execute(query, insert_data)
-            conn.commit()
-        except:
-            conn.rollback()
-            logger.error(traceback.format_exc())
-            raise Exception
-        cur.close()
+        '''
+        書き込みのキューに入れる（commit は待たない）
+        戻り値: キューに入れたか
+        '''
+        return writer.put(to_row(res))
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
 
     def do_POST(self):
-        content_len = int(self.headers.get('content-length'))
-        res = json.loads(self.rfile.read(content_len).decode('utf-8'))
+        with request_latency.timer():
+            content_len = int(self.headers.get('content-length'))
+            try:
+                res = json.loads(self.rfile.read(content_len).decode('utf-8'))
+                error = validate(res)
+            except ValueError:
+                error = 'invalid json'
+            if error is not None:
+                # 書き込めない行はキューに入れずに 400 を返す
+                logger.error('invalid request: {}'.format(error))
+                self.send_json(400, {'status': 'error', 'error': error})
+                return
+
+            status = 200
+            if res['boardName'] == 'BitMEX_XBTUSD':
+                logger.debug('save response: {}'.format(dict2str(res)))
+                # MySQL の書き込みのキューに入れてからボットに配信する
+                # （キューがいっぱいで 503 を返すとクライアントが送り直すので、その場合は配信しない）
+                if not self.save_response(res):
+                    # 書き込みが追いつかずキューがいっぱい
+                    logger.error('inago queue is full')
+                    status = 503
+                elif publisher is not None:
+                    publisher.publish(to_signal(res))
+            self.send_json(status, {'status': 'ok' if status == 200 else 'busy'})
+
+    def do_GET(self):
+        if self.path == '/metrics':
+            self.send_json(200, metrics())
+        else:
+            self.send_json(404, {'status': 'not found'})
 
-        if res['boardName'] == 'BitMEX_XBTUSD':
-            logger.debug('save response: {}'.format(dict2str(res)))
-            self.save_response(res)
+    def log_message(self, format, *args):
+        # リクエストごとのアクセスログは出さない
+        pass
 
 if __name__=='__main__':
     server_address = ('localhost', 8080)
-    httpd = HTTPServer(server_address, InagoHandler)
-    httpd.serve_forever()
\ No newline at end of file
+    # リクエストを処理するスレッドの数
+    workers = 8
+    publisher = InagoPublisher()
+    writer = BatchWriter(lambda: mysql.connector.connect(**account), INSERT_QUERY)
+    httpd = PooledHTTPServer(server_address, InagoHandler, workers)
+    # kill でも finally でキューを書き込んでから終了する
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        httpd.serve_forever()
+    finally:
+        httpd.server_close()
+        writer.close()
+        publisher.close()
+        logger.debug('metrics: {}'.format(metrics()))
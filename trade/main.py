@@ -20,10 +20,16 @@ import pandas as pd
 from datetime import datetime, timedelta
 
 from common.utils import dt2str, str2timestamp, merge_dicts
-from trade_tools.trade_utils import calc_horizon, format_orderbook, get_orderbook_around_horizon, get_horizon_closest_to_price
+from common.snapshot_store import read_executions
+from common.inago_channel import InagoSubscriber
+from trade_tools.horizon import HorizonTracker, HorizonIndex
+from trade_tools.orderbook import ArrayOrderBook
 from trade_tools.my_api import APISim, API
+from trade_tools.ledger import Ledger
 from trade_tools.rm import ResourceManager
 from trade_tools.tm import TimeManager
+from trade_tools.backtest import EventQueue
+from collect.pack_dataset import load_bundle
 
 inifile = configparser.ConfigParser()
 inifile.read('config.ini', 'UTF-8')
@@ -38,35 +44,51 @@ account = {
     'database': url.path[1:]
 }
 
-def calc_order_price(horizon, orderbook, scope=3, threshold=10000, shift=0.5):
-    # ライン付近の板を取得
-    near_orderbook = get_orderbook_around_horizon(orderbook, horizon, scope)
-
-    # 求めた範囲内の注文数を計算
-    total_order_num = near_orderbook.sum()['order_num']
+# 戦略のパラメータ
+DEFAULT_PARAMS = {
+    # 指値の価格: ラインに最も近い段から前後 scope 段の注文数が threshold を超えたら、最大の板の shift 内側に指値を入れる
+    'scope': 3,
+    'threshold': 10000,
+    'shift': 0.5,
+    # 指値の約定を待つ最大の時間（秒）
+    'max_wait_time': 300,
+    # イナゴ発動時にラインと現在価格の距離がこれ未満なら取引する
+    'horizon_distance': 10,
+    # ドテンの指値を現在価格からずらす幅
+    'doten_offset': 2,
+    # 水平線の計算 (calc_horizon)
+    'min_whisker_len': 0,
+    'threshold_whisker_diff': 0,
+}
 
-    # 注文数が閾値を超えたら注文する
-    order_price = -1
-    if total_order_num > threshold:
-        # 求めた範囲で最大の板の少し内側を注文価格とする
-        orderbook_max = orderbook[orderbook.index == near_orderbook['order_num'].idxmax()]
-        if orderbook_max['side'].values == 'bids':
-            order_price = (orderbook_max['price'] + shift).iloc[0]
-        else:
-            order_price = (orderbook_max['price'] - shift).iloc[0]
-    return order_price
+def load_dataset(dirpath='collect/format_data'):
+    '''
+    バックテスト用のデータを読み込む
+    戻り値: ticker, ohlcv_list, bids, asks, inago
+    '''
+    ticker = pd.read_csv(os.path.join(dirpath, 'ticker.csv'))
+    ohlcv_1m = pd.read_csv(os.path.join(dirpath, 'ohlcv_1m.csv'))
+    ohlcv_list = {'1m': ohlcv_1m}
+    bids = pd.read_csv(os.path.join(dirpath, 'bids.csv'))
+    asks = pd.read_csv(os.path.join(dirpath, 'asks.csv'))
+    inago = pd.read_csv(os.path.join(dirpath, 'inago.csv'))
+    return ticker, ohlcv_list, bids, asks, inago
 
-def update_horizon(api, pair, candle_types, sinces):
+def update_horizon(api, pair, trackers, sinces):
+    '''
+    前回から新しく確定した足だけを取得して水平線を更新する
+    trackers: candle_type -> HorizonTracker
+    sinces: 時間足ごとの期間の始まり (ms)。これ以前の足は水平線の根拠から外す
+    '''
     horizons = {}
-    for candle_type, since in zip(candle_types, sinces):
-        ohlcv = api.fetch_ohlcv(pair, candle_type, since)
-        df_ohlcv = pd.DataFrame(ohlcv, columns=['unixtime', 'open', 'high', 'low', 'close', 'volume'])
+    for (candle_type, tracker), since in zip(trackers.items(), sinces):
+        # 処理済みの足より後だけを取得する（初回は期間全体）
+        fetch_since = since if tracker.last_timestamp is None else tracker.last_timestamp
+        ohlcv = api.fetch_ohlcv(pair, candle_type, fetch_since)
         # 未確定足は含めない
-        df_ohlcv = df_ohlcv.iloc[:-1]
-        df_ohlcv['unixtime'] = df_ohlcv['unixtime'] / 1000
-        df_ohlcv.index = df_ohlcv.unixtime.map(lambda x: datetime.fromtimestamp(x))
-        tmp = calc_horizon(df_ohlcv, min_whisker_len=0, threshold_whisker_diff=0)
-        horizons = merge_dicts(tmp, horizons)
+        added, removed = tracker.update(ohlcv[:-1], since)
+        logger.debug('{} horizons: +{} -{}'.format(candle_type, len(added), len(removed)))
+        horizons = merge_dicts(tracker.horizons, horizons)
     return horizons
 
 def is_contract_doten(order, pair, candle_type, api, tm, max_wait_time, target_horizon, is_backtest):
@@ -112,136 +134,329 @@ def is_contract_inago(order, pair, api, tm, max_wait_time, is_backtest):
         elapsed_time = tm.now - start if is_backtest else time.time() - start
     return True
 
-def order_limits_by_horizon(horizons, api, pair):
-    horizon_and_order = {}
-    curr_price = api.fetch_ticker(pair)['close']
-    orderbook = format_orderbook(api.fetch_order_book(pair, limit=1000))
-    for horizon in horizons:
-        order_price = calc_order_price(horizon, orderbook)
+def wait_contract_doten(order, pair, candle_type, api, tm, queue, max_wait_time, target_horizon):
+    '''
+    is_contract_doten のイベント駆動版
+    5秒ごとに確認する代わりに、約定・ラインの突破・待ち時間の超過のうち最初に起きる時刻まで進める
+    '''
+    deadline = tm.now + max_wait_time
+    filled_at = api.next_fill_time(order['id'], deadline)
+    # ドテンの前の建玉が買いなら終値がラインを上回ったら、売りなら下回ったら突破とする
+    above = order['side'] == 'sell'
+    penetrated_at = queue.next_close_beyond(candle_type, tm.now, deadline, target_horizon, above)
+    if (penetrated_at is not None) and ((filled_at is None) or (penetrated_at < filled_at)):
+        tm.now = queue.align(penetrated_at) or penetrated_at
+        logger.debug('horizon is penetrated')
+        return False
+    if filled_at is None:
+        tm.now = queue.align(deadline) or deadline
+        logger.debug('max wait time is over')
+        return False
+    tm.now = filled_at
+    order = api.fetch_order(order['id'], pair)
+    return order['status'] == 'closed'
+
+def wait_contract_inago(order, pair, api, tm, queue, max_wait_time):
+    '''
+    is_contract_inago のイベント駆動版
+    '''
+    deadline = tm.now + max_wait_time
+    filled_at = api.next_fill_time(order['id'], deadline)
+    if filled_at is None:
+        tm.now = queue.align(deadline) or deadline
+        logger.debug('max wait time is over')
+        return False
+    tm.now = filled_at
+    order = api.fetch_order(order['id'], pair)
+    return order['status'] == 'closed'
+
+def horizon_order_targets(horizons, curr_price, bids, asks, scope=3, threshold=10000, shift=0.5):
+    '''
+    指値を入れる水平線と、その指値の side と価格
+    戻り値: [(水平線, side, 価格), ...]
+    '''
+    # 全ての水平線の指値の価格をまとめて求める
+    order_prices = ArrayOrderBook(bids, asks).order_prices(horizons, scope, threshold, shift)
+    targets = []
+    for horizon, order_price in zip(horizons, order_prices.tolist()):
         if order_price != -1:
             logger.debug('limit order at {}'.format(order_price))
-            if order_price > curr_price:
-                order = api.create_order(pair, type='limit', side='sell', amount=1, price=order_price)
-            else:
-                order = api.create_order(pair, type='limit', side='buy', amount=1, price=order_price)
-            if order['id'] == 85:
-                print('side: {}'.format(order['side']))
-                print('current price: {}'.format(curr_price))
-                print('order price: {}'.format(order_price))
-            horizon_and_order[horizon] = order
+            side = 'sell' if order_price > curr_price else 'buy'
+            targets.append((horizon, side, order_price))
+    return targets
+
+def order_limits_by_horizon(horizons, api, pair, scope=3, threshold=10000, shift=0.5):
+    horizon_and_order = {}
+    horizons = list(horizons)
+    if len(horizons) == 0:
+        return horizon_and_order
+    curr_price = api.fetch_ticker(pair)['close']
+    bids, asks, _ = api.fetch_order_book_arrays(pair, limit=1000)
+    for horizon, side, order_price in horizon_order_targets(horizons, curr_price, bids, asks, scope, threshold, shift):
+        order = api.create_order(pair, type='limit', side=side, amount=1, price=order_price)
+        if order['id'] == 85:
+            print('side: {}'.format(order['side']))
+            print('current price: {}'.format(curr_price))
+            print('order price: {}'.format(order_price))
+        horizon_and_order[horizon] = order
     return horizon_and_order
 
-def main():
-    exchange_name = 'bitmex'
-    pair = 'BTC/USD'
-    candle_type = '1m'
-    max_wait_time = 300
-    is_test = True
+async def order_limits_by_horizon_async(horizons, api, pair, scope=3, threshold=10000, shift=0.5):
+    '''
+    order_limits_by_horizon の AsyncAPI 版
+    ticker と板を同時に取得し、全ての水平線の指値を同時に発注する
+    '''
+    horizons = list(horizons)
+    if len(horizons) == 0:
+        return {}
+    ticker, (bids, asks, _) = await api.fetch_ticker_and_order_book(pair, limit=1000)
+    targets = horizon_order_targets(horizons, ticker['close'], bids, asks, scope, threshold, shift)
+    orders = await api.create_orders(pair, [('limit', side, 1, order_price) for _, side, order_price in targets])
+    return {horizon: order for (horizon, _, _), order in zip(targets, orders)}
+
+def replace_orders_by_horizon(horizon_and_order, horizons, api, pair, scope=3, threshold=10000, shift=0.5):
+    '''
+    なくなった水平線の指値だけを取り消し、指値のない水平線（新しい水平線、指値が約定・取り消し済みの水平線）にだけ指値を入れる
+    '''
+    removed = [horizon for horizon in horizon_and_order if horizon not in horizons]
+    for horizon in removed:
+        api.cancel_order(horizon_and_order.pop(horizon)['id'])
+    # 約定・取り消し済みの指値は入れ直す（未約定の指値の一覧を1回だけ取得する）
+    open_ids = {order['id'] for order in api.fetch_open_orders(pair)}
+    for horizon in list(horizon_and_order):
+        order_id = horizon_and_order[horizon]['id']
+        if order_id in open_ids:
+            continue
+        # 一覧にない指値だけ個別に確認する
+        if api.fetch_order(order_id, pair)['status'] != 'open':
+            horizon_and_order.pop(horizon)
+    targets = [horizon for horizon in horizons if horizon not in horizon_and_order]
+    if len(targets) > 0:
+        horizon_and_order.update(order_limits_by_horizon(targets, api, pair, scope, threshold, shift))
+    logger.debug('horizons: {} removed, {} targeted'.format(len(removed), len(targets)))
+    return horizon_and_order
+
+def trade_inago(inago_side, api, pair, candle_type, tm, horizon_index, horizon_and_order, wait_inago, wait_doten, is_test,
+                params=DEFAULT_PARAMS):
+    '''
+    イナゴ発動時に、近くのラインの指値が約定したらドテンの指値を入れる
+    wait_inago(order), wait_doten(order, target_horizon): 指値が約定したかを返す
+    戻り値: 利益（取引しなかった場合は 0）
+    '''
+    # 一番近くのラインを取得
+    curr_price = api.fetch_ticker(pair)['close']
+    if inago_side == 'buy':
+        target_horizon = horizon_index.closest(curr_price, scope=1000, direction='upper')
+    else:
+        target_horizon = horizon_index.closest(curr_price, scope=1000, direction='lower')
+
+    # そのラインと現在価格の距離が horizon_distance 未満の場合
+    if abs(target_horizon - curr_price) >= params['horizon_distance']:
+        return 0
+    if target_horizon not in horizon_and_order:
+        logger.debug('no limit order at horizon {}'.format(target_horizon))
+        return 0
+
+    # 指値が約定しなかった場合
+    horder = horizon_and_order[target_horizon]
+    if not wait_inago(horder):
+        return 0
+    # 約定した指値は使わない（次の水平線の更新で入れ直す）
+    horizon_and_order.pop(target_horizon)
+    print('inago side: {}, horder: {}'.format(inago_side, horder['side']))
+    logger.debug('inago order {} is contracted: {}'.format(horder['id'], horder))
+
+    # ドテンで指値を入れる
+    since = (tm.now - 60) * 1000 if is_test else (datetime.now().timestamp() - 60) * 1000
+    curr_price, _ = api.fetch_current_price(pair, candle_type, since)
+    if inago_side == 'buy':
+        dorder = api.create_order(pair, type='limit', side='buy', amount=1, price=curr_price - params['doten_offset'])
+    else:
+        dorder = api.create_order(pair, type='limit', side='sell', amount=1, price=curr_price + params['doten_offset'])
 
+    # 損益はシミュレータと同じ Ledger（同じ手数料率）で計算する。ラインの指値とドテンの指値はメイカー、成行はテイカー
+    trade = Ledger()
+    trade.fill(horder['id'], horder['side'], horder['price'], horder['amount'], 'maker')
+
+    # ドテンが約定しない場合
+    if not wait_doten(dorder, target_horizon):
+        order = api.create_order(pair, type='market', side=inago_side, amount=1, price=curr_price)
+        trade.fill(order['id'], order['side'], order.get('average') or order['price'] or curr_price, order['amount'],
+                   'taker')
+        api.cancel_order(dorder['id'])
+        logger.debug('doten order {} is canceled'.format(dorder['id'], dorder))
+    else:
+        logger.debug('doten order {} is contracted: {}'.format(dorder['id'], dorder))
+        trade.fill(dorder['id'], dorder['side'], dorder['price'], dorder['amount'], 'maker')
+    return trade.summary()['net_pnl']
+
+def init_horizons(api, pair, candle_types, tm, is_test, params=DEFAULT_PARAMS):
+    '''
+    水平線を引いて指値を入れる
+    戻り値: trackers, horizon_index, horizon_and_order
+    '''
+    trackers = {candle_type: HorizonTracker(params['min_whisker_len'], params['threshold_whisker_diff'])
+                for candle_type in candle_types}
     if is_test:
-        ticker = pd.read_csv('collect/format_data/ticker.csv')
-        ohlcv_1m = pd.read_csv('collect/format_data/ohlcv_1m.csv')
-        ohlcv_list = {'1m': ohlcv_1m}
-        bids = pd.read_csv('collect/format_data/bids.csv')
-        asks = pd.read_csv('collect/format_data/asks.csv')
-        inago = pd.read_csv('collect/format_data/inago.csv')
-        tm = TimeManager(str2timestamp('2019-03-25 01:00:00'))
-        rm = ResourceManager(ticker, ohlcv_list, bids, asks, inago, tm)
-        api = APISim(exchange_name, rm)
+        sinces = [(tm.now - 3600) * 1000]
     else:
-        api = API(exchange_name)
+        sinces = [(datetime.now() - timedelta(hours=1)).timestamp() * 1000]
+    horizons = update_horizon(api, pair, trackers, sinces)
+    horizon_index = HorizonIndex(horizons)
+    horizon_and_order = order_limits_by_horizon(horizons, api, pair, params['scope'], params['threshold'], params['shift'])
+    return trackers, horizon_index, horizon_and_order
 
-    # ラインを更新
-    candle_types = ['1m']
+def refresh_horizons(api, pair, trackers, horizon_index, horizon_and_order, tm, is_test, params=DEFAULT_PARAMS):
+    '''
+    水平線を引き直し、変化した水平線の指値だけを入れ直す
+    '''
     if is_test:
         sinces = [(tm.now - 3600) * 1000]
     else:
         sinces = [(datetime.now() - timedelta(hours=1)).timestamp() * 1000]
-    horizons = update_horizon(api, pair, candle_types, sinces)
+    horizons = update_horizon(api, pair, trackers, sinces)
+    horizon_index.sync(horizons)
+    return replace_orders_by_horizon(horizon_and_order, horizons, api, pair,
+                                     params['scope'], params['threshold'], params['shift'])
 
-    # 指値を入れる
-    horizon_and_order = order_limits_by_horizon(horizons, api, pair)
+def run(api, pair, candle_type, tm, is_test, params=DEFAULT_PARAMS, until=None, subscriber=None):
+    '''
+    1秒ごとにイナゴを確認して取引する（バックテストでは until 秒まで）
+    subscriber: InagoSubscriber。接続している間は MySQL を読む代わりに inago_server から配信されたイナゴで取引する
+    戻り値: 利益の合計
+    '''
+    candle_types = ['1m']
+    max_wait_time = params['max_wait_time']
+    trackers, horizon_index, horizon_and_order = init_horizons(api, pair, candle_types, tm, is_test, params)
+    wait_inago = lambda order: is_contract_inago(order, pair, api, tm, max_wait_time, is_test)
+    wait_doten = lambda order, target_horizon: is_contract_doten(order, pair, candle_type, api, tm, max_wait_time,
+                                                                  target_horizon, is_test)
 
     profits = 0
     start = tm.now if is_test else time.time()
     elapsed_time = 0
     prev_time = dt2str(datetime.fromtimestamp(tm.now - 3)) if is_test else dt2str(datetime.now() - timedelta(seconds=3))
-    while True:
-        logger.debug('current time: {}'.format(datetime.fromtimestamp(tm.now)))
+    while (until is None) or (tm.now < until):
+        logger.debug('current time: {}'.format(datetime.fromtimestamp(tm.now) if is_test else datetime.now()))
         logger.debug('current price: {}'.format(api.fetch_ticker(pair)['close']))
 
-        # イナゴ発動（毎回コネクションを貼り直さないとinago_serverで格納したデータが反映されない）
+        # イナゴ発動
         curr_time = dt2str(datetime.fromtimestamp(tm.now - 3)) if is_test else dt2str(datetime.now() - timedelta(seconds=3))
-        inago = api.fetch_inago(account, prev_time, curr_time)
-        if len(inago) > 0:
+        waited = False
+        if (subscriber is not None) and subscriber.connect():
+            # 配信されたイナゴを最大1秒待つ（届いたらすぐに取引する）
+            signals = subscriber.poll(timeout=1)
+            inago_side = signals[-1]['taker_side'] if len(signals) > 0 else None
+            waited = True
+        else:
+            inago_side = api.fetch_inago_side(account, prev_time, curr_time)
+        if inago_side is not None:
             logger.debug('InagoFlyer is screaming ...')
-
-            # 一番近くのラインを取得
-            inago_side = inago.iloc[-1].loc['taker_side']
-            curr_price = api.fetch_ticker(pair)['close']
-            if inago_side == 'buy':
-                target_horizon = get_horizon_closest_to_price(horizons, curr_price, scope=1000, direction='upper')
-            else:
-                target_horizon = get_horizon_closest_to_price(horizons, curr_price, scope=1000, direction='lower')
-
-            # そのラインと現在価格の距離が10$未満の場合
-            if abs(target_horizon - curr_price) < 10:
-                # 指値が約定した場合
-                horder = horizon_and_order[target_horizon]
-                if is_contract_inago(horder, pair, api, tm, max_wait_time, is_test):
-                    print('inago side: {}, horder: {}'.format(inago_side, horder['side']))
-                    logger.debug('inago order {} is contracted: {}'.format(horder['id'], horder))
-
-                    # ドテンで指値を入れる
-                    since = (tm.now - 60) * 1000 if is_test else (datetime.now().timestamp() - 60) * 1000
-                    curr_price, _ = api.fetch_current_price(pair, candle_type, since)
-                    if inago_side == 'buy':
-                        dorder = api.create_order(pair, type='limit', side='buy', amount=1, price=curr_price - 2)
-                    else:
-                        dorder = api.create_order(pair, type='limit', side='sell', amount=1, price=curr_price + 2)
-
-                    # ドテンが約定しない場合
-                    if not is_contract_doten(dorder, pair, candle_type, api, tm, max_wait_time, target_horizon, is_test):
-                        if inago_side == 'buy':
-                            order = api.create_order(pair, type='market', side='buy', amount=1, price=curr_price)
-                            profit = (horder['price'] - order['price']) - order['price'] * 0.075
-                        else:
-                            order = api.create_order(pair, type='market', side='sell', amount=1, price=curr_price)
-                            profit = (order['price'] - horder['price']) - order['price'] * 0.075
-                        api.cancel_order(dorder['id'])
-                        logger.debug('doten order {} is canceled'.format(dorder['id'], dorder))
-                    else:
-                        logger.debug('doten order {} is contracted: {}'.format(dorder['id'], dorder))
-                        if horder['side'] == 'buy':
-                            profit = (horder['price'] - dorder['price']) + dorder['price'] * 0.025
-                        else:
-                            profit = (dorder['price'] - horder['price']) + dorder['price'] * 0.025
-
-                    # 利益計算
-                    profits += profit
-                    logger.debug('current profit: {}'.format(profits))
+            profits += trade_inago(inago_side, api, pair, candle_type, tm, horizon_index, horizon_and_order,
+                                   wait_inago, wait_doten, is_test, params)
+            logger.debug('current profit: {}'.format(profits))
 
         if is_test:
             tm.forward_timestamp(1)
-        else:
+        elif not waited:
             time.sleep(1)
 
         # 更新
         if elapsed_time > 300:
-            # 水平線を引く
-            if is_test:
-                sinces = [(tm.now - 3600) * 1000]
-            else:
-                sinces = [(datetime.now() - timedelta(hours=1)).timestamp() * 1000]
-            horizons = update_horizon(api, pair, candle_types, sinces)
-
-            # 指値を入れる
-            for horizon, order in horizon_and_order.items():
-                api.cancel_order(order['id'])
-            horizon_and_order = order_limits_by_horizon(horizons, api, pair)
-            start = tm.now
+            horizon_and_order = refresh_horizons(api, pair, trackers, horizon_index, horizon_and_order, tm, is_test,
+                                                     params)
+            start = tm.now if is_test else time.time()
+            if (not is_test) and (api.inago_reader is not None):
+                logger.debug('inago reader: {}'.format(api.inago_reader.metrics()))
+            if subscriber is not None:
+                logger.debug('inago channel latency: {}'.format(subscriber.latency.summary()))
         elapsed_time = tm.now - start if is_test else time.time() - start
         prev_time = curr_time
+    return profits
+
+def run_event_backtest(api, pair, candle_type, tm, queue, params=DEFAULT_PARAMS, until=None, refresh_interval=300):
+    '''
+    イベント駆動のバックテスト
+    1秒ずつ進める代わりに、次のイナゴの発動・水平線の更新の時刻まで進め、
+    指値の約定待ちも約定・ラインの突破・待ち時間の超過の時刻まで一度に進める
+    約定待ちの間に発生したイナゴは待ち終わった時点でまとめて処理する（各イナゴは一度だけ処理する）
+    戻り値: 利益の合計
+    '''
+    candle_types = ['1m']
+    max_wait_time = params['max_wait_time']
+    trackers, horizon_index, horizon_and_order = init_horizons(api, pair, candle_types, tm, True, params)
+    wait_inago = lambda order: wait_contract_inago(order, pair, api, tm, queue, max_wait_time)
+    wait_doten = lambda order, target_horizon: wait_contract_doten(order, pair, candle_type, api, tm, queue,
+                                                                    max_wait_time, target_horizon)
+
+    profits = 0
+    # 開始時点ですでに参照できるイナゴは処理しない（1秒ごとに確認する場合と同じく now - 3 秒より前）
+    queue.skip_inago(tm.now - queue.inago_delay - 1)
+    queue.schedule(tm.now + refresh_interval, 'refresh')
+    while True:
+        event = queue.next_event()
+        if event is None:
+            break
+        at = queue.align(max(event[0], tm.now))
+        if (at is None) or ((until is not None) and (at >= until)):
+            break
+        tm.now = at
+        logger.debug('current time: {}'.format(datetime.fromtimestamp(tm.now)))
+
+        if event[1] == 'inago':
+            inago = queue.pop_inago(tm.now)
+            if len(inago) == 0:
+                continue
+            logger.debug('InagoFlyer is screaming ...')
+            inago_side = inago.iloc[-1].loc['taker_side']
+            profits += trade_inago(inago_side, api, pair, candle_type, tm, horizon_index, horizon_and_order,
+                                   wait_inago, wait_doten, True, params)
+            logger.debug('current profit: {}'.format(profits))
+        else:
+            queue.pop_timer()
+            horizon_and_order = refresh_horizons(api, pair, trackers, horizon_index, horizon_and_order, tm, True,
+                                                 params)
+            queue.schedule(tm.now + refresh_interval, 'refresh')
+    return profits
+
+def main():
+    exchange_name = 'bitmex'
+    pair = 'BTC/USD'
+    candle_type = '1m'
+    params = DEFAULT_PARAMS
+    is_test = True
+    # バックテストを1秒ごとではなく次のイベントまで進めて行う
+    is_event_driven = True
+    dataset_path = 'collect/format_data/dataset.bin'
+    # 指値の約定を板ではなく約定履歴（collect/save_exec.py）で判定する
+    use_executions = False
+    executions_dirpath = 'collect/store/executions'
+    # 本番では inago_server から配信されるイナゴを受け取る（接続できない間は MySQL を読む）
+    use_inago_channel = True
+
+    if is_test:
+        tm = TimeManager(str2timestamp('2019-03-25 01:00:00'))
+        # collect/pack_dataset.py でまとめたファイルがあればパースせずに読み込む（CSV が更新されていればまとめ直す）
+        if os.path.exists(dataset_path):
+            rm = load_bundle(dataset_path, 'collect/format_data', tm)
+        else:
+            ticker, ohlcv_list, bids, asks, inago = load_dataset('collect/format_data')
+            rm = ResourceManager(ticker, ohlcv_list, bids, asks, inago, tm)
+        if use_executions and (rm.execution_timestamps is None):
+            rm.set_executions(read_executions(executions_dirpath, 'execution'))
+        api = APISim(exchange_name, rm, use_executions=use_executions)
+    else:
+        tm = None
+        api = API(exchange_name)
+    subscriber = InagoSubscriber() if (not is_test) and use_inago_channel else None
+
+    if is_test and is_event_driven:
+        profits = run_event_backtest(api, pair, candle_type, tm, EventQueue(rm), params)
+    else:
+        profits = run(api, pair, candle_type, tm, is_test, params, subscriber=subscriber)
+    logger.debug('total profit: {}'.format(profits))
+    if is_test:
+        logger.debug('ledger: {}'.format(api.ledger.summary()))
 
 if __name__=='__main__':
     try:
@@ -0,0 +1,145 @@
+import logging
+
+logger = logging.getLogger('crypto')
+
+import os
+import copy
+import time
+import itertools
+import multiprocessing
+import traceback
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+from common.utils import str2timestamp
+from trade_tools.my_api import APISim
+from trade_tools.rm import ResourceManager
+from trade_tools.tm import TimeManager
+from trade_tools.backtest import EventQueue
+from trade.main import DEFAULT_PARAMS, load_dataset, run_event_backtest
+from collect.pack_dataset import load_bundle
+
+LEDGER_COLUMNS = ['realized_pnl', 'fees', 'net_pnl', 'trades', 'position']
+
+# ワーカーで共有するデータ（fork する前に親プロセスで読み込む）
+_rm = None
+
+
+def expand_grid(grid):
+    '''
+    パラメータ名 -> 値のリスト の辞書から、全ての組み合わせのパラメータを作る（指定しないパラメータは DEFAULT_PARAMS）
+    '''
+    unknown = set(grid) - set(DEFAULT_PARAMS)
+    if len(unknown) > 0:
+        raise KeyError('unknown parameters: {}'.format(sorted(unknown)))
+    names = list(grid)
+    params_list = []
+    for values in itertools.product(*[grid[name] for name in names]):
+        params = dict(DEFAULT_PARAMS)
+        params.update(zip(names, values))
+        params_list.append(params)
+    return params_list
+
+
+def _init_worker():
+    # ワーカーのログは警告以上だけにする
+    logger.setLevel(logging.WARNING)
+
+
+def _backtest(args):
+    params, start, end, exchange_name, pair, candle_type = args
+    # データは親プロセスのものを共有し、時刻だけワーカーごとに持つ
+    tm = TimeManager(start)
+    rm = copy.copy(_rm)
+    rm.tm = tm
+    # 未確定足の状態は配列と違って書き換えるので、バックテストごとに作る
+    rm.init_active_ohlcv()
+    api = APISim(exchange_name, rm)
+    t = time.perf_counter()
+    status = 'ok'
+    try:
+        profits = run_event_backtest(api, pair, candle_type, tm, EventQueue(rm), params, until=end)
+    except SystemExit:
+        # ResourceManager はデータがない時刻を参照すると sys.exit する
+        profits = float('nan')
+        status = 'missing data at {}'.format(tm.now)
+    except Exception:
+        profits = float('nan')
+        status = traceback.format_exc().strip().splitlines()[-1]
+    orders = list(api.orders.values())
+    result = dict(params)
+    result.update({
+        'profit': profits,
+        'orders': len(orders),
+        'closed_orders': sum(1 for order in orders if order['status'] == 'closed'),
+        'elapsed': time.perf_counter() - t,
+        'status': status,
+    })
+    # シミュレータの約定から計算した損益
+    ledger = api.ledger.summary()
+    result.update({key: ledger[key] for key in LEDGER_COLUMNS})
+    if status != 'ok':
+        # 途中で止まったバックテストは順位の最後にする
+        result['net_pnl'] = float('nan')
+    return result
+
+
+def run_sweep(rm, params_list, start, end, processes=None, exchange_name='bitmex', pair='BTC/USD', candle_type='1m'):
+    '''
+    パラメータの組み合わせごとにイベント駆動のバックテストをプロセスプールで実行する
+    rm: 読み込み済みのデータ。fork したワーカーはこれを（書き込まない限り）同じ物理メモリで共有する
+    start, end: バックテストの期間（秒）
+    戻り値: パラメータと結果の DataFrame（シミュレータの約定から計算した net_pnl の大きい順）
+    '''
+    global _rm
+    _rm = rm
+    args = [(params, start, end, exchange_name, pair, candle_type) for params in params_list]
+    # データをコピーせずにワーカーへ渡すため fork で起動する
+    context = multiprocessing.get_context('fork')
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context, initializer=_init_worker) as executor:
+        results = []
+        for i, result in enumerate(executor.map(_backtest, args)):
+            results.append(result)
+            logger.info('{}/{} net_pnl: {}'.format(i + 1, len(args), result['net_pnl']))
+    columns = list(DEFAULT_PARAMS) + ['profit'] + LEDGER_COLUMNS + ['orders', 'closed_orders', 'elapsed', 'status']
+    df_results = pd.DataFrame(results, columns=columns)
+    return df_results.sort_values('net_pnl', ascending=False, kind='mergesort')
+
+
+if __name__=='__main__':
+    logger.setLevel(logging.INFO)
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter('[%(levelname)s] %(asctime)s, %(message)s'))
+    logger.handlers = [stream_handler]
+
+    start = str2timestamp('2019-03-25 01:00:00')
+    end = str2timestamp('2019-03-25 23:00:00')
+    grid = {
+        'scope': [2, 3, 5],
+        'threshold': [5000, 10000, 20000],
+        'shift': [0.5, 1.0],
+        'max_wait_time': [120, 300],
+        'horizon_distance': [5, 10],
+        'doten_offset': [1, 2, 3],
+        'min_whisker_len': [0],
+        'threshold_whisker_diff': [0, 0.5],
+    }
+    processes = None
+    output = 'sweep_results.csv'
+    dataset_path = 'collect/format_data/dataset.bin'
+
+    t = time.perf_counter()
+    # collect/pack_dataset.py でまとめたファイルがあれば memmap で読み込み、ワーカーもページキャッシュを共有する
+    # （CSV が更新されていればまとめ直す）
+    if os.path.exists(dataset_path):
+        rm = load_bundle(dataset_path, 'collect/format_data', TimeManager(start))
+    else:
+        ticker, ohlcv_list, bids, asks, inago = load_dataset('collect/format_data')
+        rm = ResourceManager(ticker, ohlcv_list, bids, asks, inago, TimeManager(start))
+    logger.info('loaded data in {:.1f} sec'.format(time.perf_counter() - t))
+
+    params_list = expand_grid(grid)
+    logger.info('{} configurations'.format(len(params_list)))
+    df_results = run_sweep(rm, params_list, start, end, processes)
+    df_results.to_csv(output, index=False)
+    logger.info('wrote {} in {:.1f} sec'.format(output, time.perf_counter() - t))
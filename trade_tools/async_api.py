@@ -0,0 +1,169 @@
+import asyncio
+import itertools
+import numpy as np
+from abc import ABCMeta, abstractmethod
+
+from trade_tools.trade_utils import init_async_exchange
+
+
+class AsyncAPIBase(metaclass=ABCMeta):
+    '''
+    APIBase の asyncio 版（メソッドは同じで、全て await する）
+    独立した呼び出しは create_orders, fetch_orders, fetch_ticker_and_order_book で同時に実行する
+    '''
+    def __init__(self, exchange):
+        self.exchange = exchange
+
+    @abstractmethod
+    async def fetch_ticker(self, pair):
+        pass
+
+    @abstractmethod
+    async def fetch_ohlcv(self, pair, candle_type, since=None, limit=None):
+        pass
+
+    @abstractmethod
+    async def fetch_order_book(self, pair, limit=None):
+        pass
+
+    @abstractmethod
+    async def create_order(self, pair, type, side, amount, price):
+        pass
+
+    @abstractmethod
+    async def cancel_order(self, order_id):
+        pass
+
+    @abstractmethod
+    async def fetch_order(self, order_id, pair):
+        pass
+
+    async def fetch_order_book_arrays(self, pair, limit=None):
+        '''
+        板を (段, 2) の配列 (price, amount) で返す
+        戻り値: bids, asks, timestamp
+        '''
+        orderbook = await self.fetch_order_book(pair, limit)
+        return np.asarray(orderbook['bids'], dtype=np.float64).reshape(-1, 2), \
+               np.asarray(orderbook['asks'], dtype=np.float64).reshape(-1, 2), orderbook['timestamp']
+
+    async def fetch_current_price(self, pair, candle_type, since, limit=None):
+        unixtime, open, high, low, close, volume = (await self.fetch_ohlcv(pair, candle_type, since, limit))[-1]
+        side = 'sell' if open - close >= 0 else 'buy'
+        curr_price = close
+        return curr_price, side
+
+    async def fetch_ticker_and_order_book(self, pair, limit=None):
+        '''
+        ticker と板を同時に取得する
+        戻り値: ticker, (bids, asks, timestamp)
+        '''
+        ticker, orderbook = await asyncio.gather(self.fetch_ticker(pair), self.fetch_order_book_arrays(pair, limit))
+        return ticker, orderbook
+
+    async def create_orders(self, pair, orders):
+        '''
+        複数の注文を同時に発注する
+        orders: [(type, side, amount, price), ...]
+        戻り値: orders と同じ順の注文のリスト
+        '''
+        return await asyncio.gather(*[self.create_order(pair, type, side, amount, price)
+                                      for type, side, amount, price in orders])
+
+    async def fetch_orders(self, order_ids, pair):
+        '''
+        複数の注文の状態を同時に取得する
+        '''
+        return await asyncio.gather(*[self.fetch_order(order_id, pair) for order_id in order_ids])
+
+    async def cancel_orders(self, order_ids):
+        return await asyncio.gather(*[self.cancel_order(order_id) for order_id in order_ids])
+
+    async def close(self):
+        await self.exchange.close()
+
+
+class AsyncAPI(AsyncAPIBase):
+    '''
+    ccxt.async_support の取引所で API と同じ操作をする
+    session: 共有する aiohttp.ClientSession
+    exchange: ccxt の代わりに使う取引所（LatencyExchange など）
+    '''
+    def __init__(self, exchange_name, session=None, exchange=None):
+        super(AsyncAPI, self).__init__(exchange if exchange is not None else init_async_exchange(exchange_name, session))
+
+    async def fetch_ticker(self, pair):
+        return await self.exchange.fetch_ticker(pair)
+
+    async def fetch_ohlcv(self, pair, candle_type, since=None, limit=None):
+        return await self.exchange.fetch_ohlcv(pair, candle_type, since, limit)
+
+    async def fetch_order_book(self, pair, limit=None):
+        return await self.exchange.fetch_order_book(pair, limit)
+
+    async def create_order(self, pair, type, side, amount, price):
+        return await self.exchange.create_order(pair, type, side, amount, price)
+
+    async def cancel_order(self, order_id):
+        return await self.exchange.cancel_order(order_id)
+
+    async def fetch_order(self, order_id, pair):
+        return await self.exchange.fetch_order(order_id, pair)
+
+
+class LatencyExchange:
+    '''
+    リクエストごとに latency 秒かかる取引所の代わり（ネットワークなしで並行実行の効果を確かめる用）
+    ccxt の取引所と同じ名前のメソッドを持ち、価格は price のまま動かない
+    concurrency: 同時に処理できるリクエストの数（None なら制限なし）
+    '''
+    def __init__(self, latency=0.05, price=4000.0, concurrency=None):
+        self.latency = latency
+        self.price = price
+        self.semaphore = asyncio.Semaphore(concurrency) if concurrency is not None else None
+        self.orders = {}
+        self.counter = itertools.count()
+        self.requests = 0
+
+    async def _request(self):
+        self.requests += 1
+        if self.semaphore is None:
+            await asyncio.sleep(self.latency)
+        else:
+            async with self.semaphore:
+                await asyncio.sleep(self.latency)
+
+    async def fetch_ticker(self, pair):
+        await self._request()
+        return {'symbol': pair, 'bid': self.price - 0.5, 'ask': self.price, 'close': self.price}
+
+    async def fetch_ohlcv(self, pair, candle_type, since=None, limit=None):
+        await self._request()
+        return [[0, self.price, self.price, self.price, self.price, 1.0]]
+
+    async def fetch_order_book(self, pair, limit=None):
+        await self._request()
+        depth = 25 if limit is None else min(limit, 25)
+        bids = [[self.price - 0.5 - 0.5 * i, 1000.0] for i in range(depth)]
+        asks = [[self.price + 0.5 * i, 1000.0] for i in range(depth)]
+        return {'bids': bids, 'asks': asks, 'timestamp': None}
+
+    async def create_order(self, pair, type, side, amount, price):
+        await self._request()
+        order_id = next(self.counter)
+        order = {'id': order_id, 'symbol': pair, 'type': type, 'side': side, 'price': price, 'amount': amount,
+                 'status': 'open'}
+        self.orders[order_id] = order
+        return dict(order)
+
+    async def cancel_order(self, order_id):
+        await self._request()
+        self.orders[order_id]['status'] = 'canceled'
+        return dict(self.orders[order_id])
+
+    async def fetch_order(self, order_id, pair):
+        await self._request()
+        return dict(self.orders[order_id])
+
+    async def close(self):
+        pass
@@ -0,0 +1,97 @@
+import heapq
+import numpy as np
+
+
+class EventQueue:
+    '''
+    イベント駆動のバックテスト用に、ResourceManager の ticker・イナゴのデータを時刻順のイベントとして扱う
+    1秒ずつ時刻を進める代わりに、次にイベント（イナゴの発動、定期処理など）が起きる時刻を
+    ソート済みの配列の二分探索で求めて、その時刻まで一気に進める
+
+    指値の約定時刻は APISim.next_fill_time（MatchingEngine）で求める
+    時刻は TimeManager と同じく秒、データのタイムスタンプはミリ秒
+    inago_delay: イナゴのデータが参照できるようになるまでの遅れ（秒）。main の now - 3 に合わせる
+    '''
+    def __init__(self, rm, inago_delay=3):
+        self.rm = rm
+        self.inago_delay = inago_delay
+        self.ticker_timestamps = rm.ticker_timestamps
+
+        # 処理済みのイナゴの位置
+        self.inago_timestamps = rm.inago_timestamps
+        self.inago_cursor = 0
+        # 定期処理などのタイマー (時刻, 登録順, 種類)
+        self.timers = []
+        self.counter = 0
+
+    def skip_inago(self, until):
+        '''
+        until 秒以前のイナゴを処理済みにする
+        '''
+        self.inago_cursor = max(self.inago_cursor,
+                                int(np.searchsorted(self.inago_timestamps, int(np.floor(until * 1000)), side='right')))
+
+    def schedule(self, at, kind):
+        heapq.heappush(self.timers, (at, self.counter, kind))
+        self.counter += 1
+
+    def next_event(self):
+        '''
+        次のイベントの (時刻, 種類) を返す（取り出さない）。イベントがなければ None
+        種類: 'inago' またはタイマーの種類
+        '''
+        events = []
+        if self.inago_cursor < len(self.inago_timestamps):
+            # イナゴは発生した秒から inago_delay 秒後に参照できる
+            ready = np.ceil(self.inago_timestamps[self.inago_cursor] / 1000) + self.inago_delay
+            events.append((ready, -1, 'inago'))
+        if len(self.timers) > 0:
+            events.append(self.timers[0])
+        if len(events) == 0:
+            return None
+        at, _, kind = min(events)
+        return at, kind
+
+    def pop_timer(self):
+        at, _, kind = heapq.heappop(self.timers)
+        return at, kind
+
+    def pop_inago(self, until):
+        '''
+        until - inago_delay 秒までの未処理のイナゴを DataFrame で返し、処理済みにする
+        '''
+        end = int(np.searchsorted(self.inago_timestamps, int(np.floor((until - self.inago_delay) * 1000)), side='right'))
+        inago = self.rm.inago.iloc[self.inago_cursor:end]
+        self.inago_cursor = max(self.inago_cursor, end)
+        return inago
+
+    def align(self, at):
+        '''
+        at 秒以降で最初に ticker がある時刻（秒）。データの終わりを過ぎていれば None
+        '''
+        i = np.searchsorted(self.ticker_timestamps, int(np.ceil(at * 1000)), side='left')
+        if i >= len(self.ticker_timestamps):
+            return None
+        return self.ticker_timestamps[i] / 1000
+
+    def next_close_beyond(self, candle_type, since, until, price, above):
+        '''
+        [since, until] 秒の間で、最新の足の終値が price を超える（above=False なら下回る）最初の時刻。なければ None
+        since の時点の最新の足（since 以前の足）も対象にする
+        未確定足を使う場合 (ResourceManager.active_ohlcv) は、最新の足の終値は各時刻の1秒足の終値になる
+        '''
+        if self.rm.active_ohlcv is not None:
+            timestamps = self.rm.ticker_timestamps
+            closes = self.rm.ticker_values[:, self.rm.close_column]
+        else:
+            timestamps = self.rm.ohlcv_timestamps[candle_type]
+            closes = self.rm.ohlcv_values[candle_type][:, 4]
+        start = max(np.searchsorted(timestamps, int(np.floor(since * 1000)), side='right') - 1, 0)
+        end = np.searchsorted(timestamps, int(np.floor(until * 1000)), side='right')
+        if above:
+            hits = np.flatnonzero(closes[start:end] > price)
+        else:
+            hits = np.flatnonzero(closes[start:end] < price)
+        if len(hits) == 0:
+            return None
+        return max(timestamps[start + hits[0]] / 1000, since)
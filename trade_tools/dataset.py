@@ -0,0 +1,78 @@
+'''
+バックテスト用のデータ（ticker, ohlcv, bids, asks, inago）を1つのバイナリファイルにまとめる
+ファイル: MAGIC + ヘッダの長さ (uint64) + ヘッダ (JSON) + 配列のデータ（各配列は ALIGN バイト境界から）
+ヘッダには配列ごとの dtype, shape, offset を持つ。読み込みは np.memmap で行うため CSV のパースが不要で、
+同じファイルを開いた複数のプロセスは OS のページキャッシュ上の同じデータを共有する
+'''
+import os
+import json
+import numpy as np
+
+MAGIC = b'CTDATA01'
+ALIGN = 64
+
+
+def write_bundle(path, arrays, meta=None):
+    '''
+    arrays: 名前 -> np.ndarray（数値または固定長の文字列）
+    meta: ヘッダに一緒に保存する JSON にできる値
+    '''
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    for name, array in arrays.items():
+        if array.dtype.hasobject:
+            raise TypeError('{} has object dtype'.format(name))
+
+    # ヘッダの長さが決まらないと offset が決まらないので、offset はデータ部の先頭からの位置で持つ
+    entries = {}
+    offset = 0
+    for name, array in arrays.items():
+        offset = (offset + ALIGN - 1) // ALIGN * ALIGN
+        entries[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset += array.nbytes
+    header = json.dumps({'arrays': entries, 'meta': meta or {}}).encode('utf-8')
+    data_start = (len(MAGIC) + 8 + len(header) + ALIGN - 1) // ALIGN * ALIGN
+
+    # 読み込み中の他のプロセスの memmap を壊さないように、別のファイルに書いてから置き換える
+    tmp_path = '{}.{}'.format(path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(np.uint64(len(header)).tobytes())
+        f.write(header)
+        for name, array in arrays.items():
+            f.write(b'\0' * (data_start + entries[name]['offset'] - f.tell()))
+            f.write(array.tobytes())
+    os.replace(tmp_path, path)
+
+
+def _read_header(path):
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError('{} is not a dataset bundle'.format(path))
+        header_len = int(np.frombuffer(f.read(8), dtype=np.uint64)[0])
+        header = json.loads(f.read(header_len).decode('utf-8'))
+    data_start = (len(MAGIC) + 8 + header_len + ALIGN - 1) // ALIGN * ALIGN
+    return header, data_start
+
+
+def read_bundle_meta(path):
+    '''
+    配列を開かずに meta だけを読む
+    '''
+    return _read_header(path)[0]['meta']
+
+
+def read_bundle(path):
+    '''
+    戻り値: (名前 -> 読み取り専用の np.memmap, meta)
+    '''
+    header, data_start = _read_header(path)
+
+    arrays = {}
+    for name, entry in header['arrays'].items():
+        shape = tuple(entry['shape'])
+        if int(np.prod(shape)) == 0:
+            arrays[name] = np.empty(shape, dtype=entry['dtype'])
+            continue
+        arrays[name] = np.memmap(path, dtype=entry['dtype'], mode='r', offset=data_start + entry['offset'],
+                                 shape=shape)
+    return arrays, header['meta']
@@ -0,0 +1,234 @@
+import bisect
+import numpy as np
+from collections import Counter
+from datetime import datetime
+
+from trade_tools.trade_utils import calc_last_cross, crossed_by_candle
+
+
+class HorizonTracker:
+    '''
+    確定したローソク足を受け取るたびに水平線を差分で更新する
+    calc_horizon(直近 window ミリ秒の確定足) と同じ水平線を、毎回全体を計算し直さずに求める
+
+    - 新しい足が来たら、その足と期間内の足の組から水平線の候補を追加し、既存の候補をまたいだか確認する
+    - 期間から外れた足は、その足を根拠とする組ごと候補から外す
+    - 候補ごとに「またいだ最後の足の番号」を持ち、それが支点（根拠の最も古い足）以前なら有効とする
+    '''
+    def __init__(self, min_whisker_len=0, threshold_whisker_diff=0, window=3600 * 1000):
+        self.min_whisker_len = min_whisker_len
+        self.threshold_whisker_diff = threshold_whisker_diff
+        self.window = window
+
+        # 期間内の足（古い順）。足には追加した順に通し番号を振る
+        self.first_seq = 0
+        self.timestamps = np.empty(0, dtype=np.int64)
+        self.high = np.empty(0, dtype=np.float64)
+        self.low = np.empty(0, dtype=np.float64)
+        self.is_long = np.empty(0, dtype=bool)
+        self.labels = {}
+        self.curr_price = None
+
+        # 水平線の候補 -> 根拠となる足の通し番号の多重集合
+        self.contributions = {}
+        # 水平線の候補 -> またいだ最後の足の通し番号（ない場合は -1）
+        self.last_cross = {}
+        # 足の通し番号 -> その足とそれより新しい足で作った組 (水平線, 新しい足の通し番号)
+        self.pairs = {}
+        self.valid = set()
+
+    @property
+    def last_timestamp(self):
+        return int(self.timestamps[-1]) if len(self.timestamps) > 0 else None
+
+    @property
+    def horizons(self):
+        '''
+        calc_horizon と同じ形式 (key -> 水平線の値、value -> 根拠となる足の時間のリスト)
+        '''
+        return {horizon: [self.labels[seq] for seq in self.contributions[horizon]] for horizon in self.valid}
+
+    def update(self, ohlcv, since=None):
+        '''
+        ohlcv: 新しく確定した足のリスト [[unixtime(ms), open, high, low, close, volume], ...]（古い順、処理済みの足は無視する）
+        since: この時刻(ms)以前の足は期間から外す（省略時は最新の足から window ミリ秒前）
+        戻り値: (追加された水平線のリスト, 削除された水平線のリスト)
+        '''
+        for unixtime, open, high, low, close, volume in ohlcv:
+            if (self.last_timestamp is not None) and (unixtime <= self.last_timestamp):
+                continue
+            self._add_candle(int(unixtime), open, high, low, close)
+
+        if since is None and self.last_timestamp is not None:
+            since = self.last_timestamp - self.window
+        if since is not None:
+            self._drop_candles(since)
+
+        valid = self._calc_valid()
+        added = sorted(valid - self.valid)
+        removed = sorted(self.valid - valid)
+        self.valid = valid
+        return added, removed
+
+    def _add_candle(self, unixtime, open, high, low, close):
+        seq = self.first_seq + len(self.timestamps)
+        whisker_len = high - open if open >= close else high - close
+
+        # 既存の候補をこの足がまたいだか
+        if len(self.last_cross) > 0:
+            values = np.fromiter(self.last_cross.keys(), dtype=np.float64, count=len(self.last_cross))
+            for horizon in values[crossed_by_candle(values, high, low)]:
+                self.last_cross[horizon] = seq
+
+        self.timestamps = np.append(self.timestamps, unixtime)
+        self.high = np.append(self.high, high)
+        self.low = np.append(self.low, low)
+        self.is_long = np.append(self.is_long, whisker_len >= self.min_whisker_len)
+        self.labels[seq] = datetime.fromtimestamp(unixtime / 1000)
+        self.pairs[seq] = []
+        self.curr_price = close
+
+        if whisker_len >= self.min_whisker_len:
+            self._add_pairs(seq, high, low)
+
+    def _add_pairs(self, seq, high, low):
+        '''
+        新しい足と期間内のひげが長い足の、高値・安値の組から水平線の候補を追加する
+        '''
+        others = np.flatnonzero(self.is_long[:-1])
+        new_horizons = []
+        for v1 in (high, low):
+            for other_values in (self.high[others], self.low[others]):
+                matched = np.abs(v1 - other_values) <= self.threshold_whisker_diff
+                for k in np.flatnonzero(matched):
+                    other_seq = self.first_seq + int(others[k])
+                    horizon = (other_values[k] + v1) / 2
+                    if horizon not in self.contributions:
+                        self.contributions[horizon] = Counter()
+                        new_horizons.append(horizon)
+                    self.contributions[horizon][other_seq] += 1
+                    self.contributions[horizon][seq] += 1
+                    self.pairs[other_seq].append((horizon, seq))
+
+        # 新しい候補は期間内の足すべてについてまたいだか確認する
+        if len(new_horizons) > 0:
+            last_cross = calc_last_cross(new_horizons, self.high, self.low, offset=self.first_seq)
+            for horizon, cross in zip(new_horizons, last_cross):
+                self.last_cross[horizon] = int(cross)
+
+    def _drop_candles(self, since):
+        n_drop = int(np.searchsorted(self.timestamps, since, side='right'))
+        for seq in range(self.first_seq, self.first_seq + n_drop):
+            # 古い足から外すので、この足を根拠とする組はすべてこの足の番号で登録されている
+            for horizon, other_seq in self.pairs.pop(seq):
+                contribution = self.contributions[horizon]
+                for s in (seq, other_seq):
+                    contribution[s] -= 1
+                    if contribution[s] == 0:
+                        del contribution[s]
+                if len(contribution) == 0:
+                    del self.contributions[horizon]
+                    del self.last_cross[horizon]
+            del self.labels[seq]
+        self.first_seq += n_drop
+        self.timestamps = self.timestamps[n_drop:]
+        self.high = self.high[n_drop:]
+        self.low = self.low[n_drop:]
+        self.is_long = self.is_long[n_drop:]
+
+    def _calc_valid(self):
+        valid = set()
+        for horizon, contribution in self.contributions.items():
+            # 支点の右側でまたいだ足がある、または現在価格に近いラインは使わない
+            if self.last_cross[horizon] > min(contribution):
+                continue
+            if abs(horizon - self.curr_price) <= 1:
+                continue
+            valid.add(horizon)
+        return valid
+
+
+class HorizonIndex:
+    '''
+    水平線の値をソート済みのリストで保持し、現在価格に近い水平線を二分探索で求める
+    get_horizon_closest_to_price と同じ条件（範囲は両端を含まない）で検索する
+    '''
+    def __init__(self, horizons=()):
+        self.values = sorted(set(horizons))
+        self.members = set(self.values)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __contains__(self, horizon):
+        return horizon in self.members
+
+    def update(self, added=(), removed=()):
+        '''
+        HorizonTracker.update の差分を反映する
+        差分が少なければ二分探索で挿入・削除し、多ければソートし直す
+        '''
+        added = [horizon for horizon in added if horizon not in self.members]
+        removed = [horizon for horizon in removed if horizon in self.members]
+        self.members.difference_update(removed)
+        self.members.update(added)
+        if len(added) + len(removed) > 32:
+            self.values = sorted(self.members)
+            return
+        for horizon in removed:
+            del self.values[bisect.bisect_left(self.values, horizon)]
+        for horizon in added:
+            bisect.insort(self.values, horizon)
+
+    def sync(self, horizons):
+        '''
+        新しい水平線の集合 (update_horizon の戻り値など) との差分だけを反映する
+        '''
+        horizons = set(horizons)
+        self.update(horizons - self.members, self.members - horizons)
+
+    def upper(self, curr_price, scope=9999999):
+        '''
+        curr_price < horizon < curr_price + scope の中で最も近い水平線（ない場合は -1）
+        '''
+        i = bisect.bisect_right(self.values, curr_price)
+        if (i < len(self.values)) and (self.values[i] < curr_price + scope):
+            return self.values[i]
+        return -1
+
+    def lower(self, curr_price, scope=9999999):
+        '''
+        curr_price - scope < horizon < curr_price の中で最も近い水平線（ない場合は -1）
+        '''
+        i = bisect.bisect_left(self.values, curr_price)
+        if (i > 0) and (self.values[i - 1] > curr_price - scope):
+            return self.values[i - 1]
+        return -1
+
+    def within(self, curr_price, scope):
+        '''
+        curr_price - scope < horizon < curr_price + scope の水平線のリスト（昇順）
+        '''
+        start = bisect.bisect_right(self.values, curr_price - scope)
+        end = bisect.bisect_left(self.values, curr_price + scope)
+        return self.values[start:end]
+
+    def closest(self, curr_price, scope=9999999, direction='both'):
+        '''
+        現在価格に最も近い水平線を取得する（ない場合は -1）
+        direction='both' で上下の距離が等しい場合は下の水平線を返す
+        '''
+        if direction == 'upper':
+            return self.upper(curr_price, scope)
+        elif direction == 'lower':
+            return self.lower(curr_price, scope)
+
+        i = bisect.bisect_left(self.values, curr_price)
+        candidates = []
+        if (i > 0) and (self.values[i - 1] > curr_price - scope):
+            candidates.append(self.values[i - 1])
+        if (i < len(self.values)) and (self.values[i] < curr_price + scope):
+            candidates.append(self.values[i])
+        if len(candidates) == 0:
+            return -1
+        return min(candidates, key=lambda horizon: abs(horizon - curr_price))
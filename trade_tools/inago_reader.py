@@ -0,0 +1,91 @@
+import logging
+
+logger = logging.getLogger('crypto')
+
+import pandas as pd
+import mysql.connector
+from mysql.connector import pooling
+
+from common.utils import str2timestamp
+from common.metrics import LatencyStats
+
+# idx_board_name_to_unix_time (sql/inago_index.sql) で範囲検索する
+QUERY = 'SELECT * FROM crypto.inago WHERE board_name = %s AND %s <= to_unix_time AND to_unix_time < %s ' \
+        'ORDER BY to_unix_time, id'
+BOARD_NAME = 'BitMEX_XBTUSD'
+
+
+def to_unix_time(dt):
+    '''
+    'YYYY-mm-dd HH:MM:SS' の文字列（または秒）をミリ秒の整数にする
+    '''
+    if isinstance(dt, str):
+        dt = str2timestamp(dt)
+    return int(round(dt * 1000))
+
+
+class InagoReader:
+    '''
+    inago テーブルを接続プールで読み込む
+    接続は使い回し、autocommit + READ COMMITTED でクエリごとに最新のコミット済みのデータを読むため、
+    inago_server が書き込んだデータを見るために毎回接続し直す必要はない
+    クエリは接続ごとに prepared statement にして、行はタプルのリストで返す（DataFrame を作らない）
+    to_datetime（秒単位）の代わりにインデックスのある to_unix_time（ミリ秒）で検索する
+    '''
+    def __init__(self, account, pool_size=2, pool_name='inago', board_name=BOARD_NAME):
+        self.board_name = board_name
+        # セッションの設定（分離レベル）を残すため、プールに返すときにセッションをリセットしない
+        self.pool = pooling.MySQLConnectionPool(pool_name=pool_name, pool_size=pool_size, pool_reset_session=False,
+                                                autocommit=True, **account)
+        # 接続 ID -> prepared statement のカーソル
+        self.cursors = {}
+        self.columns = None
+        self.latency = LatencyStats()
+        self.reconnects = 0
+
+    def _cursor(self, conn):
+        cursor = self.cursors.get(conn.connection_id)
+        if cursor is None:
+            setup = conn.cursor()
+            setup.execute('SET SESSION TRANSACTION ISOLATION LEVEL READ COMMITTED')
+            setup.close()
+            cursor = conn.cursor(prepared=True)
+            self.cursors[conn.connection_id] = cursor
+        return cursor
+
+    def fetch(self, start_time, end_time):
+        '''
+        to_datetime が start_time ~ end_time（文字列または秒）のイナゴを時刻の順に返す
+        戻り値: 行（タプル）のリスト。列名は columns
+        '''
+        # to_datetime は to_unix_time の秒未満を切り捨てたものなので、end_time の秒の終わりまでを含める
+        params = (self.board_name, to_unix_time(start_time), to_unix_time(end_time) + 1000)
+        with self.latency.timer():
+            conn = self.pool.get_connection()
+            try:
+                try:
+                    cursor = self._cursor(conn)
+                    cursor.execute(QUERY, params)
+                except mysql.connector.errors.OperationalError:
+                    # 切断されていたら接続し直して1回だけやり直す
+                    logger.debug('reconnect inago reader')
+                    self.cursors.pop(conn.connection_id, None)
+                    conn.reconnect()
+                    self.reconnects += 1
+                    cursor = self._cursor(conn)
+                    cursor.execute(QUERY, params)
+                rows = cursor.fetchall()
+                if self.columns is None:
+                    self.columns = list(cursor.column_names)
+            finally:
+                conn.close()
+        return rows
+
+    def fetch_frame(self, start_time, end_time):
+        rows = self.fetch(start_time, end_time)
+        return pd.DataFrame(rows, columns=self.columns)
+
+    def metrics(self):
+        metrics = self.latency.summary()
+        metrics['reconnects'] = self.reconnects
+        return metrics
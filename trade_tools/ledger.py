@@ -0,0 +1,84 @@
+TAKER_FEE = 0.00075
+MAKER_FEE = -0.00025
+
+
+class Ledger:
+    '''
+    シミュレータの約定を記録し、建玉・実現損益・手数料を約定ごとに O(1) で更新する
+    損益は main.py と同じく (価格差) x 数量 で計算し、建玉の価格は平均取得価格で持つ
+    手数料は約定代金 x 手数料率（BitMEX: テイカー 0.075%、メイカー -0.025% のリベート）。負の値は受け取り
+    '''
+    def __init__(self, taker_fee=TAKER_FEE, maker_fee=MAKER_FEE):
+        self.taker_fee = taker_fee
+        self.maker_fee = maker_fee
+        # 建玉（買いが正、売りが負）と平均取得価格
+        self.position = 0.0
+        self.avg_price = 0.0
+        self.realized_pnl = 0.0
+        self.fees = 0.0
+        self.volume = 0.0
+        self.trades = []
+
+    def fill(self, order_id, side, price, amount, liquidity, timestamp=None):
+        '''
+        約定を記録する
+        side: 'buy' or 'sell'、liquidity: 'maker' or 'taker'
+        戻り値: 約定の記録 (dict)
+        '''
+        signed = amount if side == 'buy' else -amount
+        fee = price * amount * (self.maker_fee if liquidity == 'maker' else self.taker_fee)
+
+        # 建玉と逆方向の約定は、建玉を減らした分だけ損益を確定させる
+        realized = 0.0
+        if self.position * signed < 0:
+            closed = min(abs(signed), abs(self.position))
+            direction = 1 if self.position > 0 else -1
+            realized = (price - self.avg_price) * closed * direction
+
+        position = self.position + signed
+        if position == 0:
+            self.avg_price = 0.0
+        elif self.position * position <= 0:
+            # 建玉がなかった、またはドテンした場合は約定価格が取得価格
+            self.avg_price = price
+        elif abs(position) > abs(self.position):
+            # 建玉を増やした場合は平均取得価格を更新
+            self.avg_price = (self.avg_price * abs(self.position) + price * amount) / abs(position)
+        self.position = position
+
+        self.realized_pnl += realized
+        self.fees += fee
+        self.volume += amount
+        trade = {
+            'timestamp': timestamp,
+            'order_id': order_id,
+            'side': side,
+            'price': price,
+            'amount': amount,
+            'liquidity': liquidity,
+            'fee': fee,
+            'realized_pnl': realized,
+            'position': self.position,
+        }
+        self.trades.append(trade)
+        return trade
+
+    def unrealized_pnl(self, price):
+        return (price - self.avg_price) * self.position
+
+    def summary(self, price=None):
+        '''
+        price: 含み損益を計算する価格（省略時は含み損益を含めない）
+        '''
+        summary = {
+            'trades': len(self.trades),
+            'volume': self.volume,
+            'position': self.position,
+            'avg_price': self.avg_price,
+            'realized_pnl': self.realized_pnl,
+            'fees': self.fees,
+            'net_pnl': self.realized_pnl - self.fees,
+        }
+        if price is not None:
+            summary['unrealized_pnl'] = self.unrealized_pnl(price)
+        return summary
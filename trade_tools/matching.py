@@ -0,0 +1,324 @@
+import heapq
+import bisect
+import numpy as np
+
+from common.snapshot_store import SIDE_BUY, SIDE_SELL
+
+# 並んでいる数量を消化する位置を一度に探す板の数
+QUEUE_CHUNK = 3600
+
+
+class MatchingEngine:
+    '''
+    シミュレータの指値を板のデータと突き合わせて約定させる
+    未約定の指値を買い・売りそれぞれ価格順に並べて持ち、ResourceManager の板の時刻を順に進めながら、
+    最良気配が注文価格に達した（買いなら最良売り気配 <= 注文価格）時点で約定させる
+    約定の判定は板の時刻ごとに行うため、注文状況を確認する間隔によらず同じ結果になる
+
+    queue_position=True の場合は、最良気配にいる指値も、発注時点で同じ価格に並んでいた数量
+    （板の数量の減少分で消化されたとみなす）がなくなった時点で約定させる
+    消化して約定する位置は発注時に先の板（QUEUE_CHUNK 個ずつ）をまとめて計算してヒープに入れ、
+    advance ではヒープから取り出すだけにする
+
+    use_executions=True の場合は板の代わりに ResourceManager の約定履歴で約定させる
+    買いの指値は注文価格以下の売りの約定の数量で（売りはその逆）、前に並んでいる数量
+    （queue_position=True なら発注時点の板の数量、False なら 0）を消化してから約定する（一部約定あり）
+    注文価格を超えた価格での約定があった場合は、その価格の注文はすべて約定したとみなして残りを約定させる
+    '''
+    def __init__(self, rm, queue_position=False, use_executions=False):
+        self.queue_position = queue_position
+        self.use_executions = use_executions
+        if use_executions:
+            if rm.execution_timestamps is None:
+                raise ValueError('ResourceManager has no executions')
+            self.execution_timestamps = rm.execution_timestamps
+            self.execution_sides = rm.execution_sides
+            self.execution_prices = rm.execution_prices
+            self.execution_amounts = rm.execution_amounts
+            # 次に処理する約定の位置
+            self.execution_cursor = 0
+        if np.array_equal(rm.bid_timestamps, rm.ask_timestamps):
+            self.timestamps = rm.bid_timestamps
+            self.bid_book = rm.bid_book
+            self.ask_book = rm.ask_book
+        else:
+            # 買い板・売り板の両方がある時刻だけを使う
+            self.timestamps, i, j = np.intersect1d(rm.bid_timestamps, rm.ask_timestamps,
+                                                   assume_unique=True, return_indices=True)
+            self.bid_book = rm.bid_book[i]
+            self.ask_book = rm.ask_book[j]
+        self.best_bids = self.bid_book[:, 0, 0]
+        self.best_asks = self.ask_book[:, 0, 0]
+        # 次に処理する板の位置
+        self.cursor = 0
+
+        # 価格順の指値。買いは価格の高い順 (-price)、売りは価格の低い順 (price) のキーでソートする
+        self.buy_keys = []
+        self.buy_orders = []
+        self.sell_keys = []
+        self.sell_orders = []
+        # 注文 ID -> 並んでいる数量の状態 (queue_position=True または use_executions=True の場合)
+        self.queues = {}
+        # 板で約定を判定する場合の、並んでいた数量を消化する位置のヒープ (位置, 登録順, 状態)
+        self.queue_heap = []
+        self.queue_counter = 0
+        # 注文 ID -> 未約定の数量
+        self.remaining = {}
+
+    def _index(self, timestamp):
+        # timestamp 以前で最新の板の位置
+        return int(np.searchsorted(self.timestamps, timestamp, side='right')) - 1
+
+    def add(self, order, timestamp):
+        '''
+        指値を登録する
+        発注時点の板ですでに約定する価格の場合は、その場で最良気配で約定させて (価格, 'taker') を返す
+        '''
+        if self.use_executions:
+            # 発注より前の約定は対象にしない
+            self.execution_cursor = max(self.execution_cursor, int(np.searchsorted(self.execution_timestamps,
+                                                                                   timestamp, side='right')))
+        i = self._index(timestamp)
+        if i >= 0:
+            if (order['side'] == 'buy') and (self.best_asks[i] <= order['price']):
+                return float(self.best_asks[i]), 'taker'
+            if (order['side'] == 'sell') and (self.best_bids[i] >= order['price']):
+                return float(self.best_bids[i]), 'taker'
+
+        if order['side'] == 'buy':
+            key = -order['price']
+            k = bisect.bisect_right(self.buy_keys, key)
+            self.buy_keys.insert(k, key)
+            self.buy_orders.insert(k, order)
+        else:
+            key = order['price']
+            k = bisect.bisect_right(self.sell_keys, key)
+            self.sell_keys.insert(k, key)
+            self.sell_orders.insert(k, order)
+
+        self.remaining[order['id']] = order['amount']
+        if self.queue_position or self.use_executions:
+            size = self._level_sizes(order, i, i + 1)[0] if (self.queue_position and (i >= 0)) else 0.0
+            state = {'ahead': size, 'consumed': 0.0, 'last_size': size}
+            self.queues[order['id']] = state
+            if self.queue_position and (not self.use_executions):
+                # 発注した板の次の板から調べる
+                state.update({'order': order, 'scanned': max(i + 1, self.cursor), 'hit': None})
+                self._scan_queue(state, state['scanned'] + QUEUE_CHUNK)
+        return None
+
+    def cancel(self, order):
+        if order['side'] == 'buy':
+            keys, orders = self.buy_keys, self.buy_orders
+        else:
+            keys, orders = self.sell_keys, self.sell_orders
+        for k in range(bisect.bisect_left(keys, -order['price'] if order['side'] == 'buy' else order['price']), len(keys)):
+            if orders[k]['id'] == order['id']:
+                del keys[k]
+                del orders[k]
+                break
+        self.queues.pop(order['id'], None)
+        self.remaining.pop(order['id'], None)
+
+    def _level_sizes(self, order, start, end):
+        # 注文と同じ側の板で、注文価格に並んでいる数量（その価格の段がなければ 0）
+        book = self.bid_book[start:end] if order['side'] == 'buy' else self.ask_book[start:end]
+        return np.where(book[:, :, 0] == order['price'], book[:, :, 1], 0.0).sum(axis=1)
+
+    def _crossed(self, order, start, end):
+        if order['side'] == 'buy':
+            return self.best_asks[start:end] <= order['price']
+        return self.best_bids[start:end] >= order['price']
+
+    def _scan_queue(self, state, until):
+        '''
+        並んでいた数量を消化して約定する位置を、見つかるか until の位置まで先の板を調べて求め、ヒープに入れる
+        見つからなかった場合は調べ終わった位置をヒープに入れ、そこに達したら続きを調べる
+        '''
+        order = state['order']
+        start = state['scanned']
+        end = min(max(until, start + QUEUE_CHUNK), len(self.timestamps))
+        if (state['hit'] is None) and (start < end):
+            sizes = self._level_sizes(order, start, end)
+            prev = np.concatenate([[state['last_size']], sizes[:-1]])
+            consumed = state['consumed'] + np.cumsum(np.maximum(prev - sizes, 0))
+            best = self.best_bids[start:end] if order['side'] == 'buy' else self.best_asks[start:end]
+            # 消化量は増える一方なので、並んでいた数量に達する位置から最良気配が注文価格になる位置を探す
+            depleted = int(np.searchsorted(consumed, state['ahead'], side='left'))
+            hits = np.flatnonzero(best[depleted:] == order['price'])
+            if len(hits) > 0:
+                state['hit'] = start + depleted + hits[0]
+            state['consumed'] = consumed[-1]
+            state['last_size'] = sizes[-1]
+            state['scanned'] = end
+        heapq.heappush(self.queue_heap, (self._queue_key(state), self.queue_counter, state))
+        self.queue_counter += 1
+
+    @staticmethod
+    def _queue_key(state):
+        return state['hit'] if state['hit'] is not None else state['scanned']
+
+    def _next_queue_hit(self, end):
+        '''
+        end より前で、並んでいた数量を消化して約定する最初の位置（なければ None）
+        '''
+        while len(self.queue_heap) > 0:
+            index, _, state = self.queue_heap[0]
+            if index >= end:
+                return None
+            # 約定・取り消し済みの指値と、調べ直して位置が変わった古い要素は捨てる
+            if (self.queues.get(state['order']['id']) is not state) or (index != self._queue_key(state)):
+                heapq.heappop(self.queue_heap)
+                continue
+            if state['hit'] is not None:
+                return index
+            heapq.heappop(self.queue_heap)
+            self._scan_queue(state, end)
+        return None
+
+    def _pop_queue_hits(self, k):
+        # 位置 k で並んでいた数量を消化した指値を取り出す
+        orders = []
+        while (self._next_queue_hit(k + 1) == k):
+            orders.append(heapq.heappop(self.queue_heap)[2]['order'])
+        return orders
+
+    def _next_cross(self, start, end):
+        # 最も高い買い指値・最も安い売り指値のどちらかに最良気配が達する最初の位置
+        crossed = np.zeros(end - start, dtype=bool)
+        if len(self.buy_orders) > 0:
+            crossed |= self.best_asks[start:end] <= -self.buy_keys[0]
+        if len(self.sell_orders) > 0:
+            crossed |= self.best_bids[start:end] >= self.sell_keys[0]
+        hits = np.flatnonzero(crossed)
+        return start + hits[0] if len(hits) > 0 else end
+
+    def advance(self, timestamp):
+        '''
+        timestamp までの板（use_executions=True なら約定履歴）を処理して約定した指値を返す
+        戻り値: [(注文, 約定価格, 約定数量, 'maker', 約定時刻), ...]（約定時刻の順）
+        '''
+        if self.use_executions:
+            return self._advance_executions(timestamp)
+        end = self._index(timestamp) + 1
+        fills = []
+        while (self.cursor < end) and ((len(self.buy_orders) > 0) or (len(self.sell_orders) > 0)):
+            k = self._next_cross(self.cursor, end)
+            if self.queue_position:
+                hit = self._next_queue_hit(k)
+                if hit is not None:
+                    k = hit
+            if k >= end:
+                break
+
+            timestamp_k = self.timestamps[k]
+            # 並んでいた数量を消化して約定する指値
+            queued = self._pop_queue_hits(k) if self.queue_position else []
+            # 価格が達した指値は価格順の先頭からまとめて約定させる
+            n = bisect.bisect_right(self.buy_keys, -self.best_asks[k]) if len(self.buy_orders) > 0 else 0
+            filled = self.buy_orders[:n]
+            del self.buy_keys[:n], self.buy_orders[:n]
+            n = bisect.bisect_right(self.sell_keys, self.best_bids[k]) if len(self.sell_orders) > 0 else 0
+            filled += self.sell_orders[:n]
+            del self.sell_keys[:n], self.sell_orders[:n]
+            for order in queued:
+                if order not in filled:
+                    self.cancel(order)
+                    filled.append(order)
+            for order in filled:
+                # 板で約定を判定する場合は一部約定はない
+                self.queues.pop(order['id'], None)
+                self.remaining.pop(order['id'], None)
+                fills.append((order, order['price'], order['amount'], 'maker', timestamp_k))
+            self.cursor = k + 1
+        self.cursor = max(self.cursor, end)
+        return fills
+
+    def _execution_fills(self, order, start, end):
+        '''
+        [start, end) の約定履歴でこの指値が約定する位置と数量、消化した前に並んでいた数量
+        戻り値: (約定の位置の配列, 約定数量の配列, 消化した数量)
+        '''
+        prices = self.execution_prices[start:end]
+        if order['side'] == 'buy':
+            hit = (self.execution_sides[start:end] == SIDE_SELL) & (prices <= order['price'])
+            through = hit & (prices < order['price'])
+        else:
+            hit = (self.execution_sides[start:end] == SIDE_BUY) & (prices >= order['price'])
+            through = hit & (prices > order['price'])
+        state = self.queues[order['id']]
+        ahead = state['ahead'] - state['consumed']
+        remaining = self.remaining[order['id']]
+
+        traded = np.cumsum(np.where(hit, self.execution_amounts[start:end], 0.0))
+        filled = np.clip(traded - ahead, 0, remaining)
+        hits = np.flatnonzero(through)
+        if len(hits) > 0:
+            filled[hits[0]:] = remaining
+        amounts = np.diff(filled, prepend=0.0)
+        idx = np.flatnonzero(amounts > 0)
+        consumed = min(traded[-1], ahead) if len(traded) > 0 else 0.0
+        if len(hits) > 0:
+            consumed = ahead
+        return start + idx, amounts[idx], consumed
+
+    def _advance_executions(self, timestamp):
+        start = self.execution_cursor
+        end = int(np.searchsorted(self.execution_timestamps, timestamp, side='right'))
+        if start >= end:
+            return []
+        sides = self.execution_sides[start:end]
+        prices = self.execution_prices[start:end]
+
+        # 約定した価格の範囲に届く指値だけを価格順の先頭から取り出して調べる
+        candidates = []
+        sells = sides == SIDE_SELL
+        if (len(self.buy_orders) > 0) and sells.any():
+            n = bisect.bisect_right(self.buy_keys, -prices[sells].min())
+            candidates += self.buy_orders[:n]
+        buys = sides == SIDE_BUY
+        if (len(self.sell_orders) > 0) and buys.any():
+            n = bisect.bisect_right(self.sell_keys, prices[buys].max())
+            candidates += self.sell_orders[:n]
+
+        fills = []
+        for order in candidates:
+            idx, amounts, consumed = self._execution_fills(order, start, end)
+            self.queues[order['id']]['consumed'] += consumed
+            for i, amount in zip(idx, amounts):
+                fills.append((order, order['price'], float(amount), 'maker', self.execution_timestamps[i]))
+            self.remaining[order['id']] -= amounts.sum()
+            if self.remaining[order['id']] <= 1e-9:
+                self.cancel(order)
+        self.execution_cursor = end
+        fills.sort(key=lambda fill: fill[4])
+        return fills
+
+    def next_fill_time(self, order, timestamp):
+        '''
+        未処理の板（use_executions=True なら約定履歴）から timestamp までの間に、この指値が全て約定する最初の時刻
+        （約定しなければ None）。状態は更新しない
+        '''
+        if self.use_executions:
+            end = int(np.searchsorted(self.execution_timestamps, timestamp, side='right'))
+            if self.execution_cursor >= end:
+                return None
+            idx, amounts, _ = self._execution_fills(order, self.execution_cursor, end)
+            if (len(idx) == 0) or (amounts.sum() < self.remaining[order['id']] - 1e-9):
+                return None
+            return self.execution_timestamps[idx[-1]]
+
+        end = self._index(timestamp) + 1
+        if self.cursor >= end:
+            return None
+        hits = np.flatnonzero(self._crossed(order, self.cursor, end))
+        k = self.cursor + hits[0] if len(hits) > 0 else None
+        if self.queue_position and (order['id'] in self.queues):
+            state = self.queues[order['id']]
+            # 調べていない板は end まで調べる（結果はヒープに入れて advance でも使う）
+            if (state['hit'] is None) and (state['scanned'] < end):
+                self._scan_queue(state, end)
+            hit = state['hit']
+            if (hit is not None) and (hit < end) and ((k is None) or (hit < k)):
+                k = hit
+        return None if k is None else self.timestamps[k]
@@ -1,9 +1,13 @@
+import numpy as np
 import pandas as pd
-import mysql.connector
 from datetime import datetime
 from abc import ABCMeta, abstractmethod
 
-from trade_tools.trade_utils import init_exchange, format_orderbook
+from common.ohlcv import ActiveOHLCV, CANDLE_MILLISECONDS
+from trade_tools.trade_utils import init_exchange
+from trade_tools.ledger import Ledger
+from trade_tools.matching import MatchingEngine
+from trade_tools.inago_reader import InagoReader
 
 class APIBase(metaclass=ABCMeta):
     def __init__(self, exchange_name):
@@ -33,10 +37,32 @@ class APIBase(metaclass=ABCMeta):
     def fetch_order(self, order_id, pair):
         pass
 
+    @abstractmethod
+    def fetch_open_orders(self, pair):
+        pass
+
     @abstractmethod
     def fetch_inago(self, account, start_time, end_time):
         pass
 
+    def fetch_inago_side(self, account, start_time, end_time):
+        '''
+        start_time ~ end_time の最新のイナゴの taker_side（なければ None）
+        '''
+        inago = self.fetch_inago(account, start_time, end_time)
+        if len(inago) == 0:
+            return None
+        return inago.iloc[-1].loc['taker_side']
+
+    def fetch_order_book_arrays(self, pair, limit=None):
+        '''
+        板を (段, 2) の配列 (price, amount) で返す
+        戻り値: bids, asks, timestamp
+        '''
+        orderbook = self.fetch_order_book(pair, limit)
+        return np.asarray(orderbook['bids'], dtype=np.float64).reshape(-1, 2), \
+               np.asarray(orderbook['asks'], dtype=np.float64).reshape(-1, 2), orderbook['timestamp']
+
     def private_get_position(self):
         return self.exchange.private_get_position()
 
@@ -49,9 +75,32 @@ class APIBase(metaclass=ABCMeta):
 class API(APIBase):
     def __init__(self, exchange_name):
         super(API, self).__init__(exchange_name)
+        self.inago_reader = None
+        # 取得した ticker の価格を1秒足として未確定足を作る（バックテストの ResourceManager と同じ計算）
+        self.active_ohlcv = ActiveOHLCV(list(CANDLE_MILLISECONDS))
 
     def fetch_ticker(self, pair):
-        return self.exchange.fetch_ticker(pair)
+        ticker = self.exchange.fetch_ticker(pair)
+        if ticker.get('close') is not None:
+            timestamp = ticker.get('timestamp') or datetime.now().timestamp() * 1000
+            # collect/format_data.py の1秒足と同じく open = high = low = close（出来高は ticker からはわからないので 0）
+            price = ticker['close']
+            self.active_ohlcv.fold_arrays([[price, price, price, price, 0, timestamp]])
+        return ticker
+
+    def fetch_current_price(self, pair, candle_type, since, limit=None):
+        '''
+        ticker を取得して未確定足を更新し、その終値を現在価格として返す
+        '''
+        if candle_type not in self.active_ohlcv.states:
+            return super(API, self).fetch_current_price(pair, candle_type, since, limit)
+        self.fetch_ticker(pair)
+        active = self.active_ohlcv.current(candle_type)
+        if active is None:
+            return super(API, self).fetch_current_price(pair, candle_type, since, limit)
+        open, high, low, close, volume = active
+        side = 'sell' if open - close >= 0 else 'buy'
+        return close, side
 
     def fetch_ohlcv(self, pair, candle_type, since=None, limit=None):
         return self.exchange.fetch_ohlcv(pair, candle_type, since, limit)
@@ -68,22 +117,38 @@ class API(APIBase):
     def fetch_order(self, order_id, pair):
         return self.exchange.fetch_order(order_id, pair)
 
+    def fetch_open_orders(self, pair):
+        return self.exchange.fetch_open_orders(pair)
+
+    def _inago_reader(self, account):
+        # 接続は最初の呼び出しで作り、以降は使い回す
+        if self.inago_reader is None:
+            self.inago_reader = InagoReader(account)
+        return self.inago_reader
+
     def fetch_inago(self, account, start_time, end_time):
-        conn = mysql.connector.connect(**account)
-        cur = conn.cursor(dictionary=True)
-        cur.execute('SELECT * FROM crypto.inago WHERE %s <= to_datetime AND to_datetime <= %s', [start_time, end_time])
-        df_inago = pd.DataFrame(cur.fetchall())
-        cur.close()
-        conn.close()
-        return df_inago
+        return self._inago_reader(account).fetch_frame(start_time, end_time)
+
+    def fetch_inago_side(self, account, start_time, end_time):
+        reader = self._inago_reader(account)
+        rows = reader.fetch(start_time, end_time)
+        if len(rows) == 0:
+            return None
+        return rows[-1][reader.columns.index('taker_side')]
 
 class APISim(APIBase):
-    def __init__(self, exchange_name, rm):
+    def __init__(self, exchange_name, rm, queue_position=False, use_executions=False):
         super(APISim, self).__init__(exchange_name)
         self.orders = {}
         self.counter = 0
-        self.profit = 0
+        self.ledger = Ledger()
         self.rm = rm
+        # 指値は板の時刻ごと（use_executions=True なら約定履歴）に約定を判定する（fetch_order を呼ぶ間隔によらない）
+        self.matching = MatchingEngine(rm, queue_position, use_executions)
+
+    @property
+    def profit(self):
+        return self.ledger.realized_pnl
 
     def fetch_ticker(self, pair):
         return self.rm.fetch_ticker()
@@ -94,7 +159,18 @@ class APISim(APIBase):
     def fetch_order_book(self, pair, limit=None):
         return self.rm.fetch_order_book()
 
+    def fetch_order_book_arrays(self, pair, limit=None):
+        return self.rm.fetch_order_book_arrays()
+
+    def sync_orders(self):
+        '''
+        現在時刻までに約定した指値を、約定した時刻で約定させる
+        '''
+        for order, fill_price, amount, liquidity, timestamp in self.matching.advance(self.rm.now_timestamp()):
+            self._fill(order, fill_price, liquidity, int(timestamp), amount)
+
     def create_order(self, pair, type, side, amount, price):
+        self.sync_orders()
         order = {
             'info': {'orderID': self.counter, 'symbol': pair, 'side': side, 'orderQty': amount, 'price': price, 'ordType': type},
             'id': self.counter,
@@ -103,50 +179,71 @@ class APISim(APIBase):
             'side': side,
             'price': price,
             'amount': amount,
+            'filled': 0,
+            'remaining': amount,
             'status': 'open',
         }
         self.orders[self.counter] = order
         self.counter += 1
+
+        # 成行注文はその時点の最良気配ですぐに約定させる
+        if type == 'market':
+            bids, asks, _ = self.fetch_order_book_arrays(pair)
+            fill_price = float(asks[0, 0]) if side == 'buy' else float(bids[0, 0])
+            self._fill(order, fill_price, 'taker', self.rm.now_timestamp())
+        else:
+            # 発注時点で板に達している指値はテイカーとして最良気配で約定させる
+            fill = self.matching.add(order, self.rm.now_timestamp())
+            if fill is not None:
+                self._fill(order, fill[0], fill[1], self.rm.now_timestamp())
         return order
 
+    def _fill(self, order, fill_price, liquidity, timestamp, amount=None):
+        '''
+        amount: 約定数量（省略時は未約定の数量すべて）
+        '''
+        if amount is None:
+            amount = order['remaining']
+        filled = order['filled'] + amount
+        order['average'] = (order.get('average', 0) * order['filled'] + fill_price * amount) / filled
+        order['filled'] = filled
+        order['remaining'] = order['amount'] - filled
+        if order['remaining'] <= 1e-9:
+            order['remaining'] = 0
+            order['status'] = 'closed'
+        order['lastTradeTimestamp'] = timestamp
+        self.ledger.fill(order['id'], order['side'], fill_price, amount, liquidity, timestamp)
+
     def cancel_order(self, order_id):
+        self.sync_orders()
         order = self.orders[order_id]
-        order['status'] = 'canceled'
+        # 約定済みの注文は取り消せない
+        if order['status'] == 'open':
+            order['status'] = 'canceled'
+            self.matching.cancel(order)
         return order
 
     def fetch_order(self, order_id, pair):
+        self.sync_orders()
+        return self.orders[order_id]
+
+    def fetch_open_orders(self, pair):
+        self.sync_orders()
+        return [order for order in self.orders.values() if (order['status'] == 'open') and (order['symbol'] == pair)]
+
+    def next_fill_time(self, order_id, until):
+        '''
+        現在時刻から until 秒までの間で指値が全て約定する最初の時刻（秒）。約定しなければ None
+        すでに約定している場合は現在時刻
+        '''
+        self.sync_orders()
         order = self.orders[order_id]
-
-        # 板が注文価格になったら status を closed に設定
-        orderbook = format_orderbook(self.fetch_order_book(pair))
-        if order['side'] == 'buy':
-            curr_price = float(orderbook.loc[orderbook['side'] == 'asks', 'price'].iloc[0])
-            if curr_price <= order['price']:
-                order['status'] = 'closed'
-        else:
-            curr_price = float(orderbook.loc[orderbook['side'] == 'bids', 'price'].iloc[0])
-            if curr_price >= order['price']:
-                order['status'] = 'closed'
-
-        # 利益を計算する
-        # if True:
         if order['status'] == 'closed':
-            df_orders = pd.DataFrame(list(self.orders.values())).sort_values('id')
-            df_orders = df_orders[df_orders['status'] == 'closed']
-
-            if len(df_orders) % 2 == 1:
-                df_orders = df_orders[:-1]
-
-            prev_price = -1
-            for i, row in df_orders.iterrows():
-                if i % 2 == 1:
-                    if row['side'] == 'buy':
-                        self.profit += prev_price - row['price']
-                    else:
-                        self.profit += row['price'] - prev_price
-                else:
-                    prev_price = row['price']
-        return order
+            return self.rm.tm.now
+        if order['status'] != 'open':
+            return None
+        timestamp = self.matching.next_fill_time(order, int(np.floor(until * 1000)))
+        return None if timestamp is None else timestamp / 1000
 
     def fetch_inago(self, account, start_time, end_time):
         return self.rm.fetch_inago(start_time, end_time)
@@ -0,0 +1,113 @@
+import numpy as np
+
+
+class ArrayOrderBook:
+    '''
+    板を NumPy 配列で保持し、複数の水平線について付近の板の集計をまとめて計算する
+    従来の format_orderbook と同じく、買い板（価格の高い順）のあとに売り板（価格の低い順）を並べた
+    1本の配列の位置で範囲を決める（price, amount が NaN の段は除く）
+    '''
+    def __init__(self, bids, asks):
+        bids = self._clean(bids)
+        asks = self._clean(asks)
+        bids = bids[np.argsort(-bids[:, 0], kind='mergesort')]
+        asks = asks[np.argsort(asks[:, 0], kind='mergesort')]
+        self.n_bids = len(bids)
+        self.prices = np.concatenate([bids[:, 0], asks[:, 0]])
+        self.amounts = np.concatenate([bids[:, 1], asks[:, 1]])
+        # 範囲内の合計を差で求めるための累積和
+        self.cum_amounts = np.concatenate([[0.0], np.cumsum(self.amounts)])
+        # 最も近い段の探索用に、それぞれ価格の低い順に並べた配列
+        self.bid_prices = bids[::-1, 0].copy()
+        self.ask_prices = asks[:, 0].copy()
+
+    @staticmethod
+    def _clean(levels):
+        levels = np.asarray(levels, dtype=np.float64).reshape(-1, 2)
+        return levels[~np.isnan(levels).any(axis=1)]
+
+    @classmethod
+    def from_orderbook(cls, orderbook):
+        '''
+        ccxt の fetch_order_book の戻り値 ({'bids': [[price, amount], ...], 'asks': ...}) から作成
+        '''
+        return cls(orderbook['bids'], orderbook['asks'])
+
+    def __len__(self):
+        return len(self.prices)
+
+    def nearest_level(self, horizons):
+        '''
+        各水平線に最も近い段の位置（距離が同じ場合は配列の前にある段）
+        '''
+        if len(self.prices) == 0:
+            raise ValueError('order book is empty')
+        horizons = np.atleast_1d(np.asarray(horizons, dtype=np.float64))
+        n_bids = self.n_bids
+        # 買い板: 価格の低い順の配列で前後の段を比べ、同じ距離なら価格の高い方（元の配列で前）を選ぶ
+        bid_pos, bid_dist = self._nearest(self.bid_prices, horizons, prefer_upper=True)
+        bid_pos = n_bids - 1 - bid_pos
+        # 売り板: 同じ距離なら価格の低い方を選ぶ
+        ask_pos, ask_dist = self._nearest(self.ask_prices, horizons, prefer_upper=False)
+        ask_pos = n_bids + ask_pos
+        return np.where(bid_dist <= ask_dist, bid_pos, ask_pos)
+
+    @staticmethod
+    def _nearest(sorted_prices, horizons, prefer_upper):
+        if len(sorted_prices) == 0:
+            return np.zeros(len(horizons), dtype=np.int64), np.full(len(horizons), np.inf)
+        j = np.searchsorted(sorted_prices, horizons)
+        upper = np.minimum(j, len(sorted_prices) - 1)
+        lower = np.maximum(j - 1, 0)
+        upper_dist = np.abs(sorted_prices[upper] - horizons)
+        lower_dist = np.abs(sorted_prices[lower] - horizons)
+        if prefer_upper:
+            use_upper = upper_dist <= lower_dist
+        else:
+            use_upper = upper_dist < lower_dist
+        return np.where(use_upper, upper, lower), np.where(use_upper, upper_dist, lower_dist)
+
+    def window(self, horizons, scope, direction='both'):
+        '''
+        各水平線に最も近い段から前後 scope 段の範囲 [start, end]（get_orderbook_around_horizon と同じ範囲）
+        '''
+        idx = self.nearest_level(horizons)
+        last = len(self.prices) - 1
+        if direction == 'both':
+            start = np.maximum(idx - scope, 0)
+            end = np.minimum(idx + scope, last)
+        elif direction == 'upper':
+            start = idx
+            end = np.minimum(idx + scope, last)
+        else:
+            start = np.maximum(idx - scope, 0)
+            end = idx
+        return start, end
+
+    def window_sum(self, horizons, scope, direction='both'):
+        '''
+        各水平線付近の板の注文数の合計
+        '''
+        start, end = self.window(horizons, scope, direction)
+        return self.cum_amounts[end + 1] - self.cum_amounts[start]
+
+    def order_prices(self, horizons, scope=3, threshold=10000, shift=0.5):
+        '''
+        各水平線の指値の価格をまとめて求める（注文しない水平線は -1）
+        付近の注文数が threshold を超えたら、範囲で最大の板の少し内側（買い板なら +shift、売り板なら -shift）を注文価格とする
+        '''
+        horizons = np.atleast_1d(np.asarray(horizons, dtype=np.float64))
+        if (len(horizons) == 0) or (len(self.prices) == 0):
+            return np.full(len(horizons), -1.0)
+        start, end = self.window(horizons, scope)
+        total = self.cum_amounts[end + 1] - self.cum_amounts[start]
+
+        # 範囲内で最大の板の位置（同じ値の場合は前の段）
+        positions = start[:, None] + np.arange(2 * scope + 1)
+        in_window = positions <= end[:, None]
+        positions = np.minimum(positions, len(self.prices) - 1)
+        amounts = np.where(in_window, self.amounts[positions], -np.inf)
+        max_pos = positions[np.arange(len(horizons)), np.argmax(amounts, axis=1)]
+
+        order_prices = np.where(max_pos < self.n_bids, self.prices[max_pos] + shift, self.prices[max_pos] - shift)
+        return np.where(total > threshold, order_prices, -1.0)
@@ -3,64 +3,272 @@ import logging
 logger = logging.getLogger('crypto')
 
 import sys
+import numpy as np
+import pandas as pd
 
 from common.utils import str2timestamp
+from common.ohlcv import ActiveOHLCV, CANDLE_MILLISECONDS, COLUMNS as BAR_COLUMNS
+from trade_tools.dataset import write_bundle, read_bundle
+
+OHLCV_COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+DEPTH = 25
+
+
+def sort_by_timestamp(df):
+    '''
+    timestamp 列で安定ソートする（すでにソート済みの場合はそのまま返す）
+    '''
+    if df['timestamp'].is_monotonic_increasing:
+        return df
+    return df.sort_values('timestamp', kind='mergesort')
+
+
+def timestamp_array(df):
+    return np.asarray(df['timestamp'].values).astype(np.int64)
+
+
+def book_tensor(book, depth=DEPTH):
+    '''
+    price00, amount00, ... の列を持つ板の DataFrame を (時刻, 段, [price, amount]) の連続した配列にする
+    '''
+    columns = []
+    for i in range(depth):
+        col_idx = '{0:02d}'.format(i)
+        columns += ['price' + col_idx, 'amount' + col_idx]
+    tensor = np.ascontiguousarray(book[columns].values, dtype=np.float64).reshape(len(book), depth, 2)
+    # 返したビューを書き換えられないようにする
+    tensor.flags.writeable = False
+    return tensor
+
+
+def find_timestamp(timestamps, timestamp):
+    '''
+    ソート済みの timestamps から timestamp と一致する最初の行番号を二分探索で求める（ない場合は -1）
+    '''
+    i = np.searchsorted(timestamps, timestamp, side='left')
+    if (i < len(timestamps)) and (timestamps[i] == timestamp):
+        return i
+    return -1
 
 
 class ResourceManager:
-    def __init__(self, ticker, ohlcv_list, bids, asks, inago, tm):
-        self.ticker = ticker
-        self.ohlcv_list = ohlcv_list
-        self.bids = bids
-        self.asks = asks
-        self.inago = inago
+    '''
+    バックテスト用のデータを保持し、TimeManager の現在時刻のデータを返す
+    各テーブルは timestamp でソートし、int64 のタイムスタンプ配列を事前に作って二分探索で引く
+    '''
+    def __init__(self, ticker, ohlcv_list, bids, asks, inago, tm, executions=None):
+        self.ticker = sort_by_timestamp(ticker)
+        self.ohlcv_list = {candle_type: sort_by_timestamp(ohlcv) for candle_type, ohlcv in ohlcv_list.items()}
+        self.bids = sort_by_timestamp(bids)
+        self.asks = sort_by_timestamp(asks)
+        self.inago = sort_by_timestamp(inago)
         self.tm = tm
 
+        self.ticker_timestamps = timestamp_array(self.ticker)
+        self.ticker_columns = list(self.ticker.columns)
+        self.ticker_values = self.ticker.values
+        self.ohlcv_timestamps = {}
+        self.ohlcv_values = {}
+        for candle_type, ohlcv in self.ohlcv_list.items():
+            self.ohlcv_timestamps[candle_type] = timestamp_array(ohlcv)
+            self.ohlcv_values[candle_type] = ohlcv[OHLCV_COLUMNS].values
+        self.bid_timestamps = timestamp_array(self.bids)
+        self.ask_timestamps = timestamp_array(self.asks)
+        self.bid_book = book_tensor(self.bids)
+        self.ask_book = book_tensor(self.asks)
+        self.inago_timestamps = timestamp_array(self.inago)
+        self.set_executions(executions)
+        self.init_active_ohlcv()
+
+    def init_active_ohlcv(self):
+        '''
+        ticker の1秒足から未確定足を作る ActiveOHLCV を用意する（ticker に open ~ volume の列がなければ使わない）
+        未確定足は時刻を進めた分の1秒足だけで更新する
+        '''
+        candle_types = [candle_type for candle_type in self.ohlcv_timestamps if candle_type in CANDLE_MILLISECONDS]
+        if (len(candle_types) == 0) or any(column not in self.ticker_columns for column in BAR_COLUMNS):
+            self.active_ohlcv = None
+            return
+        self.active_ohlcv = ActiveOHLCV(candle_types)
+        self.bar_columns = [self.ticker_columns.index(column) for column in BAR_COLUMNS]
+        self.close_column = self.ticker_columns.index('close')
+        self.active_longest = max(CANDLE_MILLISECONDS[candle_type] for candle_type in candle_types)
+        # 未確定足に反映済みの ticker の位置
+        self.active_cursor = 0
+
+    def set_executions(self, executions):
+        '''
+        約定履歴を設定する
+        executions: common.snapshot_store.read_executions のレコード配列（None なら約定履歴を使わない）
+        '''
+        if executions is None:
+            self.execution_timestamps = None
+            self.execution_sides = self.execution_prices = self.execution_amounts = None
+            return
+        order = np.argsort(executions['timestamp'], kind='mergesort')
+        self.execution_timestamps = np.ascontiguousarray(executions['timestamp'][order], dtype=np.int64)
+        self.execution_sides = np.ascontiguousarray(executions['side'][order], dtype=np.int8)
+        self.execution_prices = np.ascontiguousarray(executions['price'][order], dtype=np.float64)
+        self.execution_amounts = np.ascontiguousarray(executions['amount'][order], dtype=np.float64)
+
+    def to_bundle(self, path, meta=None):
+        '''
+        ソート・変換済みの配列を from_bundle で読み込めるファイルに保存する
+        meta: 一緒に保存する情報（元のファイルの更新時刻など）
+        '''
+        arrays = {
+            'ticker_timestamps': self.ticker_timestamps,
+            'ticker_values': np.asarray(self.ticker_values, dtype=np.float64),
+            'bid_timestamps': self.bid_timestamps,
+            'ask_timestamps': self.ask_timestamps,
+            'bid_book': self.bid_book,
+            'ask_book': self.ask_book,
+            'inago_timestamps': self.inago_timestamps,
+        }
+        for candle_type in self.ohlcv_timestamps:
+            arrays['ohlcv_timestamps.' + candle_type] = self.ohlcv_timestamps[candle_type]
+            arrays['ohlcv_values.' + candle_type] = np.asarray(self.ohlcv_values[candle_type], dtype=np.float64)
+        # 文字列の列は固定長の文字列にする。欠損値は 'nan' の文字列にせず空文字にして、位置を別の配列で持つ
+        for column in self.inago.columns:
+            values = self.inago[column].values
+            if values.dtype == object:
+                missing = pd.isnull(values)
+                arrays['inago.' + column] = np.where(missing, '', values).astype(str)
+                arrays['inago_missing.' + column] = missing
+            else:
+                arrays['inago.' + column] = values
+        if self.execution_timestamps is not None:
+            arrays['execution_timestamps'] = self.execution_timestamps
+            arrays['execution_sides'] = self.execution_sides
+            arrays['execution_prices'] = self.execution_prices
+            arrays['execution_amounts'] = self.execution_amounts
+        meta = dict(meta or {})
+        meta.update({
+            'ticker_columns': self.ticker_columns,
+            'candle_types': list(self.ohlcv_timestamps),
+            'inago_columns': list(self.inago.columns),
+        })
+        write_bundle(path, arrays, meta)
+
+    @classmethod
+    def from_bundle(cls, path, tm):
+        '''
+        to_bundle で保存したファイルから作成する（配列は memmap で参照するのでパースもコピーもしない）
+        ticker, ohlcv_list, bids, asks の DataFrame は持たない
+        '''
+        arrays, meta = read_bundle(path)
+        rm = cls.__new__(cls)
+        rm.tm = tm
+        rm.ticker = rm.bids = rm.asks = None
+        rm.ohlcv_list = None
+        rm.ticker_timestamps = arrays['ticker_timestamps']
+        rm.ticker_columns = meta['ticker_columns']
+        rm.ticker_values = arrays['ticker_values']
+        rm.ohlcv_timestamps = {candle_type: arrays['ohlcv_timestamps.' + candle_type] for candle_type in meta['candle_types']}
+        rm.ohlcv_values = {candle_type: arrays['ohlcv_values.' + candle_type] for candle_type in meta['candle_types']}
+        rm.bid_timestamps = arrays['bid_timestamps']
+        rm.ask_timestamps = arrays['ask_timestamps']
+        rm.bid_book = arrays['bid_book']
+        rm.ask_book = arrays['ask_book']
+        rm.inago_timestamps = arrays['inago_timestamps']
+        # イナゴは行数が少ないので DataFrame にする
+        inago = {}
+        for column in meta['inago_columns']:
+            values = arrays['inago.' + column]
+            missing = arrays.get('inago_missing.' + column)
+            if missing is not None:
+                values = values.astype(object)
+                values[missing] = np.nan
+            inago[column] = values
+        rm.inago = pd.DataFrame(inago, columns=meta['inago_columns'])
+        rm.execution_timestamps = arrays.get('execution_timestamps')
+        rm.execution_sides = arrays.get('execution_sides')
+        rm.execution_prices = arrays.get('execution_prices')
+        rm.execution_amounts = arrays.get('execution_amounts')
+        rm.init_active_ohlcv()
+        return rm
+
+    def now_timestamp(self):
+        return int(round(self.tm.now * 1000))
+
     def fetch_ticker(self):
-        now = self.tm.now * 1000
-        target = self.ticker[self.ticker.timestamp == now]
-        if len(target) == 0:
+        i = find_timestamp(self.ticker_timestamps, self.now_timestamp())
+        if i < 0:
             logger.debug('invalid target size in fetch_ticker')
             sys.exit()
-        return dict(target.iloc[0])
+        return dict(zip(self.ticker_columns, self.ticker_values[i]))
+
+    def active_candle(self, candle_type):
+        '''
+        現在時刻の未確定足 [unixtime(ms), open, high, low, close, volume]（作れない場合は None）
+        '''
+        if (self.active_ohlcv is None) or (candle_type not in self.active_ohlcv.states):
+            return None
+        now = self.now_timestamp()
+        end = int(self.ticker_timestamps.searchsorted(now, side='right'))
+        # 最も長い足の始まりより前の1秒足は、どの時間足でも確定した足のものなので反映しなくてよい
+        longest = self.active_longest
+        start = int(self.ticker_timestamps.searchsorted(now // longest * longest, side='left'))
+        if end < self.active_cursor:
+            # 時刻が戻った場合は作り直す
+            self.active_ohlcv = ActiveOHLCV(self.active_ohlcv.candle_types)
+            self.active_cursor = 0
+        start = max(start, self.active_cursor)
+        if start < end:
+            self.active_ohlcv.fold_arrays(np.asarray(self.ticker_values[start:end])[:, self.bar_columns])
+        self.active_cursor = max(self.active_cursor, end)
+        candle = self.active_ohlcv.candle(candle_type)
+        # 現在時刻の足の1秒足がまだない場合
+        if (candle is None) or (candle[0] <= now - CANDLE_MILLISECONDS[candle_type]):
+            return None
+        return candle
 
     def fetch_ohlcv(self, candle_type, since, limit=None):
-        ohlcv = self.ohlcv_list[candle_type]
-        target = ohlcv[ohlcv.timestamp > since].ix[:, ['timestamp', 'open', 'high', 'low', 'close', 'volume']]
-        if len(target) == 0:
+        '''
+        取引所と同じく、確定した足と最後に現在時刻の未確定足を返す
+        未確定足は ticker の1秒足から ActiveOHLCV で作る（作れない場合は現在時刻に始まった足までをそのまま返す）
+        '''
+        timestamps = self.ohlcv_timestamps[candle_type]
+        now = self.now_timestamp()
+        active = self.active_candle(candle_type)
+        # 配列と同じ int64 で探索する（float で探索すると配列全体が変換される）
+        start = 0 if since is None else np.searchsorted(timestamps, int(np.floor(since)), side='right')
+        if active is None:
+            end = np.searchsorted(timestamps, now, side='right')
+        else:
+            # 現在時刻までに終わった足
+            end = np.searchsorted(timestamps, now - CANDLE_MILLISECONDS[candle_type], side='right')
+        ohlcv = self.ohlcv_values[candle_type][start:max(start, end)].tolist()
+        if (active is not None) and ((since is None) or (active[0] > since)):
+            ohlcv.append(active)
+        if limit is not None:
+            ohlcv = ohlcv[:limit]
+        if len(ohlcv) == 0:
             logger.debug('invalid target size in fetch_ohlcv')
             sys.exit()
+        return ohlcv
 
-        if limit is not None:
-            if len(target) > limit:
-                target = target.iloc[:limit]
-        return target.values.tolist()
+    def fetch_order_book_arrays(self):
+        '''
+        現在時刻の板を (25, 2) の配列 (price, amount) で返す（コピーせずにビューを返す）
+        戻り値: bids, asks, timestamp
+        '''
+        now = self.now_timestamp()
+        i = find_timestamp(self.bid_timestamps, now)
+        j = find_timestamp(self.ask_timestamps, now)
+        if (i < 0) or (j < 0):
+            logger.debug('invalid target size in fetch_order_book')
+            sys.exit()
+        return self.bid_book[i], self.ask_book[j], self.bid_timestamps[i]
 
     def fetch_order_book(self):
         # limitは実装が面倒なので引数に取らない
-
-        def format_order_book(bids, asks):
-            formatted_bids = []
-            formatted_asks = []
-            for i in range(25):
-                col_idx = '{0:02d}'.format(i)
-                bid_price = bids.loc['price' + col_idx]
-                bid_amount = bids.loc['amount' + col_idx]
-                ask_price = asks.loc['price' + col_idx]
-                ask_amount = asks.loc['amount' + col_idx]
-                formatted_bids.append([bid_price, bid_amount])
-                formatted_asks.append([ask_price, ask_amount])
-            return {'bids': formatted_bids, 'asks': formatted_asks, 'timestamp': bids.timestamp}
-
-        now = self.tm.now * 1000
-        bids = self.bids[self.bids.timestamp == now]
-        asks = self.asks[self.asks.timestamp == now]
-        if (len(bids) == 0) or (len(asks) == 0):
-            logger.debug('invalid target size in fetch_order_book')
-            sys.exit()
-        return format_order_book(bids.iloc[0], asks.iloc[0])
+        bids, asks, timestamp = self.fetch_order_book_arrays()
+        return {'bids': bids, 'asks': asks, 'timestamp': timestamp}
 
     def fetch_inago(self, start_time, end_time):
         start_time = str2timestamp(start_time) * 1000
         end_time = str2timestamp(end_time) * 1000
-        return self.inago[(start_time <= self.inago.timestamp) & (self.inago.timestamp <= end_time)]
\ No newline at end of file
+        start = np.searchsorted(self.inago_timestamps, int(np.ceil(start_time)), side='left')
+        end = np.searchsorted(self.inago_timestamps, int(np.floor(end_time)), side='right')
+        return self.inago.iloc[start:end]
@@ -1,10 +1,11 @@
 import ccxt
 import numpy as np
 from collections import ChainMap
-import copy
 import configparser
 import pandas as pd
 
+from trade_tools.orderbook import ArrayOrderBook
+
 inifile = configparser.ConfigParser()
 inifile.read('config.ini', 'UTF-8')
 api_key = inifile.get('config', 'api_key')
@@ -22,12 +23,83 @@ def init_exchange(exchange):
     else:
         return
 
-def format_orderbook(orderbook):
-    bids = pd.DataFrame(orderbook['bids'], columns=['price', 'order_num'])
-    asks = pd.DataFrame(orderbook['asks'], columns=['price', 'order_num'])
-    orderbook = pd.concat([bids, asks]).reset_index(drop=True)
-    orderbook['side'] = ['bids'] * len(bids) + ['asks'] * len(asks)
-    return orderbook
+def init_async_exchange(exchange, session=None):
+    '''
+    init_exchange の ccxt.async_support 版
+    session: 共有する aiohttp.ClientSession（省略時は取引所ごとに作る）
+    '''
+    # aiohttp などの非同期のモジュールは同期の利用者（収集、バックテストなど）では読み込まない
+    import ccxt.async_support
+    params = {
+        'apiKey': api_key,
+        'secret': api_secret
+    }
+    if session is not None:
+        params['session'] = session
+    if exchange == 'bitmex':
+        return ccxt.async_support.bitmex(params)
+    elif exchange == 'bitfinex':
+        return ccxt.async_support.bitfinex(params)
+    else:
+        return
+
+def find_horizon_candidates(high, low, labels, threshold_whisker_diff):
+    '''
+    ２本のローソク足の高値・安値の組み合わせのうち、差が threshold_whisker_diff 以下の組から水平線の候補を求める
+    高値と安値を1つの配列にまとめてソートし、各値から threshold_whisker_diff 以内にある値だけを二分探索で列挙する
+
+    high, low: ローソク足ごとの高値、安値の配列
+    labels: ローソク足の時間（同じ時間のローソク足同士は組にしない）
+    horizons: key -> 水平線の値、value -> 根拠となるローソク足の時間のリスト（重複なし）
+    '''
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    n = len(high)
+    labels = pd.Index(labels)
+    # 同じ時間のローソク足を同じ番号にする
+    codes = pd.factorize(labels)[0]
+
+    # 高値 (kind=0) と安値 (kind=1) をまとめてソート
+    values = np.concatenate([high, low])
+    owners = np.concatenate([np.arange(n), np.arange(n)])
+    kinds = np.concatenate([np.zeros(n, dtype=np.int64), np.ones(n, dtype=np.int64)])
+    valid = ~np.isnan(values)
+    values, owners, kinds = values[valid], owners[valid], kinds[valid]
+    order = np.argsort(values, kind='mergesort')
+    values, owners, kinds = values[order], owners[order], kinds[order]
+
+    # 各値から threshold_whisker_diff 以内の値の範囲（丸め誤差の分だけ広めに取り、後で厳密に判定する）
+    bound = values + threshold_whisker_diff
+    bound = bound + np.abs(bound) * 1e-12 + 1e-12
+    ends = np.searchsorted(values, bound, side='right')
+    counts = np.maximum(ends - np.arange(len(values)) - 1, 0)
+    total = counts.sum()
+    if total == 0:
+        return {}
+    i = np.repeat(np.arange(len(values)), counts)
+    j = i + 1 + np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    matched = (codes[owners[i]] != codes[owners[j]]) & (np.abs(values[i] - values[j]) <= threshold_whisker_diff)
+    i, j = i[matched], j[matched]
+    if len(i) == 0:
+        return {}
+    horizon_values = (values[i] + values[j]) / 2
+
+    # 従来の二重ループ (ohlcv1, ohlcv2, 高値と高値 -> 高値と安値 -> 安値と安値 -> 安値と高値) で
+    # 最初に見つかる順に水平線を並べる
+    pair_order = np.array([0, 1, 3, 2])
+    a, b = owners[i], owners[j]
+    key_ab = (a * n + b) * 4 + pair_order[kinds[i] * 2 + kinds[j]]
+    key_ba = (b * n + a) * 4 + pair_order[kinds[j] * 2 + kinds[i]]
+    first_key = pd.Series(np.minimum(key_ab, key_ba)).groupby(horizon_values).min()
+    horizon_order = first_key.sort_values(kind='mergesort').index.values
+
+    # 水平線ごとに根拠となるローソク足の時間をまとめる
+    dts = pd.Series(np.concatenate([a, b])).groupby(np.concatenate([horizon_values, horizon_values])).unique()
+    dts = dict(zip(dts.index, dts.values))
+    horizons = {}
+    for horizon in horizon_order:
+        horizons[horizon] = list(set(labels[dts[horizon]]))
+    return horizons
 
 def calc_horizon(df, min_whisker_len, threshold_whisker_diff):
     '''
@@ -42,79 +114,69 @@ def calc_horizon(df, min_whisker_len, threshold_whisker_diff):
     whisker_len = np.where(df['open'] >= df['close'], df['high'] - df['open'], df['high'] - df['close'])
     df_long_whisker = df.loc[(whisker_len >= min_whisker_len)]
 
-    # 高値が近いローソク足の高値の平均値を求める
-    horizons = {}
-    for dt1, ohlcv1 in df_long_whisker.iterrows():
-        for dt2, ohlcv2 in df_long_whisker.iterrows():
-            if dt1 == dt2:
-                continue
-
-            if (float(np.abs(ohlcv1['high'] - ohlcv2['high'])) <= threshold_whisker_diff):  # 高値と高値
-                horizon = np.mean([ohlcv1['high'], ohlcv2['high']])
-                if horizon in horizons.keys():
-                    horizons[horizon].append(dt1)
-                    horizons[horizon].append(dt2)
-                else:
-                    horizons[horizon] = [dt1, dt2]
-            if (float(np.abs(ohlcv1['high'] - ohlcv2['low'])) <= threshold_whisker_diff):  # 高値と低値
-                horizon = np.mean([ohlcv1['high'], ohlcv2['low']])
-                if horizon in horizons.keys():
-                    horizons[horizon].append(dt1)
-                    horizons[horizon].append(dt2)
-                else:
-                    horizons[horizon] = [dt1, dt2]
-            if (float(np.abs(ohlcv1['low'] - ohlcv2['low'])) <= threshold_whisker_diff):  # 低値と低値
-                horizon = np.mean([ohlcv1['low'], ohlcv2['low']])
-                if horizon in horizons.keys():
-                    horizons[horizon].append(dt1)
-                    horizons[horizon].append(dt2)
-                else:
-                    horizons[horizon] = [dt1, dt2]
-            if (float(np.abs(ohlcv1['low'] - ohlcv2['high'])) <= threshold_whisker_diff):  # 低値と高値
-                horizon = np.mean([ohlcv1['low'], ohlcv2['high']])
-                if horizon in horizons.keys():
-                    horizons[horizon].append(dt1)
-                    horizons[horizon].append(dt2)
-                else:
-                    horizons[horizon] = [dt1, dt2]
-
-    # 重複を削除
-    horizons_c = copy.copy(horizons)
-    for h, dts in horizons_c.items():
-        horizons[h] = list(set(dts))
+    # 高値・安値が近いローソク足の組から水平線を求める
+    horizons = find_horizon_candidates(df_long_whisker['high'].values, df_long_whisker['low'].values,
+                                       df_long_whisker.index, threshold_whisker_diff)
+
+    if len(horizons) == 0:
+        return horizons
+
     # 支点の右側で他のローソク足と重畳しないか確認
-    unuses = []
-    curr_price = df.ix[-1, 'close']
-    for horizon, dts in horizons.items():
-        target = df[df.index > min(dts)]
-        crossed_ohlcv = target.loc[(target['high'] > horizon) & (target['low'] < horizon)]
-        if len(crossed_ohlcv) > 0:
-            unuses.append(horizon)
-        # 現在価格に近いラインは削除
-        elif np.abs(horizon - curr_price) <= 1:
-            unuses.append(horizon)
-
-    for unuse in unuses:
-        horizons.pop(unuse)
+    # 各水平線をまたいだ最後のローソク足が支点より右にあれば使わない
+    horizon_values = np.array(list(horizons.keys()))
+    first_after_pivot = df.index.searchsorted([min(dts) for dts in horizons.values()], side='right')
+    last_cross = calc_last_cross(horizon_values, df['high'].values, df['low'].values)
+    unuses = last_cross >= first_after_pivot
+    # 現在価格に近いラインは削除
+    curr_price = df['close'].iloc[-1]
+    unuses |= np.abs(horizon_values - curr_price) <= 1
+
+    for horizon, unuse in zip(horizon_values, unuses):
+        if unuse:
+            horizons.pop(horizon)
     return horizons
 
-def get_orderbook_around_horizon(orderbook, horizon, scope, direction='both'):
-    '''
-    ラインの近くの板を取得する
+def calc_last_cross(horizon_values, high, low, last_cross=None, offset=0):
     '''
+    各水平線について、水平線をまたいだ (low < horizon < high) 最後のローソク足の番号を求める（ない場合は -1）
+    水平線をソートしておき、各ローソク足の (low, high) に入る水平線の位置を展開して、位置ごとに最大の番号を求める
 
-    idx_orderbook = (orderbook['price'] - horizon).abs().idxmin()
-    if direction == 'both':
-        idx_start = idx_orderbook - scope if idx_orderbook - scope >= 0 else 0
-        idx_end = idx_orderbook + scope if idx_orderbook + scope <= len(orderbook) else len(orderbook) - 1
-    elif direction == 'upper':
-        idx_start = idx_orderbook
-        idx_end = idx_orderbook + scope if idx_orderbook + scope <= len(orderbook) else len(orderbook) - 1
+    horizon_values: 水平線の値の配列
+    high, low: ローソク足の高値、安値の配列
+    last_cross: 前回の結果（追加されたローソク足だけを渡して続きから計算する場合）
+    offset: high, low の先頭のローソク足の番号
+    '''
+    horizon_values = np.asarray(horizon_values, dtype=np.float64)
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    order = np.argsort(horizon_values, kind='mergesort')
+    sorted_values = horizon_values[order]
+    if last_cross is None:
+        sorted_last_cross = np.full(len(horizon_values), -1, dtype=np.int64)
     else:
-        idx_start = idx_orderbook - scope if idx_orderbook - scope >= 0 else 0
-        idx_end = idx_orderbook
-    near_orderbook = orderbook.iloc[idx_start:idx_end + 1]
-    return near_orderbook
+        sorted_last_cross = np.asarray(last_cross, dtype=np.int64)[order]
+
+    starts = np.searchsorted(sorted_values, low, side='right')
+    ends = np.searchsorted(sorted_values, high, side='left')
+    ends = np.where(np.isnan(high) | np.isnan(low), starts, ends)
+    counts = np.maximum(ends - starts, 0)
+    total = counts.sum()
+    if total > 0:
+        # ローソク足の番号と、またいだ水平線の位置の組
+        candles = np.repeat(np.arange(len(counts)), counts)
+        positions = np.repeat(starts, counts) + np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        np.maximum.at(sorted_last_cross, positions, offset + candles)
+
+    result = np.empty_like(sorted_last_cross)
+    result[order] = sorted_last_cross
+    return result
+
+def crossed_by_candle(horizon_values, high, low):
+    '''
+    新しいローソク足1本が各水平線をまたいだか (low < horizon < high)
+    '''
+    horizon_values = np.asarray(horizon_values, dtype=np.float64)
+    return (low < horizon_values) & (horizon_values < high)
 
 def get_horizon_closest_to_price(horizons, curr_price, scope=9999999, direction='both'):
     '''
@@ -151,10 +213,9 @@ def exist_limit_orders_around_horizon(pair, horizon, exchange_name, scope):
     exchange = init_exchange(exchange_name)
 
     # 板を取得
-    orderbook = format_orderbook(exchange.fetch_order_book(pair, limit=1000))
-    near_orderbook = get_orderbook_around_horizon(orderbook, horizon, scope)
-    # 求めた範囲内の注文数を計算
-    total_order_num = near_orderbook.sum()['order_num']
+    orderbook = ArrayOrderBook.from_orderbook(exchange.fetch_order_book(pair, limit=1000))
+    # ライン付近の注文数を計算
+    total_order_num = orderbook.window_sum(horizon, scope)[0]
 
     # 注文数が閾値を下回ったら指値を外す
     threshold = 1